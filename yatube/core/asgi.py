@@ -0,0 +1,179 @@
+"""ASGI-приложение поверх обработчика запросов Django.
+
+Django 2.2 не умеет асинхронных запросов и представлений, а asgiref
+(и его WsgiToAsgi) появляется в зависимостях только с Django 3.0,
+поэтому мост свой. Цикл событий только принимает тело запроса
+и отдаёт ответ, а сам запрос - middleware, представление, шаблон -
+выполняется WSGIHandler в ограниченном пуле из settings.ASGI_THREADS
+потоков. Медленный клиент не занимает поток ни при отправке тела,
+ни при приёме обычного ответа; потоковый ответ (StreamingHttpResponse)
+отдаётся из потока пула, и поток ждёт клиента.
+
+Это не ускорение: представления синхронные, каждый запрос всё равно
+занимает поток, а переходы между циклом и пулом добавляют задержку -
+run_benchmark --asgi показывает меньше запросов в секунду, чем WSGI.
+ASGI включается явно (yatube/asgi.py) ради серверов, которые говорят
+только на ASGI; по умолчанию сайт работает через WSGI. После перехода
+на Django 3+ модуль заменяется на django.core.asgi.
+"""
+import asyncio
+import io
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import django
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+
+
+def wsgi_environ(scope, body):
+    """WSGI-окружение запроса по ASGI scope и файлу с телом."""
+    script_name = scope.get('root_path', '')
+    path = scope['path']
+    if script_name and path.startswith(script_name):
+        path = path[len(script_name):]
+    server = scope.get('server') or ('localhost', 80)
+    # Длина - по фактически полученному телу: у запроса с chunked
+    # заголовка content-length нет.
+    length = body.seek(0, io.SEEK_END)
+    body.seek(0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        # Как у WSGI-серверов: байты UTF-8 в строке latin-1.
+        'SCRIPT_NAME': script_name.encode().decode('latin-1'),
+        'PATH_INFO': path.encode().decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': str(server[0]),
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f'HTTP/{scope.get("http_version", "1.1")}',
+        'CONTENT_LENGTH': str(length),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+        environ['REMOTE_PORT'] = str(scope['client'][1])
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1')
+        if name == 'content-length':
+            continue
+        if name == 'content-type':
+            key = 'CONTENT_TYPE'
+        else:
+            key = 'HTTP_' + name.upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if key in environ:
+            value = f'{environ[key]},{value}'
+        environ[key] = value
+    return environ
+
+
+class ASGIHandler:
+    """ASGI-приложение (протокол ASGI 3) для HTTP и lifespan."""
+
+    def __init__(self):
+        self.wsgi = WSGIHandler()
+        self.executor = ThreadPoolExecutor(
+            max_workers=settings.ASGI_THREADS, thread_name_prefix='asgi')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            raise ValueError(f'Соединения {scope["type"]} не поддерживаются.')
+        body = await self.read_body(receive)
+        if body is None:
+            return
+        loop = asyncio.get_running_loop()
+        try:
+            start, content = await loop.run_in_executor(
+                self.executor, self.run, loop, scope, body, send)
+        finally:
+            body.close()
+        if start is not None:
+            await send(start)
+            await send({'type': 'http.response.body', 'body': content})
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await asyncio.get_running_loop().run_in_executor(
+                    None, self.executor.shutdown)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def read_body(self, receive):
+        """Тело запроса в файле, или None, если клиент отключился.
+
+        Большое тело, как загрузка картинки, уходит на диск.
+        """
+        body = tempfile.SpooledTemporaryFile(
+            max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE, mode='w+b')
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                body.close()
+                return None
+            body.write(message.get('body', b''))
+            if not message.get('more_body'):
+                return body
+
+    def run(self, loop, scope, body, send):
+        """Обрабатывает запрос в потоке пула.
+
+        Обычный ответ возвращается парой (начало ответа, тело), и цикл
+        отдаёт его сам, не занимая поток. Потоковый ответ поток отдаёт
+        частями, дожидаясь отправки каждой, и возвращает (None, None).
+        """
+        def deliver(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        start = {}
+
+        def start_response(status, headers, exc_info=None):
+            start.update(
+                type='http.response.start',
+                status=int(status.split(' ', 1)[0]),
+                headers=[
+                    (name.lower().encode('latin-1'),
+                     value.encode('latin-1'))
+                    for name, value in headers
+                ])
+
+        response = self.wsgi(wsgi_environ(scope, body), start_response)
+        if not getattr(response, 'streaming', False):
+            try:
+                return start, b''.join(response)
+            finally:
+                # Сигнал request_finished закрывает соединения с базой
+                # в том потоке, где они открыты.
+                response.close()
+        try:
+            deliver(start)
+            for chunk in response:
+                if chunk:
+                    deliver({
+                        'type': 'http.response.body',
+                        'body': chunk,
+                        'more_body': True,
+                    })
+            deliver({'type': 'http.response.body'})
+        finally:
+            response.close()
+        return None, None
+
+
+def get_asgi_application():
+    """То же, что get_wsgi_application, но для ASGI-серверов."""
+    django.setup(set_prefix=False)
+    return ASGIHandler()
@@ -0,0 +1,202 @@
+"""Двухуровневый кеш: локальный LRU процесса перед общим хранилищем."""
+import os
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.core.cache import caches
+from django.core.cache.backends import filebased
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+from .metrics import record_cache
+
+# Состояние L1 общее для всех потоков процесса, как у LocMemCache.
+_layers = {}
+_layers_lock = threading.Lock()
+
+
+class _Layer:
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {
+            'l1_hits': 0, 'l1_misses': 0, 'l2_hits': 0, 'l2_misses': 0,
+        }
+
+
+class TwoTierCache(BaseCache):
+    """Кеш из двух уровней.
+
+    L1 - небольшой LRU в памяти процесса, L2 - общий для всех воркеров
+    кеш, указанный в LOCATION как алиас из settings.CACHES. В L2 вместе
+    со значением хранятся момент его истечения и метка записи, поэтому
+    запись в L1 живёт не дольше записи в L2. Метка каждого ключа лежит
+    в L2 ещё и отдельно, под маленьким ключом: запись L1 старше
+    SYNC_INTERVAL секунд (0 - на каждом чтении) сверяет с ней свою
+    метку и сбрасывается, только если этот ключ перезаписали или
+    удалили. Запись одного ключа не трогает остальной L1.
+
+    add атомарен настолько, насколько атомарен add общего кеша.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._shared_alias = location
+        self._sync_interval = options.get('SYNC_INTERVAL', 0)
+        with _layers_lock:
+            self._layer = _layers.setdefault(location, _Layer())
+
+    @property
+    def _shared(self):
+        return caches[self._shared_alias]
+
+    @property
+    def stats(self):
+        return dict(self._layer.stats)
+
+    @staticmethod
+    def _stamp_key(key):
+        return f'{key}:stamp'
+
+    def _fresh(self, key, full_key, version, entry):
+        """Можно ли отдать запись L1: не истекла и не перезаписана."""
+        expires, stamp, value, checked_at = entry
+        if expires is not None and expires <= time.time():
+            return False
+        now = time.monotonic()
+        if now - checked_at < self._sync_interval:
+            return True
+        if self._shared.get(self._stamp_key(key), version=version) != stamp:
+            return False
+        with self._layer.lock:
+            if full_key in self._layer.entries:
+                self._layer.entries[full_key] = (expires, stamp, value, now)
+        return True
+
+    def _remember(self, key, expires, stamp, value):
+        layer = self._layer
+        with layer.lock:
+            layer.entries[key] = (expires, stamp, value, time.monotonic())
+            layer.entries.move_to_end(key)
+            while len(layer.entries) > self._max_entries:
+                layer.entries.popitem(last=False)
+
+    def _forget(self, key):
+        with self._layer.lock:
+            self._layer.entries.pop(key, None)
+
+    def _lookup(self, key, version):
+        """Возвращает пару (найдено, значение) с учётом обоих уровней."""
+        full_key = self.make_key(key, version=version)
+        self.validate_key(full_key)
+        layer = self._layer
+        with layer.lock:
+            entry = layer.entries.get(full_key)
+        if entry is not None and self._fresh(key, full_key, version, entry):
+            with layer.lock:
+                if full_key in layer.entries:
+                    layer.entries.move_to_end(full_key)
+                layer.stats['l1_hits'] += 1
+            record_cache(True)
+            return True, entry[2]
+        with layer.lock:
+            if entry is not None:
+                layer.entries.pop(full_key, None)
+            layer.stats['l1_misses'] += 1
+        entry = self._shared.get(key, version=version)
+        expired = entry is not None and entry[0] is not None and (
+            entry[0] <= time.time())
+        if entry is None or expired:
+            layer.stats['l2_misses'] += 1
+            record_cache(False)
+            return False, None
+        layer.stats['l2_hits'] += 1
+        record_cache(True)
+        self._remember(full_key, *entry)
+        return True, entry[2]
+
+    def get(self, key, default=None, version=None):
+        found, value = self._lookup(key, version)
+        return value if found else default
+
+    def has_key(self, key, version=None):
+        return self._lookup(key, version)[0]
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        full_key = self.make_key(key, version=version)
+        self.validate_key(full_key)
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        expires = self.get_backend_timeout(timeout)
+        stamp = uuid.uuid4().hex
+        # Значение раньше метки: по новой метке читатель уже найдёт
+        # новое значение.
+        self._shared.set_many({
+            key: (expires, stamp, value),
+            self._stamp_key(key): stamp,
+        }, timeout, version=version)
+        self._remember(full_key, expires, stamp, value)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        full_key = self.make_key(key, version=version)
+        self.validate_key(full_key)
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        expires = self.get_backend_timeout(timeout)
+        stamp = uuid.uuid4().hex
+        added = self._shared.add(
+            key, (expires, stamp, value), timeout, version=version)
+        if added:
+            self._shared.set(
+                self._stamp_key(key), stamp, timeout, version=version)
+            self._remember(full_key, expires, stamp, value)
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        found, value = self._lookup(key, version)
+        if not found:
+            return False
+        self.set(key, value, timeout, version=version)
+        return True
+
+    def delete(self, key, version=None):
+        full_key = self.make_key(key, version=version)
+        self.validate_key(full_key)
+        self._shared.delete_many(
+            [key, self._stamp_key(key)], version=version)
+        self._forget(full_key)
+
+    def clear(self):
+        self._shared.clear()
+        with self._layer.lock:
+            self._layer.entries.clear()
+
+
+class FileBasedCache(filebased.FileBasedCache):
+    """Файловый кеш с атомарным add.
+
+    У стандартного add проверка и запись разделены, и два процесса
+    могут оба «добавить» ключ. Здесь готовый файл ставится на место
+    через os.link, который не заменяет существующий файл.
+    """
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._createdir()
+        fname = self._key_to_file(key, version)
+        # has_key заодно удаляет истёкший файл ключа.
+        if self.has_key(key, version):
+            return False
+        self._cull()
+        fd, tmp_path = tempfile.mkstemp(dir=self._dir)
+        try:
+            with open(fd, 'wb') as file:
+                self._write_content(file, timeout, value)
+            os.link(tmp_path, fname)
+        except FileExistsError:
+            return False
+        finally:
+            os.remove(tmp_path)
+        return True
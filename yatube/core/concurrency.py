@@ -0,0 +1,65 @@
+"""Одновременные независимые выборки одной страницы.
+
+Django 2.2 не умеет асинхронных представлений, поэтому представление
+отдаёт независимые выборки - например, посты профиля и подписку на
+автора - в ограниченный пул из settings.ORM_WORKERS потоков, и они
+идут к базе одновременно. У потока пула свои соединения с базами,
+а разрешение читать с реплики и замеры запроса переходят к нему
+вместе с вызовом.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import close_old_connections, connections
+
+from . import metrics, routers
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.ORM_WORKERS, thread_name_prefix='orm')
+    return _executor
+
+
+def _run(call, replica, timings):
+    routers.use_replica(replica)
+    # Поток пула не видит сигналов начала и конца запроса: старые
+    # и сломанные соединения он закрывает сам.
+    close_old_connections()
+    try:
+        with ExitStack() as stack:
+            if timings is not None:
+                stack.enter_context(metrics.collect(timings))
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(metrics.sql_wrapper))
+            return call()
+    finally:
+        routers.use_replica(False)
+        close_old_connections()
+
+
+def run_concurrently(*calls):
+    """Выполняет вызовы без аргументов одновременно.
+
+    Возвращает их результаты в том же порядке. Первый вызов идёт
+    в потоке запроса, остальные - в пуле. При ORM_WORKERS = 0 все
+    вызовы выполняются по очереди в потоке запроса.
+    """
+    if not settings.ORM_WORKERS or len(calls) < 2:
+        return [call() for call in calls]
+    replica = routers.reading_replica()
+    timings = metrics.current()
+    futures = [
+        _get_executor().submit(_run, call, replica, timings)
+        for call in calls[1:]
+    ]
+    return [calls[0]()] + [future.result() for future in futures]
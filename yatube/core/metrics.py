@@ -0,0 +1,173 @@
+"""Замеры времени обработки запросов и их сводка для Prometheus."""
+import bisect
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+# Имена URL этих пространств попадают в метки как есть, остальные
+# адреса сводятся к метке other, чтобы число рядов не росло.
+INSTRUMENTED_NAMESPACES = ('posts', 'users', 'about')
+HISTOGRAM_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Этапы запроса: (ключ, имя в Server-Timing, описание). Описания
+# латиницей: значение заголовка должно укладываться в latin-1.
+STAGES = (
+    ('db', 'db', 'SQL queries'),
+    ('template', 'tpl', 'Template renders'),
+    ('thumbnail', 'thumb', 'Thumbnails'),
+)
+
+_local = threading.local()
+
+
+class RequestTimings:
+    """Суммарное время и число операций по этапам одного запроса."""
+
+    def __init__(self):
+        self.durations = defaultdict(float)
+        self.counts = defaultdict(int)
+        # Замеры одного запроса пишут и потоки core.concurrency.
+        self.lock = threading.Lock()
+
+    def add(self, stage, duration):
+        with self.lock:
+            self.durations[stage] += duration
+            self.counts[stage] += 1
+
+    def server_timing(self, total):
+        parts = [f'total;dur={total * 1000:.1f}']
+        for stage, name, description in STAGES:
+            if stage not in self.counts:
+                continue
+            parts.append(
+                f'{name};dur={self.durations[stage] * 1000:.1f};'
+                f'desc="{description}: {self.counts[stage]}"')
+        if self.counts['cache_hit'] or self.counts['cache_miss']:
+            parts.append(
+                f'cache;desc="hits: {self.counts["cache_hit"]}, '
+                f'misses: {self.counts["cache_miss"]}"')
+        return ', '.join(parts)
+
+
+def current():
+    """Замеры запроса, обрабатываемого текущим потоком, или None."""
+    return getattr(_local, 'timings', None)
+
+
+@contextmanager
+def collect(timings=None):
+    """Копит замеры потока в timings, по умолчанию - в новые."""
+    if timings is None:
+        timings = RequestTimings()
+    _local.timings = timings
+    try:
+        yield timings
+    finally:
+        _local.timings = None
+
+
+@contextmanager
+def timed(stage):
+    """Добавляет время блока к этапу текущего запроса."""
+    timings = current()
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(stage, time.perf_counter() - start)
+
+
+def record_cache(hit):
+    timings = current()
+    if timings is not None:
+        timings.add('cache_hit' if hit else 'cache_miss', 0.0)
+
+
+def sql_wrapper(execute, sql, params, many, context):
+    with timed('db'):
+        return execute(sql, params, many, context)
+
+
+class Histogram:
+    def __init__(self):
+        self.buckets = [0] * len(HISTOGRAM_BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        index = bisect.bisect_left(HISTOGRAM_BUCKETS, value)
+        if index < len(self.buckets):
+            self.buckets[index] += 1
+        self.count += 1
+        self.sum += value
+
+
+class Registry:
+    """Гистограммы и счётчики процесса в разрезе представлений.
+
+    Данные живут в памяти процесса: каждый воркер отдаёт на /metrics
+    свои значения, суммирует их сборщик метрик.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = defaultdict(Histogram)
+        self.counters = defaultdict(int)
+
+    def observe(self, view, total, timings):
+        with self.lock:
+            self.histograms['request', view].observe(total)
+            for stage, _, _ in STAGES:
+                if stage in timings.counts:
+                    self.histograms[stage, view].observe(
+                        timings.durations[stage])
+            self.counters['db_queries', view] += timings.counts['db']
+            self.counters['cache_hits', view] += timings.counts['cache_hit']
+            self.counters['cache_misses', view] += (
+                timings.counts['cache_miss'])
+
+    def render(self):
+        """Метрики в текстовом формате Prometheus."""
+        with self.lock:
+            histograms = sorted(self.histograms.items())
+            counters = sorted(self.counters.items())
+        lines = []
+        for name in sorted({name for (name, _), _ in histograms}):
+            metric = f'yatube_{name}_duration_seconds'
+            lines.append(f'# TYPE {metric} histogram')
+            for (hist_name, view), histogram in histograms:
+                if hist_name != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(HISTOGRAM_BUCKETS, histogram.buckets):
+                    cumulative += count
+                    lines.append(
+                        f'{metric}_bucket{{view="{view}",le="{bound}"}} '
+                        f'{cumulative}')
+                lines.append(
+                    f'{metric}_bucket{{view="{view}",le="+Inf"}} '
+                    f'{histogram.count}')
+                lines.append(f'{metric}_sum{{view="{view}"}} {histogram.sum}')
+                lines.append(
+                    f'{metric}_count{{view="{view}"}} {histogram.count}')
+        for name in sorted({name for (name, _), _ in counters}):
+            metric = f'yatube_{name}_total'
+            lines.append(f'# TYPE {metric} counter')
+            for (counter_name, view), value in counters:
+                if counter_name == name:
+                    lines.append(f'{metric}{{view="{view}"}} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+def view_label(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None or match.namespace not in INSTRUMENTED_NAMESPACES:
+        return 'other'
+    return match.view_name
@@ -0,0 +1,90 @@
+import logging
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from . import metrics, routers
+from .queries import QueryRecorder
+
+logger = logging.getLogger('core.queries')
+
+
+class QueryInspectorMiddleware:
+    """Отладочный учёт запросов к базе для каждого запроса к сайту.
+
+    Работает только при DEBUG. Число запросов отдаётся в заголовке
+    X-Query-Count, а повторяющиеся формы запросов (N+1) пишутся
+    в лог вместе со строкой шаблона, из-за которой они выполнены.
+    """
+
+    def __init__(self, get_response):
+        if not settings.DEBUG:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with QueryRecorder() as recorder:
+            response = self.get_response(request)
+        response['X-Query-Count'] = len(recorder)
+        for shape, count, origins in recorder.repeated():
+            logger.warning(
+                'N+1 на %s: %s запросов вида %s из %s', request.path,
+                count, shape, ', '.join(origins) or 'кода представления')
+        return response
+
+
+class TimingMiddleware:
+    """Замеряет время запроса по этапам: SQL, кеш, шаблоны, миниатюры.
+
+    Замеры отдаются клиенту в заголовке Server-Timing и копятся
+    в гистограммах, которые публикует /metrics.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            timings = stack.enter_context(metrics.collect())
+            for connection in connections.all():
+                stack.enter_context(
+                    connection.execute_wrapper(metrics.sql_wrapper))
+            response = self.get_response(request)
+        total = time.perf_counter() - start
+        response['Server-Timing'] = timings.server_timing(total)
+        metrics.registry.observe(metrics.view_label(request), total, timings)
+        return response
+
+
+class ReplicaMiddleware:
+    """Направляет чтения отмеченных представлений на реплики.
+
+    Запрос, изменивший данные, ставит cookie на
+    REPLICA_STICKY_SECONDS секунд; с ней чтения идут в основную базу.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        try:
+            response = self.get_response(request)
+        finally:
+            routers.use_replica(False)
+        if (request.method not in ('GET', 'HEAD', 'OPTIONS')
+                and response.status_code < 400):
+            response.set_cookie(
+                routers.PRIMARY_COOKIE, '1',
+                max_age=settings.REPLICA_STICKY_SECONDS, httponly=True,
+                samesite='Lax')
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        routers.use_replica(
+            request.method in ('GET', 'HEAD')
+            and getattr(view_func, 'replica_reads', False)
+            and routers.PRIMARY_COOKIE not in request.COOKIES)
@@ -0,0 +1,92 @@
+"""Учёт SQL-запросов: форма запроса, повторы (N+1) и их источник."""
+import re
+import sys
+import time
+from collections import namedtuple
+from contextlib import ExitStack
+
+from django.db import connections
+
+# Столько одинаковых по форме запросов за запрос к сайту считается N+1.
+REPEAT_THRESHOLD = 3
+
+RecordedQuery = namedtuple('RecordedQuery', 'sql shape duration origin')
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDERS = re.compile(r'\(\s*(?:%s|\?)(?:\s*,\s*(?:%s|\?))*\s*\)')
+_SPACES = re.compile(r'\s+')
+
+
+def normalize(sql):
+    """Форма запроса: литералы и списки параметров заменены на ?."""
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = sql.replace('%s', '?')
+    sql = _PLACEHOLDERS.sub('(...)', sql)
+    return _SPACES.sub(' ', sql).strip()
+
+
+def template_origin():
+    """Шаблон и строка, при отрисовке которой выполняется запрос."""
+    frame = sys._getframe(1)
+    while frame is not None:
+        if frame.f_code.co_name == 'render_annotated':
+            node = frame.f_locals.get('self')
+            token = getattr(node, 'token', None)
+            origin = getattr(node, 'origin', None)
+            if token is not None and origin is not None:
+                name = origin.template_name or origin.name
+                return f'{name}:{token.lineno}'
+        frame = frame.f_back
+    return None
+
+
+class QueryRecorder:
+    """Записывает все SQL-запросы ко всем базам внутри блока with."""
+
+    def __init__(self):
+        self.queries = []
+        self._stack = None
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append(RecordedQuery(
+                sql, normalize(sql), time.perf_counter() - start,
+                template_origin()))
+
+    def __enter__(self):
+        self._stack = ExitStack()
+        for connection in connections.all():
+            self._stack.enter_context(connection.execute_wrapper(self))
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stack.close()
+
+    def __len__(self):
+        return len(self.queries)
+
+    def repeated(self, threshold=REPEAT_THRESHOLD):
+        """Список (форма, число, источники) для повторяющихся форм."""
+        groups = {}
+        for query in self.queries:
+            groups.setdefault(query.shape, []).append(query)
+        result = []
+        for shape, queries in groups.items():
+            if len(queries) >= threshold:
+                origins = sorted({q.origin for q in queries if q.origin})
+                result.append((shape, len(queries), origins))
+        return sorted(result, key=lambda item: -item[1])
+
+    def report(self, threshold=REPEAT_THRESHOLD):
+        lines = [f'{len(self.queries)} запросов:']
+        for index, query in enumerate(self.queries, 1):
+            lines.append(f'{index}. {query.sql}')
+        for shape, count, origins in self.repeated(threshold):
+            lines.append(f'N+1: {count} раз {shape}')
+            lines.extend(f'    из {origin}' for origin in origins)
+        return '\n'.join(lines)
@@ -0,0 +1,53 @@
+"""Чтение с реплик, запись в основную базу.
+
+Реплики перечислены в settings.DATABASE_REPLICAS алиасами из DATABASES.
+На реплику идут только чтения внутри представлений, отмеченных
+replica_reads, и только для GET и HEAD: решение принимает
+ReplicaMiddleware. После запроса, изменившего данные, клиент получает
+cookie, и пока она жива, все его чтения идут в основную базу, чтобы он
+сразу увидел свой пост или комментарий несмотря на отставание реплики.
+"""
+import random
+import threading
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+PRIMARY_COOKIE = 'read_primary'
+
+_state = threading.local()
+
+
+def replica_reads(view):
+    """Отмечает представление, чтения которого можно отдать реплике."""
+    view.replica_reads = True
+    return view
+
+
+def use_replica(value):
+    _state.replica = value
+
+
+def reading_replica():
+    """Разрешено ли текущему потоку читать с реплики."""
+    return getattr(_state, 'replica', False)
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replicas = settings.DATABASE_REPLICAS
+        # Внутри транзакции читаем то, что она сама записала.
+        if (not replicas or not reading_replica()
+                or connections[DEFAULT_DB_ALIAS].in_atomic_block):
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Все базы - копии основной, связи между ними допустимы.
+        if (obj1._state.db in settings.DATABASES
+                and obj2._state.db in settings.DATABASES):
+            return True
+        return None
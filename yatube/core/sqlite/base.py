@@ -0,0 +1,79 @@
+"""SQLite для нагруженного сайта: WAL, настройки PRAGMA и повторы.
+
+В режиме WAL читатели не ждут писателя, а synchronous=NORMAL
+сбрасывает журнал на диск только при контрольных точках. Транзакции
+начинаются с BEGIN IMMEDIATE: писатель ждёт блокировку в начале
+транзакции, где её можно повторить, а не падает посреди неё.
+Запросы вне транзакции, получившие «database is locked», повторяются
+с растущей паузой.
+"""
+import time
+
+from django.db.backends.sqlite3 import base
+
+# Значения по умолчанию; переопределяются словарём OPTIONS['pragmas'].
+PRAGMAS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    # 256 МБ файла базы отображаются в память процесса.
+    'mmap_size': 256 * 1024 * 1024,
+    # Отрицательное значение - размер кеша страниц в КБ, здесь 64 МБ.
+    'cache_size': -64 * 1024,
+    'temp_store': 'memory',
+}
+# Сколько секунд sqlite ждёт чужую блокировку, прежде чем вернуть
+# ошибку.
+BUSY_TIMEOUT = 5
+RETRIES = 3
+RETRY_DELAY = 0.05
+
+
+def is_locked(error):
+    return 'is locked' in str(error)
+
+
+class RetryingCursorWrapper(base.SQLiteCursorWrapper):
+    retries = RETRIES
+
+    def _retry(self, method, *args):
+        for attempt in range(self.retries + 1):
+            try:
+                return method(*args)
+            except base.Database.OperationalError as error:
+                # Посреди транзакции повтор одного запроса не поможет:
+                # ошибку должен увидеть вызывающий код.
+                if (not is_locked(error) or attempt == self.retries
+                        or self.connection.in_transaction):
+                    raise
+            time.sleep(RETRY_DELAY * 2 ** attempt)
+
+    def execute(self, query, params=None):
+        return self._retry(super().execute, query, params)
+
+    def executemany(self, query, param_list):
+        return self._retry(super().executemany, query, param_list)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """Бэкенд sqlite3 с опциями pragmas, retries и timeout в OPTIONS."""
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        self.pragmas = {**PRAGMAS, **params.pop('pragmas', {})}
+        self.retries = params.pop('retries', RETRIES)
+        params.setdefault('timeout', BUSY_TIMEOUT)
+        return params
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for name, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    def create_cursor(self, name=None):
+        cursor = self.connection.cursor(factory=RetryingCursorWrapper)
+        cursor.retries = self.retries
+        return cursor
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute('BEGIN IMMEDIATE')
@@ -0,0 +1,28 @@
+from django.template import TemplateDoesNotExist
+from django.template.backends.django import DjangoTemplates, Template, reraise
+
+from .metrics import timed
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        with timed('template'):
+            return super().render(context, request)
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """Шаблоны Django с замером времени отрисовки для Server-Timing.
+
+    Замеряется отрисовка шаблона целиком, вместе с include и
+    запросами ленивых querysets, выполненными из шаблона.
+    """
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return TimedTemplate(
+                self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
@@ -0,0 +1,117 @@
+import asyncio
+from contextlib import contextmanager
+from email.message import Message
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.test import Client
+
+from .queries import QueryRecorder
+
+
+class QueryBudgetMixin:
+    """Проверка, что код укладывается в бюджет запросов к базе."""
+
+    @contextmanager
+    def assertQueryBudget(self, budget, msg=None):
+        with QueryRecorder() as recorder:
+            yield recorder
+        if len(recorder) > budget:
+            message = f'{len(recorder)} запросов при бюджете {budget}'
+            if msg:
+                message = f'{msg}: {message}'
+            self.fail(f'{message}\n{recorder.report()}')
+
+
+class AsgiResponse:
+    def __init__(self, status_code, headers, content):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+    def __getitem__(self, name):
+        return self.headers[name]
+
+
+class AsgiClient:
+    """Синхронный клиент ASGI-приложения для тестов и замеров.
+
+    Запрос выполняется в цикле событий loop (например, в отдельном
+    потоке, как у ASGI-сервера) или, без loop, в новом цикле. Cookies
+    хранятся между запросами, как у django.test.Client; перед первой
+    отправкой формы клиент, как браузер, открывает её страницу ради
+    CSRF-cookie.
+    """
+
+    def __init__(self, application, loop=None):
+        self.application = application
+        self.loop = loop
+        self.cookies = SimpleCookie()
+
+    def force_login(self, user):
+        client = Client()
+        client.force_login(user)
+        self.cookies.update(client.cookies)
+
+    def get(self, path, data=None):
+        return self.request('GET', path, urlencode(data or {}, doseq=True))
+
+    def post(self, path, data=None):
+        if settings.CSRF_COOKIE_NAME not in self.cookies:
+            self.get(path)
+        headers = [
+            (b'content-type', b'application/x-www-form-urlencoded'),
+            (b'x-csrftoken',
+             self.cookies[settings.CSRF_COOKIE_NAME].value.encode()),
+        ]
+        return self.request(
+            'POST', path, body=urlencode(data or {}, doseq=True).encode(),
+            headers=headers)
+
+    def request(self, method, path, query='', body=b'', headers=()):
+        headers = list(headers)
+        if self.cookies:
+            cookie = '; '.join(
+                f'{name}={morsel.value}'
+                for name, morsel in self.cookies.items())
+            headers.append((b'cookie', cookie.encode('latin-1')))
+        scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': method,
+            'scheme': 'http',
+            'path': path,
+            'query_string': query.encode(),
+            'headers': [(b'host', b'testserver')] + headers,
+            'server': ('testserver', 80),
+            'client': ('127.0.0.1', 0),
+        }
+        coroutine = self.call(scope, body)
+        if self.loop is None:
+            response = asyncio.run(coroutine)
+        else:
+            response = asyncio.run_coroutine_threadsafe(
+                coroutine, self.loop).result()
+        for value in response.headers.get_all('set-cookie', []):
+            self.cookies.load(value)
+        return response
+
+    async def call(self, scope, body):
+        messages = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': body}
+
+        async def send(message):
+            messages.append(message)
+
+        await self.application(scope, receive, send)
+        start, *chunks = messages
+        headers = Message()
+        for name, value in start['headers']:
+            headers[name.decode('latin-1')] = value.decode('latin-1')
+        return AsgiResponse(
+            start['status'], headers,
+            b''.join(chunk.get('body', b'') for chunk in chunks))
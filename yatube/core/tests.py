@@ -0,0 +1,430 @@
+import asyncio
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+
+from django.contrib.auth import get_user_model
+from django.contrib.sessions.models import Session
+from django.core.cache import caches
+from django.db.utils import OperationalError
+from django.test import (Client, SimpleTestCase, TestCase,
+                         TransactionTestCase, override_settings)
+from django.urls import reverse
+
+from core.asgi import ASGIHandler
+from core.cache import FileBasedCache, TwoTierCache
+from core.concurrency import run_concurrently
+from core.queries import REPEAT_THRESHOLD, QueryRecorder, normalize
+from core.routers import PRIMARY_COOKIE, reading_replica, use_replica
+from core.sqlite.base import DatabaseWrapper
+from core.testing import AsgiClient
+from posts.models import Group, Post, UserStats
+
+User = get_user_model()
+
+
+def two_tier_settings(shared):
+    return {
+        'default': {
+            'BACKEND': 'core.cache.TwoTierCache',
+            'LOCATION': shared,
+            'OPTIONS': {'MAX_ENTRIES': 2},
+        },
+        shared: {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': shared,
+        },
+    }
+
+
+@override_settings(CACHES=two_tier_settings('two-tier-tests'))
+class TwoTierCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.cache = caches['default']
+        self.shared = caches['two-tier-tests']
+        self.cache.clear()
+
+    def other_process(self):
+        """Экземпляр с собственным L1, как в соседнем воркере."""
+        other = TwoTierCache('two-tier-tests', {})
+        other._layer = type(self.cache._layer)()
+        return other
+
+    def test_l1_hit_after_l2_hit(self):
+        """Повторное чтение обслуживается из L1."""
+        other = self.other_process()
+        self.cache.set('key', 'value')
+        self.assertEqual(other.get('key'), 'value')
+        self.assertEqual(other.get('key'), 'value')
+        self.assertEqual(
+            other.stats,
+            {'l1_hits': 1, 'l1_misses': 1, 'l2_hits': 1, 'l2_misses': 0})
+
+    def test_write_invalidates_other_l1(self):
+        """Запись в одном процессе сбрасывает L1 других процессов."""
+        other = self.other_process()
+        self.cache.set('key', 'old')
+        self.assertEqual(other.get('key'), 'old')
+        self.cache.set('key', 'new')
+        self.assertEqual(other.get('key'), 'new')
+        self.cache.delete('key')
+        self.assertIsNone(other.get('key'))
+
+    def test_write_keeps_other_keys(self):
+        """Запись одного ключа не сбрасывает остальной L1."""
+        other = self.other_process()
+        self.cache.set('key', 'value')
+        other.get('key')
+        self.cache.set('other', 'value')
+        self.assertEqual(other.get('key'), 'value')
+        self.assertEqual(other.stats['l1_hits'], 1)
+
+    def test_sync_interval(self):
+        """Внутри SYNC_INTERVAL L1 не сверяется с общим кешем."""
+        other = self.other_process()
+        other._sync_interval = 60
+        self.cache.set('key', 'old')
+        other.get('key')
+        self.cache.set('key', 'new')
+        self.assertEqual(other.get('key'), 'old')
+        other._sync_interval = 0
+        self.assertEqual(other.get('key'), 'new')
+
+    def test_l1_does_not_outlive_l2(self):
+        """Запись L1 истекает вместе с записью L2."""
+        self.cache.set('key', 'value', 1)
+        self.assertEqual(self.cache.get('key'), 'value')
+        time.sleep(1.1)
+        self.assertIsNone(self.cache.get('key'))
+
+    def test_lru_eviction(self):
+        """L1 хранит не больше MAX_ENTRIES записей."""
+        for key in ('a', 'b', 'c'):
+            self.cache.set(key, key)
+        self.assertEqual(len(self.cache._layer.entries), 2)
+        self.assertEqual(self.cache.get('a'), 'a')
+
+    def test_add_and_versions(self):
+        """add и версии ключей работают как у обычного кеша."""
+        self.assertTrue(self.cache.add('key', 1))
+        self.assertFalse(self.cache.add('key', 2))
+        self.cache.set('key', 'v2', version=2)
+        self.assertEqual(self.cache.get('key'), 1)
+        self.assertEqual(self.cache.get('key', version=2), 'v2')
+
+
+class FileBasedCacheTests(SimpleTestCase):
+    def setUp(self):
+        location = tempfile.mkdtemp()
+        self.cache = FileBasedCache(location, {})
+        self.addCleanup(shutil.rmtree, location)
+
+    def test_add_is_atomic(self):
+        """Из одновременных add ключ получает ровно один."""
+        results = []
+        threads = [
+            threading.Thread(
+                target=lambda i=i: results.append(self.cache.add('lock', i)))
+            for i in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results.count(True), 1)
+        self.assertEqual(len(os.listdir(self.cache._dir)), 1)
+
+    def test_add_replaces_expired(self):
+        """Истёкший ключ можно добавить заново."""
+        self.assertTrue(self.cache.add('key', 1, 1))
+        self.assertFalse(self.cache.add('key', 2))
+        time.sleep(1.1)
+        self.assertTrue(self.cache.add('key', 3))
+        self.assertEqual(self.cache.get('key'), 3)
+
+
+class QueryInspectorTests(TestCase):
+    def test_normalize(self):
+        """Литералы и списки параметров не меняют форму запроса."""
+        self.assertEqual(
+            normalize("SELECT * FROM t WHERE id IN (%s, %s) AND x = 'a' "
+                      "LIMIT 21"),
+            'SELECT * FROM t WHERE id IN (...) AND x = ? LIMIT ?')
+
+    def test_repeated_shapes(self):
+        """Повторы одной формы запроса попадают в отчёт."""
+        user = User.objects.create_user(username='auth')
+        with QueryRecorder() as recorder:
+            for _ in range(REPEAT_THRESHOLD):
+                User.objects.get(id=user.id)
+            User.objects.count()
+        [(shape, count, origins)] = recorder.repeated()
+        self.assertEqual(count, REPEAT_THRESHOLD)
+        self.assertIn('WHERE "auth_user"."id" = ?', shape)
+
+    @override_settings(DEBUG=True)
+    def test_middleware_header(self):
+        """При DEBUG ответ несёт число запросов."""
+        response = Client().get('/')
+        self.assertIn('X-Query-Count', response)
+
+
+class TimingMiddlewareTests(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+
+    def test_server_timing_header(self):
+        """Ответ несёт время запроса, SQL и шаблонов."""
+        response = Client().get(reverse('posts:index'))
+        timing = response['Server-Timing']
+        self.assertTrue(timing.startswith('total;dur='))
+        self.assertIn('db;dur=', timing)
+        self.assertIn('tpl;dur=', timing)
+        self.assertIn('cache;desc="hits: ', timing)
+
+    def test_metrics_endpoint(self):
+        """/metrics отдаёт гистограммы по именам URL."""
+        Client().get(reverse('about:author'))
+        response = Client().get(reverse('metrics'))
+        self.assertEqual(response['Content-Type'],
+                         'text/plain; version=0.0.4')
+        self.assertContains(
+            response,
+            'yatube_request_duration_seconds_count{view="about:author"}')
+        self.assertContains(response, 'yatube_db_queries_total')
+
+    def test_metrics_only_local(self):
+        """Снаружи /metrics не виден."""
+        response = Client(REMOTE_ADDR='10.0.0.1').get(reverse('metrics'))
+        self.assertEqual(response.status_code, 404)
+
+
+class SqliteBackendTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'db.sqlite3')
+
+    def wrapper(self, **options):
+        wrapper = DatabaseWrapper({
+            'NAME': self.path, 'OPTIONS': options, 'TIME_ZONE': None,
+            'CONN_MAX_AGE': 0, 'AUTOCOMMIT': True, 'ATOMIC_REQUESTS': False,
+        })
+        self.addCleanup(wrapper.close)
+        return wrapper
+
+    def pragma(self, wrapper, name):
+        with wrapper.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_pragmas(self):
+        """Соединение открывается в WAL с настройками из OPTIONS."""
+        wrapper = self.wrapper(pragmas={'cache_size': -1024})
+        self.assertEqual(self.pragma(wrapper, 'journal_mode'), 'wal')
+        self.assertEqual(self.pragma(wrapper, 'synchronous'), 1)
+        self.assertEqual(self.pragma(wrapper, 'cache_size'), -1024)
+
+    def test_retry_when_locked(self):
+        """Запись дожидается чужой блокировки повторами."""
+        wrapper = self.wrapper(timeout=0.01, retries=5)
+        with wrapper.cursor() as cursor:
+            cursor.execute('CREATE TABLE item (id integer)')
+        locker = sqlite3.connect(
+            self.path, isolation_level=None, check_same_thread=False)
+        self.addCleanup(locker.close)
+        locker.execute('BEGIN IMMEDIATE')
+        release = threading.Timer(0.1, locker.execute, ['COMMIT'])
+        release.start()
+        self.addCleanup(release.cancel)
+        with wrapper.cursor() as cursor:
+            cursor.execute('INSERT INTO item VALUES (1)')
+            cursor.execute('SELECT count(*) FROM item')
+            self.assertEqual(cursor.fetchone()[0], 1)
+
+    def test_gives_up_after_retries(self):
+        """Без снятия блокировки ошибка доходит до вызывающего."""
+        wrapper = self.wrapper(timeout=0.01, retries=1)
+        with wrapper.cursor() as cursor:
+            cursor.execute('CREATE TABLE item (id integer)')
+        locker = sqlite3.connect(self.path, isolation_level=None)
+        self.addCleanup(locker.close)
+        locker.execute('BEGIN IMMEDIATE')
+        with self.assertRaises(OperationalError):
+            with wrapper.cursor() as cursor:
+                cursor.execute('INSERT INTO item VALUES (1)')
+        locker.execute('ROLLBACK')
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRouterTests(TransactionTestCase):
+    # Не TestCase: внутри его транзакции все чтения идут в основную базу.
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        caches['default'].clear()
+        self.user = User.objects.create_user(username='auth')
+        self.client = Client()
+        self.client.force_login(self.user)
+        # Сессия нужна и на реплике: её читает AuthenticationMiddleware.
+        session = self.client.session
+        Session.objects.using('replica').create(
+            session_key=session.session_key,
+            session_data=session.encode(dict(session)),
+            expire_date=session.get_expiry_date())
+        replica_user = User.objects.using('replica').create(
+            id=self.user.id, username='auth')
+        UserStats.objects.using('replica').create(user=replica_user)
+
+    def test_reads_go_to_replica(self):
+        """Страницы лент читают данные с реплики."""
+        Post.objects.create(author=self.user, text='Пост на основной базе')
+        response = self.client.get(
+            reverse('posts:profile', args=['auth']))
+        self.assertNotContains(response, 'Пост на основной базе')
+        self.assertEqual(Post.objects.using('replica').count(), 0)
+
+    def test_writes_go_to_primary(self):
+        """Запись идёт в основную базу и закрепляет за ней чтения."""
+        response = self.client.post(
+            reverse('posts:post_create'), {'text': 'Свежий пост'})
+        self.assertIn(PRIMARY_COOKIE, response.cookies)
+        self.assertTrue(Post.objects.filter(text='Свежий пост').exists())
+        response = self.client.get(
+            reverse('posts:profile', args=['auth']))
+        self.assertContains(response, 'Свежий пост')
+
+    @override_settings(ORM_WORKERS=2)
+    def test_pool_reads_replica(self):
+        """Выборки в пуле потоков тоже читают с реплики."""
+        Post.objects.create(author=self.user, text='Пост на основной базе')
+        response = self.client.get(
+            reverse('posts:profile', args=['auth']))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, 'Пост на основной базе')
+
+    def test_other_views_use_primary(self):
+        """Неотмеченные представления читают основную базу."""
+        Post.objects.create(author=self.user, text='Пост на основной базе')
+        response = self.client.get(
+            reverse('posts:search'), {'q': 'основной'})
+        self.assertContains(response, 'Пост на основной базе')
+
+
+@override_settings(ORM_WORKERS=2)
+class RunConcurrentlyTests(SimpleTestCase):
+    def test_results_in_order(self):
+        """Вызовы идут в разных потоках, результаты - по порядку."""
+        barrier = threading.Barrier(2, timeout=5)
+
+        def call(value):
+            barrier.wait()
+            return value, threading.get_ident()
+
+        (first, first_thread), (second, second_thread) = run_concurrently(
+            lambda: call(1), lambda: call(2))
+        self.assertEqual((first, second), (1, 2))
+        self.assertNotEqual(first_thread, second_thread)
+
+    def test_replica_flag_follows_call(self):
+        """Разрешение читать с реплики переходит в поток пула."""
+        use_replica(True)
+        try:
+            self.assertEqual(
+                run_concurrently(reading_replica, reading_replica),
+                [True, True])
+        finally:
+            use_replica(False)
+
+
+class AsgiHandlerTests(TransactionTestCase):
+    # Не TestCase: запросы идут в потоках пула со своими соединениями.
+    def setUp(self):
+        caches['default'].clear()
+        self.handler = ASGIHandler()
+        self.client = AsgiClient(self.handler)
+        self.user = User.objects.create_user(username='auth')
+        self.group = Group.objects.create(
+            title='Тестовая группа', slug='test', description='Описание')
+        Post.objects.create(
+            author=self.user, group=self.group, text='Тестовый пост')
+
+    def tearDown(self):
+        self.handler.executor.shutdown()
+
+    def test_get_pages(self):
+        """Страницы отдаются через ASGI так же, как через WSGI."""
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', args=[self.group.slug]),
+            reverse('posts:profile', args=['auth']),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.client.get(url, {'page': 1})
+                self.assertEqual(response.status_code, 200)
+                self.assertIn('Тестовый пост', response.content.decode())
+        self.assertEqual(self.client.get('/missing/').status_code, 404)
+
+    def test_login_and_form(self):
+        """Cookies сессии и CSRF работают, форма создаёт пост."""
+        self.client.force_login(self.user)
+        response = self.client.post(
+            reverse('posts:post_create'), {'text': 'Пост через ASGI'})
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(Post.objects.filter(text='Пост через ASGI').exists())
+        response = self.client.get(reverse('posts:follow_index'))
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(ASGI_THREADS=1)
+    def test_slow_client_frees_thread(self):
+        """Пока клиент медленно принимает ответ, поток пула свободен."""
+        handler = ASGIHandler()
+        self.addCleanup(handler.executor.shutdown)
+        statuses = []
+
+        def request(release=None):
+            scope = {
+                'type': 'http', 'method': 'GET', 'query_string': b'',
+                'path': reverse('posts:index'), 'headers': [],
+            }
+
+            async def receive():
+                return {'type': 'http.request'}
+
+            async def send(message):
+                if message['type'] == 'http.response.start':
+                    statuses.append(message['status'])
+                    if release is not None:
+                        await release.wait()
+
+            return handler(scope, receive, send)
+
+        async def main():
+            release = asyncio.Event()
+            slow = asyncio.ensure_future(request(release))
+            await asyncio.wait_for(request(), 10)
+            release.set()
+            await slow
+
+        asyncio.run(main())
+        self.assertEqual(statuses, [200, 200])
+
+    def test_lifespan(self):
+        """Приложение отвечает на запуск и остановку сервера."""
+        messages = [
+            {'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message['type'])
+
+        asyncio.run(self.handler({'type': 'lifespan'}, receive, send))
+        self.assertEqual(sent, [
+            'lifespan.startup.complete', 'lifespan.shutdown.complete'])
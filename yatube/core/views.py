@@ -1,5 +1,9 @@
+from django.conf import settings
+from django.http import Http404, HttpResponse
 from django.shortcuts import render
 
+from .metrics import registry
+
 
 def page_not_found(request, exception):
     return render(request, 'core/404.html', {'path': request.path}, status=404)
@@ -15,3 +19,11 @@ def csrf_failure(request, reason=''):
 
 def server_error(request):
     return render(request, 'core/500.html', status=500)
+
+
+def metrics(request):
+    # Метрики отдаются только локальным сборщикам.
+    if request.META.get('REMOTE_ADDR') not in settings.METRICS_ALLOWED_IPS:
+        raise Http404
+    return HttpResponse(
+        registry.render(), content_type='text/plain; version=0.0.4')
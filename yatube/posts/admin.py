@@ -1,6 +1,7 @@
 from django.contrib import admin
 
 from .models import Group, Post
+from .search import search_posts
 
 
 class PostAdmin(admin.ModelAdmin):
@@ -9,12 +10,20 @@ class PostAdmin(admin.ModelAdmin):
                     'text',
                     'pub_date',
                     'author',
-                    'group',)
+                    'group',
+                    'comments_count',)
     search_fields = ('text',)
     list_filter = ('pub_date',)
     empty_value_display = '-пусто-'
     list_editable = ('group',)
 
+    def get_search_results(self, request, queryset, search_term):
+        # Поиск идёт по обратному индексу, а не по LIKE '%...%'.
+        if not search_term:
+            return queryset, False
+        found = search_posts(search_term).values('id')
+        return queryset.filter(id__in=found), False
+
 
 admin.site.register(Post, PostAdmin)
 admin.site.register(Group)
@@ -0,0 +1,114 @@
+"""JSON API лент только для чтения.
+
+Ответы несут строгий ETag, вычисленный по метке изменения ленты
+(freshness), числу постов и параметрам запроса. Совпавший If-None-Match
+получает 304 до выборки постов.
+"""
+import hashlib
+from urllib.parse import urlencode
+
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+
+from . import archive, freshness, sharding
+from .counters import user_stats
+from .models import Group, Post, User
+from .paginators import CURSOR_PARAM, CursorPaginator
+
+API_LIMIT = 20
+FIELDS_PARAM = 'fields'
+# Поле ответа и колонка, которую для него нужно выбрать.
+API_FIELDS = {
+    'id': 'id',
+    'text': 'text',
+    'pub_date': 'pub_date',
+    'author': 'author__username',
+    'group': 'group__slug',
+    'image': 'image',
+    'comments_count': 'comments_count',
+}
+
+
+def parse_fields(request):
+    raw = request.GET.get(FIELDS_PARAM)
+    if not raw:
+        return list(API_FIELDS)
+    fields = [field.strip() for field in raw.split(',') if field.strip()]
+    unknown = sorted(set(fields) - set(API_FIELDS))
+    if unknown:
+        raise ValueError(f'Неизвестные поля: {", ".join(unknown)}')
+    return fields
+
+
+def make_etag(*parts):
+    raw = '|'.join(str(part) for part in parts)
+    return quote_etag(hashlib.sha1(raw.encode()).hexdigest())
+
+
+def serialize(post, fields):
+    values = {
+        'id': lambda: post.id,
+        'text': lambda: post.text,
+        'pub_date': lambda: post.pub_date,
+        'author': lambda: post.author.username,
+        'group': lambda: post.group.slug if post.group_id else None,
+        'image': lambda: post.image.url if post.image else None,
+        'comments_count': lambda: post.comments_count,
+    }
+    return {field: values[field]() for field in fields}
+
+
+def feed_response(request, posts, scope, count=None):
+    """Страница ленты в JSON с поддержкой If-None-Match."""
+    try:
+        fields = parse_fields(request)
+    except ValueError as error:
+        return JsonResponse({'error': str(error)}, status=400)
+    cursor = request.GET.get(CURSOR_PARAM)
+    etag = make_etag(
+        freshness.changed_at(scope), count, cursor, ','.join(fields))
+    response = get_conditional_response(request, etag=etag)
+    if response is not None:
+        return response
+    posts = posts.only('id', 'pub_date', *(API_FIELDS[f] for f in fields))
+    related = [name for name in ('author', 'group') if name in fields]
+    if related:
+        posts = posts.select_related(*related)
+    page = CursorPaginator(posts, API_LIMIT).get_page(cursor)
+    data = {'results': [serialize(post, fields) for post in page]}
+    if count is not None:
+        data['count'] = count
+    data['next'] = None
+    if page.has_next():
+        params = {CURSOR_PARAM: page.next_cursor()}
+        if FIELDS_PARAM in request.GET:
+            params[FIELDS_PARAM] = request.GET[FIELDS_PARAM]
+        data['next'] = request.build_absolute_uri(
+            f'{request.path}?{urlencode(params)}')
+    response = JsonResponse(data, json_dumps_params={'ensure_ascii': False})
+    response['ETag'] = etag
+    return response
+
+
+def index(request):
+    return feed_response(
+        request, sharding.all_shards(Post.objects.all()), freshness.ALL)
+
+
+def group_posts(request, slug):
+    group = get_object_or_404(Group, slug=slug)
+    return feed_response(
+        request, sharding.all_shards(Post.objects.filter(group=group)),
+        freshness.group_scope(group.id), group.posts_count)
+
+
+def profile(request, username):
+    # Как и страница профиля, лента автора дочитывает архив: count
+    # считает и архивные посты.
+    user = get_object_or_404(
+        User.objects.select_related('stats'), username=username)
+    return feed_response(
+        request, archive.author_posts(user),
+        freshness.author_scope(user.id), user_stats(user).posts_count)
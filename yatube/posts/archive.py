@@ -0,0 +1,200 @@
+"""Архив старых постов и комментариев.
+
+Почти все чтения приходятся на посты последних недель, а старые строки
+раздувают индексы posts_post и posts_comment. Посты старше
+settings.POST_ARCHIVE_DAYS дней без свежих комментариев пачками
+переезжают вместе с комментариями в таблицы ArchivedPost
+и ArchivedComment той же базы, при шардировании - того же шарда.
+Горячие таблицы и их индексы остаются маленькими и помещаются в кеш
+страниц.
+
+Главная лента, группы, поиск и подписки показывают только горячие
+посты, а страница поста и профиль дочитывают архив. Архивный пост
+только читается; restore_post возвращает его в горячие таблицы.
+Счётчик постов автора учитывает архив, счётчик группы - нет.
+"""
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Exists, OuterRef, Q
+from django.http import Http404
+from django.utils import timezone
+
+from . import freshness, sharding, timeline
+from .bulk import explicit_dates
+from .counters import bump, user_stats
+from .models import (ArchivedComment, ArchivedPost, Comment, Group, Post,
+                     PostTerm, TimelineEntry, UserStats)
+from .page_cache import bump_feed_version
+from .search import index_post
+
+# Столько постов переносится одной транзакцией: запись в базу
+# блокируется не дольше одной пачки.
+ARCHIVE_BATCH_SIZE = 500
+# Поля, общие у горячих и архивных таблиц.
+POST_FIELDS = [field.attname for field in Post._meta.concrete_fields]
+COMMENT_FIELDS = [field.attname for field in Comment._meta.concrete_fields]
+
+
+def cutoff(days=None):
+    """Момент, старше которого посты уходят в архив."""
+    if days is None:
+        days = settings.POST_ARCHIVE_DAYS
+    return timezone.now() - timedelta(days=days)
+
+
+def _copies(model, objects, names):
+    return [
+        model(**{name: getattr(obj, name) for name in names})
+        for obj in objects
+    ]
+
+
+def _purge(queryset):
+    # Без сигналов: записи не удаляются, а переезжают.
+    queryset._raw_delete(queryset.db)
+
+
+def _touch(posts):
+    scopes = set()
+    for post in posts:
+        scopes.update(freshness.post_scopes(
+            post.id, post.author_id, post.group_id))
+    freshness.touch(*scopes)
+    bump_feed_version()
+
+
+def archivable(alias, before):
+    """Посты базы alias старше before без комментариев новее before."""
+    fresh = Comment.objects.filter(post=OuterRef('pk'), pub_date__gte=before)
+    return Post.objects.using(alias).filter(pub_date__lt=before).annotate(
+        fresh=Exists(fresh)).filter(fresh=False).order_by('pub_date', 'id')
+
+
+def archive_batch(candidates, alias, before):
+    """Переносит пачку постов с комментариями в архив базы alias.
+
+    Пачка выбирается заново в транзакции: пост, который после первого
+    чтения получил свежий комментарий, остаётся, а правка попадает
+    в архив. Возвращает перенесённые посты.
+
+    Счётчики живут в основной базе. Её транзакция внешняя: если она
+    не зафиксируется после переноса строк в шарде, расходятся только
+    счётчики, и их чинит rebuild_counters - он считает по всем шардам.
+    """
+    ids = [post.id for post in candidates]
+    with transaction.atomic(using=DEFAULT_DB_ALIAS), \
+            transaction.atomic(using=alias):
+        posts = list(archivable(alias, before).filter(id__in=ids))
+        ids = [post.id for post in posts]
+        if not ids:
+            return posts
+        ArchivedPost.objects.using(alias).bulk_create(
+            _copies(ArchivedPost, posts, POST_FIELDS))
+        comments = Comment.objects.using(alias).filter(post_id__in=ids)
+        ArchivedComment.objects.using(alias).bulk_create(
+            _copies(ArchivedComment, comments.iterator(), COMMENT_FIELDS),
+            batch_size=ARCHIVE_BATCH_SIZE)
+        for model in (PostTerm, Comment, TimelineEntry):
+            _purge(model.objects.using(alias).filter(post_id__in=ids))
+        _purge(Post.objects.using(alias).filter(id__in=ids))
+        authors = Counter(post.author_id for post in posts)
+        for author_id, count in authors.items():
+            bump(UserStats.objects.filter(user_id=author_id),
+                 count, 'archived_posts_count')
+        groups = Counter(post.group_id for post in posts if post.group_id)
+        for group_id, count in groups.items():
+            bump(Group.objects.filter(pk=group_id), -count, 'posts_count')
+    return posts
+
+
+def archive_posts(before, batch_size=ARCHIVE_BATCH_SIZE):
+    """Переносит в архив все подходящие посты и возвращает их число.
+
+    Пачки идут по (pub_date, id) от старых к новым: оставшиеся из-за
+    свежих комментариев посты не просматриваются повторно.
+    """
+    moved = 0
+    for alias in sharding.shards():
+        candidates = archivable(alias, before)
+        while True:
+            posts = list(candidates[:batch_size])
+            if not posts:
+                break
+            archived = archive_batch(posts, alias, before)
+            _touch(archived)
+            moved += len(archived)
+            last = posts[-1]
+            candidates = archivable(alias, before).filter(
+                Q(pub_date__gt=last.pub_date)
+                | Q(pub_date=last.pub_date, id__gt=last.id))
+    return moved
+
+
+def restore_post(post_id):
+    """Возвращает пост с комментариями из архива в горячие таблицы.
+
+    Если поста нет в архиве, бросает ArchivedPost.DoesNotExist.
+    """
+    alias = sharding.post_shard(post_id, ArchivedPost) or DEFAULT_DB_ALIAS
+    archived = ArchivedPost.objects.using(alias).get(pk=post_id)
+    comments = ArchivedComment.objects.using(alias).filter(post_id=post_id)
+    with transaction.atomic(using=alias), explicit_dates(Post, Comment):
+        post, = Post.objects.using(alias).bulk_create(
+            _copies(Post, [archived], POST_FIELDS))
+        Comment.objects.using(alias).bulk_create(
+            _copies(Comment, comments, COMMENT_FIELDS))
+        _purge(comments)
+        _purge(ArchivedPost.objects.using(alias).filter(pk=post_id))
+        index_post(post)
+        timeline.fan_out_post(post)
+        bump(UserStats.objects.filter(user_id=post.author_id),
+             -1, 'archived_posts_count')
+        if post.group_id:
+            bump(Group.objects.filter(pk=post.group_id), 1, 'posts_count')
+    _touch([post])
+    return post
+
+
+def get_post_or_404(post_id, *related):
+    """Пост по id из горячей таблицы, а если его там нет - из архива."""
+    try:
+        return sharding.get_post_or_404(
+            Post.objects.select_related(*related), post_id)
+    except Http404:
+        return sharding.get_post_or_404(
+            ArchivedPost.objects.select_related(*related), post_id)
+
+
+def comments_location(post_id):
+    """Шард и модель комментариев поста: горячие или архивные.
+
+    Архив проверяется, только если поста нет в горячей таблице,
+    а поста нет нигде - Http404.
+    """
+    for post_model, comment_model in ((Post, Comment),
+                                      (ArchivedPost, ArchivedComment)):
+        for alias in sharding.shards():
+            if post_model.objects.using(alias).filter(pk=post_id).exists():
+                return alias, comment_model
+    raise Http404('Пост не найден.')
+
+
+def author_posts(author, *related):
+    """Посты автора для профиля вместе с архивом.
+
+    Автору без архива достаётся обычная выборка. Иначе горячие
+    и архивные посты сливаются по дате, и глубокие страницы профиля
+    дочитывают архив.
+    """
+    posts = sharding.author_posts(
+        Post.objects.filter(author=author).select_related(*related),
+        author.id)
+    if not user_stats(author).archived_posts_count:
+        return posts
+    archived = sharding.author_posts(
+        ArchivedPost.objects.filter(author=author).select_related(*related),
+        author.id)
+    return sharding.ScatterGather([posts, archived])
@@ -0,0 +1,44 @@
+"""Помощники для массовой загрузки данных через bulk_create."""
+from contextlib import contextmanager
+
+
+def batches(total, size):
+    """Размеры пачек, на которые делится total записей."""
+    while total > 0:
+        yield min(total, size)
+        total -= size
+
+
+@contextmanager
+def explicit_dates(*models):
+    """Позволяет bulk_create сохранить заданные pub_date."""
+    fields = [model._meta.get_field('pub_date') for model in models]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+def keyset_chunks(queryset, chunk_size):
+    """Обходит values() queryset по возрастанию id пачками без OFFSET.
+
+    В памяти одновременно держится не больше chunk_size строк.
+    """
+    last_id = 0
+    while True:
+        rows = list(
+            queryset.filter(id__gt=last_id).order_by('id')[:chunk_size]
+            .iterator(chunk_size=chunk_size))
+        if not rows:
+            return
+        last_id = rows[-1]['id']
+        yield rows
+
+
+def keyset_scan(queryset, chunk_size):
+    """То же, что keyset_chunks, но по одной строке."""
+    for rows in keyset_chunks(queryset, chunk_size):
+        yield from rows
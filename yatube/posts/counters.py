@@ -0,0 +1,140 @@
+from collections import Counter, defaultdict
+
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from . import sharding
+from .bulk import keyset_chunks
+from .models import (ArchivedComment, ArchivedPost, Comment, Follow, Group,
+                     Post, User, UserStats)
+
+# Столько строк пересчитывается одной транзакцией в rebuild_counters.
+RECOUNT_CHUNK_SIZE = 1000
+
+
+def bump(queryset, delta, *fields):
+    """Атомарно меняет счётчики строк на delta через F()."""
+    if delta < 0:
+        for field in fields:
+            queryset = queryset.filter(**{f'{field}__gte': -delta})
+    queryset.update(**{field: F(field) + delta for field in fields})
+
+
+def user_stats(user):
+    """Счётчики пользователя; недостающую строку считает и создаёт.
+
+    Строку заводит сигнал post_save, но пользователь, созданный в обход
+    него (bulk_create, loaddata), остаётся без неё до rebuild_counters.
+    """
+    try:
+        return user.stats
+    except UserStats.DoesNotExist:
+        pass
+    archived = sharding.author_posts(
+        ArchivedPost.objects.filter(author=user), user.id).count()
+    hot = sharding.author_posts(
+        Post.objects.filter(author=user), user.id).count()
+    user.stats, _ = UserStats.objects.get_or_create(user=user, defaults={
+        'posts_count': hot + archived,
+        'archived_posts_count': archived,
+        'followers_count': Follow.objects.filter(author=user).count(),
+        'following_count': Follow.objects.filter(user=user).count(),
+    })
+    return user.stats
+
+
+def _count(queryset, field):
+    counted = (queryset.filter(**{field: OuterRef('pk')})
+               .order_by().values(field).annotate(total=Count('pk'))
+               .values('total'))
+    return Coalesce(Subquery(counted), 0)
+
+
+def _totals(model, field, ids):
+    """Число строк model по значениям field из ids, по всем шардам."""
+    totals = Counter()
+    for alias in sharding.shards():
+        totals.update(dict(
+            model.objects.using(alias).filter(**{f'{field}__in': ids})
+            .order_by().values_list(field).annotate(total=Count('pk'))))
+    return totals
+
+
+def _set_totals(queryset, ids, **totals):
+    """Записывает посчитанные в шардах значения одним UPDATE на набор."""
+    rows = defaultdict(list)
+    for pk in ids:
+        rows[tuple(values[pk] for values in totals.values())].append(pk)
+    for values, pks in rows.items():
+        queryset.filter(pk__in=pks).update(**dict(zip(totals, values)))
+
+
+def recount_users(user_ids):
+    """Пересчитывает счётчики пользователей; недостающие строки заводит."""
+    UserStats.objects.bulk_create(
+        [UserStats(user_id=user_id) for user_id in user_ids],
+        ignore_conflicts=True)
+    stats = UserStats.objects.filter(user_id__in=user_ids)
+    stats.update(
+        followers_count=_count(Follow.objects, 'author'),
+        following_count=_count(Follow.objects, 'user'))
+    # Посты автора считаются вместе с архивом.
+    if not sharding.enabled():
+        stats.update(
+            posts_count=(_count(Post.objects, 'author')
+                         + _count(ArchivedPost.objects, 'author')),
+            archived_posts_count=_count(ArchivedPost.objects, 'author'))
+        return
+    # Посты лежат в шардах, а счётчики - в основной базе: подзапросом
+    # их не соединить, и суммы считаются здесь.
+    hot = _totals(Post, 'author', user_ids)
+    archived = _totals(ArchivedPost, 'author', user_ids)
+    _set_totals(
+        UserStats.objects, user_ids,
+        posts_count=hot + archived, archived_posts_count=archived)
+
+
+def recount_groups(group_ids):
+    """Пересчитывает число постов групп, без архива."""
+    if not sharding.enabled():
+        Group.objects.filter(pk__in=group_ids).update(
+            posts_count=_count(Post.objects, 'group'))
+        return
+    _set_totals(
+        Group.objects.using(DEFAULT_DB_ALIAS), group_ids,
+        posts_count=_totals(Post, 'group', group_ids))
+
+
+def recount_posts(post_ids, model=Post, using=None):
+    """Пересчитывает число комментариев горячих или архивных постов.
+
+    Комментарии лежат в шарде своего поста, так что подзапрос
+    выполняется в каждом шарде или только в using.
+    """
+    comments = ArchivedComment if model is ArchivedPost else Comment
+    for alias in [using] if using else sharding.shards():
+        model.objects.using(alias).filter(pk__in=post_ids).update(
+            comments_count=_count(comments.objects, 'post'))
+
+
+def rebuild_counters():
+    """Пересчитывает все счётчики по фактическим данным, по всем шардам.
+
+    Строки идут пачками по RECOUNT_CHUNK_SIZE, каждая пачка в своей
+    транзакции: блокировки не держатся на всю базу.
+    """
+    for model, recount in ((User, recount_users), (Group, recount_groups)):
+        for rows in keyset_chunks(
+                model.objects.using(DEFAULT_DB_ALIAS).values('id'),
+                RECOUNT_CHUNK_SIZE):
+            with transaction.atomic():
+                recount([row['id'] for row in rows])
+    for alias in sharding.shards():
+        for model in (Post, ArchivedPost):
+            for rows in keyset_chunks(
+                    model.objects.using(alias).values('id'),
+                    RECOUNT_CHUNK_SIZE):
+                with transaction.atomic(using=alias):
+                    recount_posts(
+                        [row['id'] for row in rows], model, using=alias)
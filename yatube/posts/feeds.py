@@ -0,0 +1,112 @@
+"""Atom-ленты групп и авторов с кешированием тела ленты."""
+import hashlib
+
+from django.contrib.syndication.views import Feed
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils.cache import get_conditional_response
+from django.utils.feedgenerator import Atom1Feed
+from django.utils.http import http_date, quote_etag
+from django.utils.text import Truncator
+
+from . import freshness, sharding
+from .models import Group, Post, User
+
+FEED_LIMIT = 20
+FEED_CACHE_TIME = 60 * 60 * 24
+TITLE_WORDS = 10
+
+
+class CachedFeed(Feed):
+    """Atom-лента, тело которой берётся из кеша.
+
+    Кеш привязан к метке последнего изменения области ленты, так что
+    новая лента строится только после изменения постов этой области.
+    По той же метке отвечаем 304 на If-Modified-Since и If-None-Match.
+    """
+
+    feed_type = Atom1Feed
+
+    def scope(self, obj):
+        raise NotImplementedError
+
+    def __call__(self, request, *args, **kwargs):
+        obj = self.get_object(request, *args, **kwargs)
+        changed = freshness.changed_at(self.scope(obj))
+        key = ':'.join((
+            'feed', type(self).__name__, self.scope(obj), str(changed),
+            request.get_host()))
+        etag = quote_etag(hashlib.sha1(key.encode()).hexdigest())
+        response = get_conditional_response(
+            request, etag=etag,
+            last_modified=freshness.modified_second(changed))
+        if response is None:
+            entry = cache.get(key)
+            if entry is None:
+                feed = self.get_feed(obj, request)
+                entry = (feed.writeString('utf-8'), feed.content_type)
+                cache.set(key, entry, FEED_CACHE_TIME)
+            response = HttpResponse(entry[0], content_type=entry[1])
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(
+            freshness.last_modified(changed))
+        return response
+
+    def item_title(self, item):
+        return Truncator(item.text).words(TITLE_WORDS)
+
+    def item_description(self, item):
+        return item.text
+
+    def item_link(self, item):
+        return reverse('posts:post_detail', args=[item.id])
+
+    def item_pubdate(self, item):
+        return item.pub_date
+
+    def item_author_name(self, item):
+        return item.author.get_full_name() or item.author.username
+
+    def item_author_link(self, item):
+        return reverse('posts:profile', args=[item.author.username])
+
+
+class GroupFeed(CachedFeed):
+    def get_object(self, request, slug):
+        return get_object_or_404(Group, slug=slug)
+
+    def scope(self, group):
+        return freshness.group_scope(group.id)
+
+    def title(self, group):
+        return group.title
+
+    def subtitle(self, group):
+        return group.description
+
+    def link(self, group):
+        return reverse('posts:group_list', args=[group.slug])
+
+    def items(self, group):
+        return sharding.all_shards(
+            group.posts.select_related('author'))[:FEED_LIMIT]
+
+
+class AuthorFeed(CachedFeed):
+    def get_object(self, request, username):
+        return get_object_or_404(User, username=username)
+
+    def scope(self, author):
+        return freshness.author_scope(author.id)
+
+    def title(self, author):
+        return f'Посты {author.get_full_name() or author.username}'
+
+    def link(self, author):
+        return reverse('posts:profile', args=[author.username])
+
+    def items(self, author):
+        posts = Post.objects.filter(author=author).select_related('author')
+        return sharding.author_posts(posts, author.id)[:FEED_LIMIT]
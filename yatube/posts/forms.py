@@ -1,6 +1,7 @@
 from django import forms
 
 from .models import Comment, Post
+from .uploads import downscale_upload, validate_image_upload
 
 
 class PostForm(forms.ModelForm):
@@ -8,6 +9,26 @@ class PostForm(forms.ModelForm):
         model = Post
         fields = ('text', 'group', 'image')
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['image'].validators.append(validate_image_upload)
+        # Обрезанный при загрузке файл не разбираем как картинку,
+        # а сразу отклоняем в clean_image.
+        self.rejected_upload = None
+        upload = self.files.get('image')
+        if getattr(upload, 'too_large', False):
+            self.files = self.files.copy()
+            del self.files['image']
+            self.rejected_upload = upload
+
+    def clean_image(self):
+        if self.rejected_upload is not None:
+            validate_image_upload(self.rejected_upload)
+        image = self.cleaned_data.get('image')
+        if image:
+            downscale_upload(image)
+        return image
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
@@ -0,0 +1,151 @@
+"""Моменты последнего изменения лент для условных HTTP-ответов.
+
+Для каждой области - вся лента, группа, автор, пост - в кеше хранится
+метка последнего изменения её постов. Её обновляют сигналы, а
+представления по ней отвечают 304, не выполняя запросов к постам.
+
+Метка - время изменения в микросекундах, и каждая новая метка области
+больше прежней: правки в одну секунду различает ETag, в который метка
+входит целиком. Last-Modified - целые секунды по часам, не позже
+самого ответа, сколько бы правок ни пришлось на секунду.
+"""
+import hashlib
+import time
+import uuid
+
+from django.core.cache import cache
+from django.middleware.csrf import get_token
+from django.utils.cache import (get_conditional_response, patch_cache_control,
+                                patch_vary_headers)
+from django.utils.http import http_date, quote_etag
+
+EPOCH_KEY = 'scopes_epoch'
+# Меток в секунде.
+SECOND = 10 ** 6
+ALL = 'all'
+# Сколько анонимная страница может отдаваться из кеша браузера или
+# прокси без перепроверки.
+PUBLIC_MAX_AGE = 60
+
+
+def group_scope(group_id):
+    return f'group:{group_id}'
+
+
+def author_scope(author_id):
+    return f'author:{author_id}'
+
+
+def post_scope(post_id):
+    return f'post:{post_id}'
+
+
+def post_scopes(post_id, author_id, group_id):
+    """Области, в которые попадает пост."""
+    scopes = [ALL, post_scope(post_id), author_scope(author_id)]
+    if group_id:
+        scopes.append(group_scope(group_id))
+    return scopes
+
+
+def _get_or_add(key, default):
+    value = cache.get(key)
+    if value is None:
+        value = default
+        if not cache.add(key, value, None):
+            value = cache.get(key, value)
+    return value
+
+
+def _key(scope):
+    epoch = _get_or_add(EPOCH_KEY, uuid.uuid4().hex)
+    # Метки в секундах прежнего формата под этим ключом не читаются.
+    return f'scope_stamp:{epoch}:{scope}'
+
+
+def _next_stamp(previous):
+    # Сдвиг вперёд часов - микросекунда на изменение, а не секунда.
+    return max(previous + 1, int(time.time() * SECOND))
+
+
+def changed_at(scope):
+    """Метка последнего изменения области, в микросекундах.
+
+    Для области без метки (например, после очистки кеша) заводится
+    метка по текущему времени: она позже всех выданных Last-Modified,
+    и клиенты один раз получат полный ответ.
+    """
+    key = _key(scope)
+    stamp = cache.get(key)
+    if stamp is None:
+        stamp = _get_or_add(key, _next_stamp(0))
+    return stamp
+
+
+def modified_second(stamp):
+    """Секунда изменения по метке, для сравнения с If-Modified-Since."""
+    return stamp // SECOND
+
+
+def last_modified(stamp):
+    """Значение Last-Modified по метке, целые секунды.
+
+    Пока секунда изменения не кончилась, в неё может попасть ещё одна
+    правка, и по дате её будет не отличить, поэтому до конца секунды
+    отдаётся предыдущая. If-Modified-Since с такой датой даст лишний
+    полный ответ, но не 304 на изменённую страницу, и заголовок
+    никогда не опережает момент ответа.
+    """
+    return min(modified_second(stamp), int(time.time()) - 1)
+
+
+def touch(*scopes):
+    keys = [_key(scope) for scope in scopes]
+    stamp = _next_stamp(max(cache.get_many(keys).values(), default=0))
+    cache.set_many(dict.fromkeys(keys, stamp), None)
+
+
+def touch_everything():
+    """Сбрасывает метки всех областей после массовых изменений."""
+    cache.set(EPOCH_KEY, uuid.uuid4().hex, None)
+
+
+def page_etag(request, changed):
+    """ETag страницы: метка изменения, адрес и, для вошедших, сессия."""
+    parts = [changed, request.get_full_path()]
+    if request.user.is_authenticated:
+        # В странице вошедшего пользователя есть его имя и CSRF-токен;
+        # get_token заводит cookie с токеном, если его ещё нет.
+        get_token(request)
+        parts += [request.user.pk, request.META['CSRF_COOKIE']]
+    raw = '|'.join(str(part) for part in parts)
+    return quote_etag(hashlib.sha1(raw.encode()).hexdigest())
+
+
+def conditional_page(request, scopes, build):
+    """Отвечает 304 по меткам scopes или строит страницу вызовом build.
+
+    Проверка идёт до выборки постов и отрисовки шаблона. Анонимные
+    страницы разрешено кешировать браузерам и прокси на PUBLIC_MAX_AGE
+    секунд, страницы вошедших пользователей - только браузеру и с
+    перепроверкой на каждом запросе.
+    """
+    if request.method not in ('GET', 'HEAD'):
+        return build()
+    changed = max(changed_at(scope) for scope in scopes)
+    etag = page_etag(request, changed)
+    response = get_conditional_response(
+        request, etag=etag, last_modified=modified_second(changed))
+    if response is None:
+        response = build()
+    if response.status_code not in (200, 304):
+        return response
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified(changed))
+    if request.user.is_authenticated:
+        patch_cache_control(response, private=True, no_cache=True)
+    else:
+        patch_cache_control(
+            response, public=True, max_age=PUBLIC_MAX_AGE)
+    patch_vary_headers(response, ('Cookie',))
+    return response
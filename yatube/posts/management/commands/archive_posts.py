@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from posts import archive
+
+
+class Command(BaseCommand):
+    help = (
+        'Пачками переносит старые посты без свежих комментариев вместе '
+        'с комментариями в архивные таблицы.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=None,
+            help='Возраст поста в днях; по умолчанию POST_ARCHIVE_DAYS.')
+        parser.add_argument(
+            '--batch-size', type=int, default=archive.ARCHIVE_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        moved = archive.archive_posts(
+            archive.cutoff(options['days']), options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Перенесено в архив постов: {moved}.'))
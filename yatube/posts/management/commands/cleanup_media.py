@@ -0,0 +1,57 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+from sorl.thumbnail import delete
+from sorl.thumbnail.images import ImageFile
+
+from posts import sharding
+from posts.models import ArchivedPost, Post
+
+# Файлы моложе этого возраста не удаляются, даже если на них никто
+# не ссылается: картинка сохраняется раньше, чем строка поста
+# фиксируется в базе, а .part-файл может ещё дописываться.
+FILE_GRACE_PERIOD = 60 * 60
+
+
+class Command(BaseCommand):
+    help = ('Удаляет картинки постов, на которые не ссылается ни один '
+            'пост, вместе с их миниатюрами.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать, что будет удалено.')
+
+    def walk(self, storage, directory):
+        directories, files = storage.listdir(directory)
+        for name in files:
+            yield os.path.join(directory, name)
+        for name in directories:
+            yield from self.walk(storage, os.path.join(directory, name))
+
+    def handle(self, *args, **options):
+        field = Post._meta.get_field('image')
+        storage = field.storage
+        directory = field.upload_to.rstrip('/')
+        if not storage.exists(directory):
+            return
+        references = set()
+        for alias in sharding.shards():
+            for model in (Post, ArchivedPost):
+                references.update(
+                    model.objects.using(alias).exclude(image='')
+                    .values_list('image', flat=True).order_by().distinct()
+                    .iterator())
+        removed = 0
+        for name in self.walk(storage, directory):
+            if name in references:
+                continue
+            age = time.time() - os.path.getmtime(storage.path(name))
+            if age < FILE_GRACE_PERIOD:
+                continue
+            removed += 1
+            self.stdout.write(name)
+            if not options['dry_run']:
+                delete(ImageFile(name, storage))
+        self.stdout.write(self.style.SUCCESS(f'Удалено файлов: {removed}.'))
@@ -0,0 +1,87 @@
+from contextlib import ExitStack
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test import RequestFactory
+
+from posts import sharding
+from posts.models import Follow, Group, Post, UserStats
+from posts.paginators import CURSOR_PARAM
+from posts.views import (comments_page, follow_page, group_page, index_page,
+                         profile_page)
+
+
+class Command(BaseCommand):
+    help = (
+        'Печатает EXPLAIN для запросов лент и страницы поста - тех, что '
+        'выполняют представления на первой и на следующей странице.'
+    )
+
+    def handle(self, *args, **options):
+        group = Group.objects.order_by('-posts_count').first()
+        stats = UserStats.objects.select_related('user')
+        author = stats.order_by('-posts_count').first()
+        reader = stats.order_by('-following_count').first()
+        post = Post.objects.order_by('-comments_count').first()
+        feeds = {'index': index_page}
+        if group:
+            feeds['group_posts'] = lambda request: group_page(request, group)
+        if author:
+            feeds['profile'] = lambda request: profile_page(
+                request, author.user, author.posts_count)
+        if reader:
+            feeds['follow_index'] = lambda request: follow_page(
+                request, reader.user)
+        if post:
+            feeds['post_detail: comments'] = lambda request: comments_page(
+                request, post.id, sharding.post_shard(post.id))
+        factory = RequestFactory()
+        for name, build in feeds.items():
+            page = self.explain(f'{name}: первая страница', build,
+                                factory.get('/'))
+            if not page.has_next():
+                continue
+            if getattr(page, 'is_cursor', False):
+                params = {CURSOR_PARAM: page.next_cursor()}
+            else:
+                params = {'page': page.next_page_number()}
+            self.explain(f'{name}: следующая страница', build,
+                         factory.get('/', params))
+        if reader:
+            self.explain(
+                'profile: following',
+                lambda request: Follow.objects.filter(
+                    author=reader.user, user=reader.user).exists(),
+                factory.get('/'))
+
+    def explain(self, name, build, request):
+        """Строит страницу как представление и разбирает её запросы.
+
+        Запросы перехватываются на всех соединениях с параметрами,
+        так что в план попадает то же условие по курсору, что и на сайте.
+        """
+        queries = []
+
+        def record(execute, sql, params, many, context):
+            queries.append((context['connection'], sql, params))
+            return execute(sql, params, many, context)
+
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(record))
+            result = build(request)
+            # Страница Paginator выбирает посты лениво, при отрисовке.
+            list(getattr(result, 'object_list', ()))
+        self.stdout.write(self.style.MIGRATE_HEADING(name))
+        for connection, sql, params in queries:
+            prefix = connection.ops.explain_query_prefix()
+            with connection.cursor() as cursor:
+                cursor.execute(f'{prefix} {sql}', params)
+                plan = '\n'.join(
+                    ' '.join(str(column) for column in row)
+                    for row in cursor.fetchall())
+            self.stdout.write(sql)
+            self.stdout.write(f'params: {params}')
+            self.stdout.write(plan)
+            self.stdout.write('')
+        return result
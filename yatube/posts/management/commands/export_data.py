@@ -0,0 +1,125 @@
+import datetime
+import json
+import os
+import shutil
+from functools import lru_cache
+
+from django.core.files import File
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+
+from posts import sharding
+from posts.bulk import keyset_scan
+from posts.models import (ArchivedComment, ArchivedPost, Comment, Follow,
+                          Group, Post, User)
+from posts.storage import content_hash
+
+DATA_FILE = 'data.ndjson'
+MEDIA_DIR = 'media'
+CHUNK_SIZE = 2000
+# Столько хешей картинок помнится, чтобы не читать общие файлы заново.
+IMAGE_CACHE_SIZE = 4096
+
+
+class ExportEncoder(DjangoJSONEncoder):
+    """Даты пишутся с микросекундами: от них зависит порядок лент."""
+
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+class Command(BaseCommand):
+    help = (
+        'Потоково выгружает пользователей, группы, посты, комментарии '
+        'и подписки в NDJSON, копируя картинки постов рядом.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Каталог для выгрузки.')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        if sharding.enabled():
+            raise CommandError(sharding.SINGLE_DATABASE_ONLY)
+        self.path = options['path']
+        chunk_size = options['chunk_size']
+        os.makedirs(os.path.join(self.path, MEDIA_DIR), exist_ok=True)
+        self.copy_image = lru_cache(IMAGE_CACHE_SIZE)(self.copy_image)
+        sources = (
+            ('user', User.objects.values(
+                'id', 'username', 'first_name', 'last_name', 'email',
+                'date_joined'), self.user),
+            ('group', Group.objects.values(
+                'id', 'title', 'slug', 'description'), self.group),
+            # Архив выгружается как обычные посты и комментарии.
+            ('post', Post.objects.values(
+                'id', 'text', 'pub_date', 'author__username',
+                'group__slug', 'image'), self.post),
+            ('post', ArchivedPost.objects.values(
+                'id', 'text', 'pub_date', 'author__username',
+                'group__slug', 'image'), self.post),
+            ('comment', Comment.objects.values(
+                'id', 'post_id', 'author__username', 'text', 'pub_date'),
+             self.comment),
+            ('comment', ArchivedComment.objects.values(
+                'id', 'post_id', 'author__username', 'text', 'pub_date'),
+             self.comment),
+            ('follow', Follow.objects.values(
+                'id', 'user__username', 'author__username'), self.follow),
+        )
+        with open(os.path.join(self.path, DATA_FILE), 'w',
+                  encoding='utf-8') as output:
+            for model, queryset, convert in sources:
+                count = 0
+                for row in keyset_scan(queryset, chunk_size):
+                    record = convert(row)
+                    record['model'] = model
+                    output.write(json.dumps(
+                        record, cls=ExportEncoder, ensure_ascii=False))
+                    output.write('\n')
+                    count += 1
+                self.stdout.write(f'{model}: {count}')
+        self.stdout.write(self.style.SUCCESS('Выгрузка завершена.'))
+
+    def copy_image(self, name):
+        """Копирует картинку в выгрузку и возвращает её sha256."""
+        target = os.path.join(self.path, MEDIA_DIR, name)
+        if not os.path.exists(target):
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with Post.image.field.storage.open(name) as source, open(
+                    target, 'wb') as destination:
+                shutil.copyfileobj(source, destination)
+        with open(target, 'rb') as file:
+            return content_hash(File(file))
+
+    def user(self, row):
+        del row['id']
+        return row
+
+    def group(self, row):
+        del row['id']
+        return row
+
+    def post(self, row):
+        row['author'] = row.pop('author__username')
+        row['group'] = row.pop('group__slug')
+        if row['image']:
+            try:
+                row['image_sha256'] = self.copy_image(row['image'])
+            except OSError:
+                self.stderr.write(f'Нет файла картинки {row["image"]}')
+                row['image'] = ''
+        return row
+
+    def comment(self, row):
+        row['post'] = row.pop('post_id')
+        row['author'] = row.pop('author__username')
+        return row
+
+    def follow(self, row):
+        return {
+            'user': row['user__username'],
+            'author': row['author__username'],
+        }
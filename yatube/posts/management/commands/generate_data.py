@@ -0,0 +1,173 @@
+import io
+import random
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image
+
+from posts import freshness, sharding
+from posts.bulk import batches, explicit_dates
+from posts.counters import rebuild_counters
+from posts.models import Comment, Follow, Group, Post, User
+from posts.page_cache import bump_feed_version
+from posts.search import rebuild_search_index
+from posts.timeline import rebuild_timelines
+
+WORDS = (
+    'день', 'город', 'вечер', 'дорога', 'книга', 'море', 'работа', 'дом',
+    'друг', 'новость', 'история', 'погода', 'фото', 'музыка', 'поезд',
+    'утро', 'кофе', 'лес', 'проект', 'встреча', 'выходные', 'кино',
+)
+# Показатель перекоса: чем больше, тем сильнее посты, подписчики
+# и комментарии сосредоточены у немногих популярных авторов и постов.
+SKEW = 3
+DATE_RANGE = timedelta(days=365)
+IMAGE_SIZE = (1280, 720)
+
+
+def skewed(rng, count):
+    """Индекс в диапазоне [0, count) со степенным распределением."""
+    return int(count * rng.random() ** SKEW)
+
+
+class Command(BaseCommand):
+    help = (
+        'Массово создаёт синтетические данные для нагрузочных тестов: '
+        'пользователей, группы, посты, картинки, комментарии и подписки.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--groups', type=int, default=20)
+        parser.add_argument('--posts', type=int, default=100000)
+        parser.add_argument('--comments', type=int, default=200000)
+        parser.add_argument('--follows', type=int, default=20000)
+        parser.add_argument(
+            '--images', type=int, default=20,
+            help='Число разных картинок, общих для постов.')
+        parser.add_argument(
+            '--image-share', type=float, default=0.2,
+            help='Доля постов с картинкой.')
+        parser.add_argument(
+            '--batch-size', type=int, default=5000,
+            help='Сколько постов и комментариев держать в памяти.')
+        parser.add_argument('--prefix', default='bench')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if sharding.enabled():
+            raise CommandError(sharding.SINGLE_DATABASE_ONLY)
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.prefix = options['prefix']
+        self.now = timezone.now()
+        with transaction.atomic(), explicit_dates(Post, Comment):
+            user_ids = self.create_users(options['users'])
+            groups = self.create_groups(options['groups'])
+            images = self.create_images(options['images'])
+            post_ids = self.create_posts(
+                options['posts'], user_ids, groups, images,
+                options['image_share'])
+            self.create_comments(options['comments'], user_ids, post_ids)
+            self.create_follows(options['follows'], user_ids)
+            self.stdout.write('Пересчёт счётчиков, лент и индекса...')
+            rebuild_counters()
+            rebuild_timelines()
+            rebuild_search_index()
+        bump_feed_version()
+        freshness.touch_everything()
+        self.stdout.write(self.style.SUCCESS('Данные созданы.'))
+
+    def text(self, words):
+        return ' '.join(self.rng.choice(WORDS) for _ in range(words))
+
+    def pub_date(self):
+        return self.now - DATE_RANGE * self.rng.random()
+
+    def create_users(self, count):
+        # Хеш одного пароля на всех: make_password медленный.
+        password = make_password(self.prefix)
+        start = User.objects.filter(
+            username__startswith=self.prefix).count()
+        User.objects.bulk_create(
+            (User(username=f'{self.prefix}{start + i}', password=password)
+             for i in range(count)))
+        self.stdout.write(f'Пользователей: {count}')
+        return list(User.objects.filter(
+            username__startswith=self.prefix).order_by(
+            'id').values_list('id', flat=True))
+
+    def create_groups(self, count):
+        start = Group.objects.filter(slug__startswith=self.prefix).count()
+        Group.objects.bulk_create(
+            Group(title=f'Группа {start + i}',
+                  slug=f'{self.prefix}-{start + i}',
+                  description=self.text(10))
+            for i in range(count))
+        self.stdout.write(f'Групп: {count}')
+        return list(Group.objects.filter(
+            slug__startswith=self.prefix).values_list('id', flat=True))
+
+    def create_images(self, count):
+        """Сохраняет картинки один раз; посты ссылаются на их имена."""
+        names = []
+        for _ in range(count):
+            color = tuple(self.rng.randrange(256) for _ in range(3))
+            buffer = io.BytesIO()
+            Image.new('RGB', IMAGE_SIZE, color).save(buffer, 'JPEG')
+            names.append(Post.image.field.storage.save(
+                'posts/bench.jpg', ContentFile(buffer.getvalue())))
+        self.stdout.write(f'Картинок: {count}')
+        return names
+
+    def create_posts(self, count, user_ids, groups, images, image_share):
+        first_id = (Post.objects.order_by('-id').values_list(
+            'id', flat=True).first() or 0) + 1
+        for size in batches(count, self.batch_size):
+            posts = []
+            for _ in range(size):
+                has_image = images and self.rng.random() < image_share
+                posts.append(Post(
+                    author_id=user_ids[skewed(self.rng, len(user_ids))],
+                    group_id=(self.rng.choice(groups)
+                              if groups and self.rng.random() < 0.7
+                              else None),
+                    text=self.text(self.rng.randint(5, 60)),
+                    image=self.rng.choice(images) if has_image else '',
+                    pub_date=self.pub_date()))
+            Post.objects.bulk_create(posts)
+        self.stdout.write(f'Постов: {count}')
+        return list(Post.objects.filter(id__gte=first_id).order_by(
+            'id').values_list('id', flat=True))
+
+    def create_comments(self, count, user_ids, post_ids):
+        if not post_ids:
+            return
+        for size in batches(count, self.batch_size):
+            Comment.objects.bulk_create(
+                Comment(post_id=post_ids[skewed(self.rng, len(post_ids))],
+                        author_id=self.rng.choice(user_ids),
+                        text=self.text(self.rng.randint(3, 30)),
+                        pub_date=self.pub_date())
+                for _ in range(size))
+        self.stdout.write(f'Комментариев: {count}')
+
+    def create_follows(self, count, user_ids):
+        """Подписки с перекосом: у немногих авторов много подписчиков."""
+        pairs = set()
+        for _ in range(count * 2):
+            if len(pairs) >= count:
+                break
+            author_id = user_ids[skewed(self.rng, len(user_ids))]
+            user_id = self.rng.choice(user_ids)
+            if user_id != author_id:
+                pairs.add((user_id, author_id))
+        Follow.objects.bulk_create(
+            (Follow(user_id=user_id, author_id=author_id)
+             for user_id, author_id in pairs),
+            ignore_conflicts=True)
+        self.stdout.write(f'Подписок: {len(pairs)}')
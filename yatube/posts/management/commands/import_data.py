@@ -0,0 +1,188 @@
+import json
+import os
+from functools import lru_cache
+
+from django.contrib.auth.hashers import make_password
+from django.core.files import File
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils.dateparse import parse_datetime
+
+from posts.bulk import explicit_dates
+from posts import freshness, sharding
+from posts.counters import recount_groups, recount_posts, recount_users
+from posts.management.commands.export_data import (CHUNK_SIZE, DATA_FILE,
+                                                   IMAGE_CACHE_SIZE,
+                                                   MEDIA_DIR)
+from posts.models import (ArchivedComment, ArchivedPost, Comment, Follow,
+                          Group, Post, PostTerm, User)
+from posts.page_cache import bump_feed_version
+from posts.search import post_terms
+from posts.storage import content_hash
+from posts.timeline import backfill_timelines, fan_out_posts
+
+
+class Command(BaseCommand):
+    help = (
+        'Загружает выгрузку export_data: записи идут пачками через '
+        'bulk_create, каждая пачка в своей транзакции вместе со своими '
+        'счётчиками, лентами и поисковым индексом. Посты и комментарии '
+        'с занятыми id получают новые.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Каталог с выгрузкой.')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        if sharding.enabled():
+            raise CommandError(sharding.SINGLE_DATABASE_ONLY)
+        self.path = options['path']
+        chunk_size = options['chunk_size']
+        self.password = make_password(None)
+        self.groups = {}
+        self.post_shift = self.id_shift(Post, ArchivedPost)
+        self.comment_shift = self.id_shift(Comment, ArchivedComment)
+        self.import_image = lru_cache(IMAGE_CACHE_SIZE)(self.import_image)
+        loaders = {
+            'user': self.load_users,
+            'group': self.load_groups,
+            'post': self.load_posts,
+            'comment': self.load_comments,
+            'follow': self.load_follows,
+        }
+        counts = dict.fromkeys(loaders, 0)
+        model, batch = None, []
+        with open(os.path.join(self.path, DATA_FILE),
+                  encoding='utf-8') as data, explicit_dates(Post, Comment):
+            for line in data:
+                record = json.loads(line)
+                if batch and (record['model'] != model
+                              or len(batch) >= chunk_size):
+                    self.flush(loaders[model], batch)
+                    batch = []
+                model = record.pop('model')
+                if model not in loaders:
+                    raise CommandError(f'Неизвестный тип записи: {model}')
+                batch.append(record)
+                counts[model] += 1
+            if batch:
+                self.flush(loaders[model], batch)
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(
+                    no_style(), [Post, Comment]):
+                cursor.execute(sql)
+        bump_feed_version()
+        freshness.touch_everything()
+        for model, count in counts.items():
+            self.stdout.write(f'{model}: {count}')
+        self.stdout.write(self.style.SUCCESS('Загрузка завершена.'))
+
+    def flush(self, loader, batch):
+        with transaction.atomic():
+            loader(batch)
+
+    def user_ids(self, usernames):
+        """id пользователей по именам; недостающие создаются."""
+        usernames = set(usernames)
+        found = dict(User.objects.filter(
+            username__in=usernames).values_list('username', 'id'))
+        missing = usernames - set(found)
+        if missing:
+            self.load_users([{'username': name} for name in missing])
+            found.update(User.objects.filter(
+                username__in=missing).values_list('username', 'id'))
+        return found
+
+    def group_id(self, slug):
+        if slug is None:
+            return None
+        if slug not in self.groups:
+            self.groups[slug] = Group.objects.values_list(
+                'id', flat=True).get(slug=slug)
+        return self.groups[slug]
+
+    def import_image(self, name, digest):
+        """Копирует картинку из выгрузки в хранилище, сверяя хеш."""
+        storage = Post.image.field.storage
+        if storage.exists(name):
+            return name
+        with open(os.path.join(self.path, MEDIA_DIR, name), 'rb') as file:
+            file = File(file)
+            if content_hash(file) != digest:
+                raise CommandError(f'Хеш картинки {name} не совпадает.')
+            file.content_hash = digest
+            return storage.save(name, file)
+
+    def id_shift(self, *models):
+        """Сдвиг id выгрузки за наибольший id, уже занятый в models.
+
+        Иначе bulk_create(ignore_conflicts=True) молча пропустил бы
+        записи с занятыми id, а комментарии попали бы к чужому посту.
+        Сдвиг один на всю загрузку, а не словарь замен: память не
+        растёт с числом записей. В пустую базу id переносятся как есть.
+        """
+        return max(model.objects.aggregate(last=Max('id'))['last'] or 0
+                   for model in models)
+
+    def load_users(self, records):
+        User.objects.bulk_create(
+            (User(password=self.password, **record) for record in records),
+            ignore_conflicts=True)
+        # bulk_create не шлёт post_save, и строки счётчиков заводятся здесь.
+        recount_users(list(User.objects.filter(
+            username__in=[record['username'] for record in records],
+            stats__isnull=True).values_list('id', flat=True)))
+
+    def load_groups(self, records):
+        Group.objects.bulk_create(
+            (Group(**record) for record in records), ignore_conflicts=True)
+
+    def load_posts(self, records):
+        authors = self.user_ids(record['author'] for record in records)
+        posts = []
+        for record in records:
+            image = record['image']
+            if image:
+                image = self.import_image(image, record['image_sha256'])
+            posts.append(Post(
+                id=record['id'] + self.post_shift,
+                text=record['text'],
+                pub_date=parse_datetime(record['pub_date']),
+                author_id=authors[record['author']],
+                group_id=self.group_id(record['group']),
+                image=image))
+        Post.objects.bulk_create(posts)
+        PostTerm.objects.bulk_create(
+            term for post in posts for term in post_terms(post.id, post.text))
+        recount_users(list(set(authors.values())))
+        recount_groups({post.group_id for post in posts if post.group_id})
+        fan_out_posts(posts)
+
+    def load_comments(self, records):
+        authors = self.user_ids(record['author'] for record in records)
+        comments = [
+            Comment(id=record['id'] + self.comment_shift,
+                    post_id=record['post'] + self.post_shift,
+                    author_id=authors[record['author']],
+                    text=record['text'],
+                    pub_date=parse_datetime(record['pub_date']))
+            for record in records
+        ]
+        Comment.objects.bulk_create(comments)
+        recount_posts({comment.post_id for comment in comments})
+
+    def load_follows(self, records):
+        users = self.user_ids(
+            name for record in records
+            for name in (record['user'], record['author']))
+        follows = {(users[record['user']], users[record['author']])
+                   for record in records}
+        Follow.objects.bulk_create(
+            (Follow(user_id=user_id, author_id=author_id)
+             for user_id, author_id in follows),
+            ignore_conflicts=True)
+        recount_users(list({user_id for pair in follows for user_id in pair}))
+        backfill_timelines(follows)
@@ -0,0 +1,157 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from posts import sharding
+from posts.bulk import explicit_dates
+from posts.models import (ArchivedComment, ArchivedPost, Comment, Post,
+                          PostTerm, User)
+from posts.search import post_terms
+
+# Поля, по которым видно, что пост изменился после копирования.
+POST_SIGNATURE = ('version', 'comments_count')
+
+
+class Command(BaseCommand):
+    help = (
+        'Переносит посты автора и комментарии к ним в другой шард, не '
+        'останавливая сайт: сначала копирует данные, затем под '
+        'блокировкой записи исходного шарда докопирует изменения, '
+        'переключает автора и удаляет его записи из старого шарда.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('alias', help='Алиас шарда назначения.')
+        parser.add_argument(
+            '--chunk-size', type=int, default=sharding.COPY_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        if not sharding.enabled():
+            raise CommandError('Шардирование выключено (POST_SHARDS).')
+        target = options['alias']
+        if target not in settings.POST_SHARDS:
+            raise CommandError(f'Нет шарда {target}.')
+        try:
+            author = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f'Нет автора {options["username"]}.')
+        self.chunk_size = options['chunk_size']
+        source = sharding.shard_for(author.id)
+        if source == target:
+            self.stdout.write(f'Автор уже в шарде {target}.')
+            return
+        sharding.copy_reference(target)
+        with explicit_dates(Post, Comment):
+            copied = self.sync(author.id, source, target)
+            self.stdout.write(f'Скопировано постов: {copied}')
+            # BEGIN IMMEDIATE бэкенда core.sqlite держит запись в исходный
+            # шард, пока автор переключается.
+            with transaction.atomic(using=source):
+                self.sync(author.id, source, target)
+                sharding.assign_shard(author.id, target)
+                self.purge(author.id, source)
+            # Запросы, выбравшие старый шард до переключения, могли
+            # дописать в него после снятия блокировки. Новые записи
+            # роутер уже ведёт в target, так что дочистка сходится.
+            while True:
+                with transaction.atomic(using=source):
+                    moved = self.sync(
+                        author.id, source, target, prune=False)
+                    self.purge(author.id, source)
+                if not moved:
+                    break
+        self.stdout.write(self.style.SUCCESS(
+            f'Автор {author.username} перенесён: {source} -> {target}.'))
+
+    def chunks(self, ids):
+        ids = sorted(ids)
+        for start in range(0, len(ids), self.chunk_size):
+            yield ids[start:start + self.chunk_size]
+
+    def sync(self, author_id, source, target, prune=True):
+        """Приводит записи автора в target к source.
+
+        prune удаляет из target то, чего уже нет в source; после
+        переключения это выключено - в target идут новые записи.
+        Возвращает число скопированных или обновлённых записей.
+        """
+        posts = Post.objects.filter(author_id=author_id)
+        comments = Comment.objects.filter(post__author_id=author_id)
+        wanted = dict(
+            (row[0], row[1:]) for row in posts.using(source).values_list(
+                'id', *POST_SIGNATURE))
+        present = dict(
+            (row[0], row[1:]) for row in posts.using(target).values_list(
+                'id', *POST_SIGNATURE))
+        changed = [
+            post_id for post_id, signature in wanted.items()
+            if present.get(post_id) != signature
+        ]
+        for chunk in self.chunks(changed):
+            with transaction.atomic(using=target):
+                batch = list(posts.using(source).filter(id__in=chunk))
+                sharding.copy_rows(Post, batch, target)
+                terms = PostTerm.objects.using(target)
+                terms.filter(post_id__in=chunk).delete()
+                terms.bulk_create([
+                    term for post in batch
+                    for term in post_terms(post.id, post.text)
+                ])
+        wanted_comments = set(
+            comments.using(source).values_list('id', flat=True))
+        present_comments = set(
+            comments.using(target).values_list('id', flat=True))
+        new_comments = wanted_comments - present_comments
+        for chunk in self.chunks(new_comments):
+            sharding.copy_rows(
+                Comment, comments.using(source).filter(id__in=chunk), target)
+        copied = len(changed) + len(new_comments)
+        # Архив не меняется на месте: достаточно сверить id.
+        archived = (
+            ArchivedPost.objects.filter(author_id=author_id),
+            ArchivedComment.objects.filter(post__author_id=author_id),
+        )
+        archived_gone = []
+        for rows in archived:
+            wanted_ids = set(rows.using(source).values_list('id', flat=True))
+            present_ids = set(
+                rows.using(target).values_list('id', flat=True))
+            for chunk in self.chunks(wanted_ids - present_ids):
+                sharding.copy_rows(
+                    rows.model, rows.using(source).filter(id__in=chunk),
+                    target)
+            copied += len(wanted_ids - present_ids)
+            archived_gone.append((rows, present_ids - wanted_ids))
+        if not prune:
+            return copied
+        # Удалённое в источнике за время копирования.
+        with transaction.atomic(using=target):
+            self.delete(
+                comments.using(target),
+                present_comments - wanted_comments)
+            gone = set(present) - set(wanted)
+            self.delete(PostTerm.objects.using(target), gone, 'post_id')
+            self.delete(Comment.objects.using(target), gone, 'post_id')
+            self.delete(posts.using(target), gone)
+            for rows, ids in reversed(archived_gone):
+                self.delete(rows.using(target), ids)
+        return copied
+
+    def delete(self, queryset, ids, field='id'):
+        # Без сигналов: записи не исчезают, а переезжают, и счётчики
+        # трогать нельзя.
+        for chunk in self.chunks(ids):
+            filtered = queryset.filter(**{f'{field}__in': chunk})
+            filtered._raw_delete(filtered.db)
+
+    def purge(self, author_id, source):
+        """Удаляет записи автора из исходного шарда."""
+        for model, lookup in ((PostTerm, 'post__author_id'),
+                              (Comment, 'post__author_id'),
+                              (Post, 'author_id'),
+                              (ArchivedComment, 'post__author_id'),
+                              (ArchivedPost, 'author_id')):
+            queryset = model.objects.using(source).filter(
+                **{lookup: author_id})
+            queryset._raw_delete(queryset.db)
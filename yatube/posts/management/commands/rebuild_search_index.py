@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from posts.search import rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = 'Заново строит поисковый индекс постов.'
+
+    def handle(self, *args, **options):
+        rebuild_search_index()
+        self.stdout.write(self.style.SUCCESS('Поисковый индекс построен.'))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import archive
+from posts.models import ArchivedPost
+
+
+class Command(BaseCommand):
+    help = 'Возвращает пост с комментариями из архива.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('post_id', type=int)
+
+    def handle(self, *args, **options):
+        try:
+            post = archive.restore_post(options['post_id'])
+        except ArchivedPost.DoesNotExist:
+            raise CommandError(f'Поста {options["post_id"]} нет в архиве.')
+        self.stdout.write(self.style.SUCCESS(f'Пост {post.id} восстановлен.'))
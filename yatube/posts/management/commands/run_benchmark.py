@@ -0,0 +1,296 @@
+import asyncio
+import json
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+
+from core.asgi import ASGIHandler
+from core.testing import AsgiClient
+from posts.models import Comment, Follow, Group, Post, User, UserStats
+
+SCENARIOS = (
+    'index', 'group_posts', 'profile', 'post_detail', 'follow_index',
+    'post_create',
+)
+PERCENTILES = (50, 95, 99)
+# Рост p95 больше чем на эту долю при сравнении считается регрессией.
+REGRESSION_THRESHOLD = 0.1
+# Сколько страниц главной клиент листает по курсорам, прежде чем
+# вернуться на первую.
+INDEX_DEPTH = 5
+# Сценарии, которые идут от вошедшего пользователя: в index это
+# обходит кеш страниц анонимов и меряет саму курсорную выборку.
+LOGIN_SCENARIOS = ('index', 'follow_index', 'post_create')
+NEXT_CURSOR = re.compile(r'cursor=([\w-]+)">\s*Следующая')
+
+
+def percentile(values, percent):
+    """Перцентиль по рангу для отсортированного списка."""
+    if not values:
+        return None
+    rank = max(int(round(percent / 100 * len(values))) - 1, 0)
+    return values[rank]
+
+
+class Dataset:
+    """Образцы адресов и пользователей, по которым ходят клиенты."""
+
+    def __init__(self, size):
+        self.groups = list(Group.objects.order_by(
+            '-posts_count').values_list('slug', flat=True)[:size])
+        stats = UserStats.objects.select_related('user')
+        self.authors = [s.user.username for s in stats.order_by(
+            '-posts_count')[:size]]
+        self.posts = list(Post.objects.order_by(
+            '-comments_count').values_list('id', flat=True)[:size])
+        reader = stats.order_by('-following_count').first()
+        self.reader = reader.user if reader else None
+        if not (self.groups and self.authors and self.posts
+                and self.reader):
+            raise CommandError(
+                'Нет данных для нагрузки: запустите generate_data.')
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагружает ленты и страницы постов параллельными клиентами и '
+        'сохраняет перцентили задержки и пропускную способность в JSON.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scenario', action='append', choices=SCENARIOS,
+            help='Сценарий; по умолчанию все.')
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--warmup', type=int, default=10)
+        parser.add_argument(
+            '--writers', type=int, default=0,
+            help='Сколько клиентов всё время замера создают посты.')
+        parser.add_argument(
+            '--sample', type=int, default=100,
+            help='Сколько групп, авторов и постов берут клиенты.')
+        parser.add_argument(
+            '--asgi', action='store_true',
+            help='Слать запросы через ASGI-приложение, а не WSGI.')
+        parser.add_argument('--output', help='Файл для результатов JSON.')
+        parser.add_argument(
+            '--compare', help='JSON прошлого прогона для сравнения.')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        dataset = Dataset(options['sample'])
+        self.rng = random.Random(options['seed'])
+        self.rng_lock = threading.Lock()
+        self.loop = None
+        if options['asgi']:
+            self.start_asgi()
+        try:
+            results = self.run_all(dataset, options)
+        finally:
+            if options['asgi']:
+                self.stop_asgi()
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump(results, file, ensure_ascii=False, indent=2)
+        if options['compare']:
+            self.compare(options['compare'], results)
+
+    def start_asgi(self):
+        """Запускает ASGI-приложение в цикле событий своего потока.
+
+        Клиенты шлют запросы в этот цикл, как в ASGI-сервер.
+        """
+        self.application = ASGIHandler()
+        self.loop = asyncio.new_event_loop()
+        self.loop_thread = threading.Thread(
+            target=self.loop.run_forever, name='asgi-loop')
+        self.loop_thread.start()
+
+    def stop_asgi(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.loop_thread.join()
+        self.loop.close()
+        self.application.executor.shutdown()
+
+    def client(self):
+        if self.loop is None:
+            return Client()
+        return AsgiClient(self.application, self.loop)
+
+    def clients(self, count, dataset, login):
+        """Клиенты замера, при login - уже вошедшие.
+
+        Входы идут по очереди и до замера: каждый пишет строку сессии,
+        и одновременные входы упирались бы в блокировку таблицы сессий.
+        """
+        clients = [self.client() for _ in range(count)]
+        if login:
+            for client in clients:
+                client.force_login(dataset.reader)
+        return clients
+
+    def run_all(self, dataset, options):
+        results = {
+            'started': timezone.now().isoformat(),
+            'options': {
+                key: options[key]
+                for key in (
+                    'requests', 'concurrency', 'warmup', 'writers', 'asgi',
+                    'seed')
+            },
+            'dataset': {
+                'users': User.objects.count(),
+                'groups': Group.objects.count(),
+                'posts': Post.objects.count(),
+                'comments': Comment.objects.count(),
+                'follows': Follow.objects.count(),
+            },
+            'scenarios': {},
+        }
+        for scenario in options['scenario'] or SCENARIOS:
+            self.run(scenario, dataset, options['warmup'], 1)
+            summary = self.run(
+                scenario, dataset, options['requests'],
+                options['concurrency'], options['writers'])
+            results['scenarios'][scenario] = summary
+            self.stdout.write(
+                f'{scenario:>13}: p50 {summary["p50_ms"]:.1f} мс, '
+                f'p95 {summary["p95_ms"]:.1f} мс, '
+                f'p99 {summary["p99_ms"]:.1f} мс, '
+                f'{summary["rps"]:.1f} запросов/с, '
+                f'ошибок {summary["errors"]}')
+            if options['writers']:
+                self.stdout.write(
+                    f'{"":>13}  записей {summary["writes"]}, '
+                    f'ошибок записи {summary["write_errors"]}')
+        return results
+
+    def choice(self, values):
+        with self.rng_lock:
+            return self.rng.choice(values)
+
+    def request(self, client, scenario, dataset):
+        """Выполняет запрос сценария и возвращает код ответа."""
+        if scenario == 'index':
+            return self.follow_cursor(client, reverse('posts:index'))
+        if scenario == 'group_posts':
+            slug = self.choice(dataset.groups)
+            return client.get(
+                reverse('posts:group_list', args=[slug])).status_code
+        if scenario == 'profile':
+            username = self.choice(dataset.authors)
+            return client.get(
+                reverse('posts:profile', args=[username])).status_code
+        if scenario == 'post_detail':
+            post_id = self.choice(dataset.posts)
+            return client.get(
+                reverse('posts:post_detail', args=[post_id])).status_code
+        if scenario == 'follow_index':
+            return client.get(reverse('posts:follow_index')).status_code
+        return client.post(
+            reverse('posts:post_create'),
+            {'text': 'Нагрузочный пост'}).status_code
+
+    def follow_cursor(self, client, url):
+        """Листает ленту вперёд по ссылкам «Следующая», как читатель.
+
+        Курсор следующей страницы берётся из прошлого ответа этого же
+        клиента; после INDEX_DEPTH страниц или конца ленты - снова первая.
+        """
+        cursor, depth = getattr(client, 'feed_position', ('', 0))
+        response = client.get(url, {'cursor': cursor} if cursor else {})
+        match = NEXT_CURSOR.search(response.content.decode())
+        if match and depth + 1 < INDEX_DEPTH:
+            client.feed_position = (match.group(1), depth + 1)
+        else:
+            client.feed_position = ('', 0)
+        return response.status_code
+
+    def worker(self, scenario, dataset, client, count):
+        latencies, errors = [], 0
+        try:
+            for _ in range(count):
+                start = time.perf_counter()
+                status = self.request(client, scenario, dataset)
+                latencies.append(time.perf_counter() - start)
+                if status >= 400:
+                    errors += 1
+        finally:
+            connection.close()
+        return latencies, errors
+
+    def writer(self, dataset, client, stop):
+        """Создаёт посты, пока не выставлен stop: фоновая запись."""
+        writes, errors = 0, 0
+        try:
+            while not stop.is_set():
+                status = self.request(client, 'post_create', dataset)
+                writes += 1
+                if status >= 400:
+                    errors += 1
+        finally:
+            connection.close()
+        return writes, errors
+
+    def run(self, scenario, dataset, requests, concurrency, writers=0):
+        shares = [requests // concurrency] * concurrency
+        for i in range(requests % concurrency):
+            shares[i] += 1
+        clients = self.clients(
+            concurrency, dataset, scenario in LOGIN_SCENARIOS)
+        writer_clients = self.clients(writers, dataset, True)
+        stop = threading.Event()
+        with ThreadPoolExecutor(max_workers=writers or 1) as background:
+            writes = [
+                background.submit(self.writer, dataset, client, stop)
+                for client in writer_clients
+            ]
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                outcomes = list(executor.map(
+                    lambda client, count: self.worker(
+                        scenario, dataset, client, count),
+                    clients, shares))
+            elapsed = time.perf_counter() - start
+            stop.set()
+            writes = [future.result() for future in writes]
+        latencies = sorted(
+            latency for worker_latencies, _ in outcomes
+            for latency in worker_latencies)
+        summary = {
+            'requests': len(latencies),
+            'errors': sum(errors for _, errors in outcomes),
+            'rps': len(latencies) / elapsed if elapsed else 0.0,
+        }
+        if writers:
+            summary['writes'] = sum(count for count, _ in writes)
+            summary['write_errors'] = sum(errors for _, errors in writes)
+        for percent in PERCENTILES:
+            value = percentile(latencies, percent)
+            summary[f'p{percent}_ms'] = value * 1000 if value else 0.0
+        return summary
+
+    def compare(self, path, results):
+        with open(path) as file:
+            previous = json.load(file)['scenarios']
+        for scenario, summary in results['scenarios'].items():
+            if scenario not in previous or not previous[scenario]['p95_ms']:
+                continue
+            change = summary['p95_ms'] / previous[scenario]['p95_ms'] - 1
+            message = f'{scenario:>13}: p95 {change:+.0%}'
+            if previous[scenario]['rps']:
+                throughput = summary['rps'] / previous[scenario]['rps'] - 1
+                message += f', пропускная способность {throughput:+.0%}'
+            if change > REGRESSION_THRESHOLD:
+                self.stdout.write(self.style.ERROR(message + ' регрессия'))
+            else:
+                self.stdout.write(message)
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from posts import timeline
+
+
+class Command(BaseCommand):
+    help = (
+        'Обрезает ленты подписок длиннее TIMELINE_LIMIT записей. '
+        'Запускается периодически: публикация поста ленты не обрезает.'
+    )
+
+    def handle(self, *args, **options):
+        trimmed = timeline.trim_timelines()
+        self.stdout.write(self.style.SUCCESS(
+            f'Обрезано лент: {trimmed}.'))
@@ -0,0 +1,60 @@
+# Generated by Django 2.2.9 on 2026-10-18 05:03
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+TIMELINE_LIMIT = 1000
+
+
+def fill_timelines(apps, schema_editor):
+    Follow = apps.get_model('posts', 'Follow')
+    Post = apps.get_model('posts', 'Post')
+    TimelineEntry = apps.get_model('posts', 'TimelineEntry')
+    for user_id in Follow.objects.values_list(
+            'user_id', flat=True).distinct():
+        authors = Follow.objects.filter(user_id=user_id).values('author')
+        posts = Post.objects.filter(author__in=authors).order_by(
+            '-pub_date').values_list('id', 'pub_date')[:TIMELINE_LIMIT]
+        TimelineEntry.objects.bulk_create(
+            [TimelineEntry(user_id=user_id, post_id=post_id, pub_date=date)
+             for post_id, date in posts],
+            ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0008_follow'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='comment',
+            name='post',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='comments', to='posts.Post'),
+        ),
+        migrations.AlterField(
+            model_name='follow',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='follower', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь'),
+        ),
+        migrations.CreateModel(
+            name='TimelineEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pub_date', models.DateTimeField(verbose_name='Дата публикации')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to='posts.Post', verbose_name='Пост')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Запись ленты',
+                'verbose_name_plural': 'Ленты подписок',
+                'ordering': ['-pub_date'],
+                'unique_together': {('user', 'post')},
+                'index_together': {('user', 'pub_date')},
+            },
+        ),
+        migrations.RunPython(fill_timelines, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 2.2.9 on 2026-10-18 05:04
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count(queryset, field):
+    counted = (queryset.filter(**{field: OuterRef('pk')})
+               .order_by().values(field).annotate(total=Count('pk'))
+               .values('total'))
+    return Coalesce(Subquery(counted), 0)
+
+
+def fill_counters(apps, schema_editor):
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    Comment = apps.get_model('posts', 'Comment')
+    Follow = apps.get_model('posts', 'Follow')
+    Group = apps.get_model('posts', 'Group')
+    Post = apps.get_model('posts', 'Post')
+    UserStats = apps.get_model('posts', 'UserStats')
+    UserStats.objects.bulk_create(
+        [UserStats(user_id=user_id)
+         for user_id in User.objects.values_list('id', flat=True)])
+    UserStats.objects.update(
+        posts_count=count(Post.objects, 'author'),
+        followers_count=count(Follow.objects, 'author'),
+        following_count=count(Follow.objects, 'user'))
+    Group.objects.update(posts_count=count(Post.objects, 'group'))
+    Post.objects.update(comments_count=count(Comment.objects, 'post'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0011_update_proxy_permissions'),
+        ('posts', '0009_timelineentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+                ('posts_count', models.PositiveIntegerField(default=0, verbose_name='Число постов')),
+                ('followers_count', models.PositiveIntegerField(default=0, verbose_name='Число подписчиков')),
+                ('following_count', models.PositiveIntegerField(default=0, verbose_name='Число подписок')),
+            ],
+            options={
+                'verbose_name': 'Счётчики пользователя',
+                'verbose_name_plural': 'Счётчики пользователей',
+            },
+        ),
+        migrations.AddField(
+            model_name='group',
+            name='posts_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Число постов'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='comments_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Число комментариев'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 2.2.9 on 2026-10-18 05:05
+
+from django.db import migrations, models
+from django.db.models import Count, Min, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count(queryset, field):
+    counted = (queryset.filter(**{field: OuterRef('pk')})
+               .order_by().values(field).annotate(total=Count('pk'))
+               .values('total'))
+    return Coalesce(Subquery(counted), 0)
+
+
+def remove_duplicate_follows(apps, schema_editor):
+    Follow = apps.get_model('posts', 'Follow')
+    UserStats = apps.get_model('posts', 'UserStats')
+    kept = (Follow.objects.values('user', 'author')
+            .annotate(first_id=Min('id')).values('first_id'))
+    deleted, _ = Follow.objects.exclude(id__in=kept).delete()
+    if deleted:
+        UserStats.objects.update(
+            followers_count=count(Follow.objects, 'author'),
+            following_count=count(Follow.objects, 'user'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0010_counters'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'pub_date'], name='comment_post_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['-pub_date'], name='post_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['author', '-pub_date'], name='post_author_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['group', '-pub_date'], name='post_group_date_idx'),
+        ),
+        migrations.RunPython(
+            remove_duplicate_follows, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='follow',
+            constraint=models.UniqueConstraint(fields=('user', 'author'), name='unique_follow'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 2.2.9 on 2026-10-18 05:31
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0013_content_addressed_images'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostTerm',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64, verbose_name='Основа слова')),
+                ('weight', models.PositiveIntegerField(default=1, verbose_name='Число вхождений')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='terms', to='posts.Post', verbose_name='Пост')),
+            ],
+            options={
+                'verbose_name': 'Слово поискового индекса',
+                'verbose_name_plural': 'Поисковый индекс',
+                'unique_together': {('term', 'post')},
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 2.2.9 on 2026-10-18 05:47
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0011_update_proxy_permissions'),
+        ('posts', '0014_post_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuthorShard',
+            fields=[
+                ('author', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='shard', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Автор')),
+                ('alias', models.CharField(max_length=100, verbose_name='Алиас базы')),
+            ],
+            options={
+                'verbose_name': 'Шард автора',
+                'verbose_name_plural': 'Шарды авторов',
+            },
+        ),
+        migrations.CreateModel(
+            name='ShardSequence',
+            fields=[
+                ('name', models.CharField(max_length=100, primary_key=True, serialize=False, verbose_name='Таблица')),
+                ('last_id', models.BigIntegerField(verbose_name='Последний выданный id')),
+            ],
+            options={
+                'verbose_name': 'Последовательность id',
+                'verbose_name_plural': 'Последовательности id',
+            },
+        ),
+    ]
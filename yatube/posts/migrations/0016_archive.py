@@ -0,0 +1,64 @@
+# Generated by Django 2.2.9 on 2026-10-18 05:58
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import posts.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0015_sharding'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userstats',
+            name='archived_posts_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Число постов в архиве'),
+        ),
+        migrations.CreateModel(
+            name='ArchivedPost',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('text', models.TextField(verbose_name='Текст поста')),
+                ('pub_date', models.DateTimeField(verbose_name='Дата публикации')),
+                ('image', models.ImageField(blank=True, storage=posts.storage.ContentAddressedStorage(), upload_to='posts/', verbose_name='Картинка')),
+                ('comments_count', models.PositiveIntegerField(default=0, verbose_name='Число комментариев')),
+                ('version', models.PositiveIntegerField(default=1, verbose_name='Версия')),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Дата архивации')),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_posts', to=settings.AUTH_USER_MODEL, verbose_name='Автор')),
+                ('group', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='archived_posts', to='posts.Group', verbose_name='Группа')),
+            ],
+            options={
+                'verbose_name': 'Пост в архиве',
+                'verbose_name_plural': 'Архив постов',
+                'ordering': ['-pub_date'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedComment',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('text', models.TextField(verbose_name='Текст комментария')),
+                ('pub_date', models.DateTimeField(verbose_name='Дата публикации')),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_comments', to=settings.AUTH_USER_MODEL, verbose_name='Автор')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='comments', to='posts.ArchivedPost')),
+            ],
+            options={
+                'verbose_name': 'Комментарий в архиве',
+                'verbose_name_plural': 'Архив комментариев',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='archivedpost',
+            index=models.Index(fields=['author', '-pub_date'], name='archived_author_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedcomment',
+            index=models.Index(fields=['post', 'pub_date'], name='archived_post_date_idx'),
+        ),
+    ]
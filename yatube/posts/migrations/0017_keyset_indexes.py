@@ -0,0 +1,45 @@
+# Generated by Django 2.2.9 on 2026-10-18 07:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0016_archive'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='archivedpost',
+            name='archived_author_date_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='post',
+            name='post_date_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='post',
+            name='post_author_date_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='post',
+            name='post_group_date_idx',
+        ),
+        migrations.AddIndex(
+            model_name='archivedpost',
+            index=models.Index(fields=['author', '-pub_date', '-id'], name='archived_author_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['-pub_date', '-id'], name='post_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['author', '-pub_date', '-id'], name='post_author_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['group', '-pub_date', '-id'], name='post_group_date_idx'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 2.2.9 on 2026-10-18 07:33
+
+from django.db import migrations, models
+import posts.storage
+import posts.uploads
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0017_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='archivedpost',
+            name='image',
+            field=models.ImageField(blank=True, storage=posts.storage.ContentAddressedStorage(), upload_to='posts/', validators=[posts.uploads.validate_upload_size], verbose_name='Картинка'),
+        ),
+        migrations.AlterField(
+            model_name='post',
+            name='image',
+            field=models.ImageField(blank=True, storage=posts.storage.ContentAddressedStorage(), upload_to='posts/', validators=[posts.uploads.validate_upload_size], verbose_name='Картинка'),
+        ),
+    ]
@@ -1,15 +1,32 @@
 from django.contrib.auth import get_user_model
 from django.db import models
+from django.utils import timezone
+
+from .storage import ContentAddressedStorage
+from .uploads import validate_upload_size
 
 User = get_user_model()
 
 SYMBOLS_COUNT = 15
 
 
+class ShardedQuerySet(models.QuerySet):
+    def create(self, **kwargs):
+        # Без явного using() базу выбирает роутер по самому объекту,
+        # а не по модели, как в QuerySet.create: так запись попадает
+        # в шард автора.
+        obj = self.model(**kwargs)
+        self._for_write = True
+        obj.save(force_insert=True, using=self._db)
+        return obj
+
+
 class Group(models.Model):
     title = models.CharField('Название группы', max_length=200)
     slug = models.SlugField(max_length=200, unique=True,)
     description = models.TextField('Описание группы')
+    posts_count = models.PositiveIntegerField(
+        'Число постов', default=0, editable=False)
 
     def __str__(self):
         return self.title
@@ -36,8 +53,16 @@ class Post(models.Model):
     image = models.ImageField(
         'Картинка',
         upload_to='posts/',
+        storage=ContentAddressedStorage(),
+        validators=[validate_upload_size],
         blank=True
     )
+    comments_count = models.PositiveIntegerField(
+        'Число комментариев', default=0, editable=False)
+    version = models.PositiveIntegerField(
+        'Версия', default=1, editable=False)
+
+    objects = ShardedQuerySet.as_manager()
 
     def __str__(self):
         return self.text[:SYMBOLS_COUNT]
@@ -46,6 +71,17 @@ class Post(models.Model):
         ordering = ['-pub_date']
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
+        # id в индексах - второй ключ курсора (pub_date, id): без него
+        # SQLite досортировывает каждую страницу во временном B-дереве.
+        indexes = [
+            models.Index(fields=['-pub_date', '-id'], name='post_date_idx'),
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='post_author_date_idx'),
+            models.Index(
+                fields=['group', '-pub_date', '-id'],
+                name='post_group_date_idx'),
+        ]
 
 
 class Comment(models.Model):
@@ -68,6 +104,14 @@ class Comment(models.Model):
         related_name='comments',
     )
 
+    objects = ShardedQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['post', 'pub_date'], name='comment_post_date_idx'),
+        ]
+
 
 class Follow(models.Model):
     author = models.ForeignKey(
@@ -80,3 +124,165 @@ class Follow(models.Model):
         on_delete=models.CASCADE,
         related_name='follower',
         verbose_name='Пользователь')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'author'], name='unique_follow'),
+        ]
+
+
+class UserStats(models.Model):
+    """Денормализованные счётчики пользователя."""
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+        verbose_name='Пользователь')
+    posts_count = models.PositiveIntegerField('Число постов', default=0)
+    followers_count = models.PositiveIntegerField(
+        'Число подписчиков', default=0)
+    following_count = models.PositiveIntegerField('Число подписок', default=0)
+    archived_posts_count = models.PositiveIntegerField(
+        'Число постов в архиве', default=0)
+
+    class Meta:
+        verbose_name = 'Счётчики пользователя'
+        verbose_name_plural = 'Счётчики пользователей'
+
+
+class TimelineEntry(models.Model):
+    """Запись материализованной ленты подписок пользователя."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='Пользователь')
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='Пост')
+    pub_date = models.DateTimeField('Дата публикации')
+
+    class Meta:
+        ordering = ['-pub_date']
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Ленты подписок'
+        unique_together = ('user', 'post')
+        index_together = ('user', 'pub_date')
+
+
+class PostTerm(models.Model):
+    """Запись обратного индекса: основа слова и пост, где она есть."""
+    term = models.CharField('Основа слова', max_length=64)
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='terms',
+        verbose_name='Пост')
+    weight = models.PositiveIntegerField('Число вхождений', default=1)
+
+    class Meta:
+        verbose_name = 'Слово поискового индекса'
+        verbose_name_plural = 'Поисковый индекс'
+        unique_together = ('term', 'post')
+
+
+class AuthorShard(models.Model):
+    """База, в которой лежат посты автора и комментарии к ним."""
+    author = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='shard',
+        verbose_name='Автор')
+    alias = models.CharField('Алиас базы', max_length=100)
+
+    class Meta:
+        verbose_name = 'Шард автора'
+        verbose_name_plural = 'Шарды авторов'
+
+
+class ShardSequence(models.Model):
+    """Общий для всех шардов счётчик id записей одной таблицы."""
+    name = models.CharField('Таблица', max_length=100, primary_key=True)
+    last_id = models.BigIntegerField('Последний выданный id')
+
+    class Meta:
+        verbose_name = 'Последовательность id'
+        verbose_name_plural = 'Последовательности id'
+
+
+class ArchivedPost(models.Model):
+    """Старый пост, перенесённый из горячей таблицы в архив.
+
+    id совпадает с id поста, поэтому ссылки на пост не меняются.
+    """
+    id = models.IntegerField(primary_key=True)
+    text = models.TextField('Текст поста')
+    pub_date = models.DateTimeField('Дата публикации')
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='archived_posts',
+        verbose_name='Автор')
+    group = models.ForeignKey(
+        Group,
+        blank=True,
+        null=True,
+        related_name='archived_posts',
+        on_delete=models.SET_NULL,
+        verbose_name='Группа')
+    image = models.ImageField(
+        'Картинка',
+        upload_to='posts/',
+        storage=ContentAddressedStorage(),
+        validators=[validate_upload_size],
+        blank=True
+    )
+    comments_count = models.PositiveIntegerField(
+        'Число комментариев', default=0)
+    version = models.PositiveIntegerField('Версия', default=1)
+    archived_at = models.DateTimeField(
+        'Дата архивации', default=timezone.now)
+
+    def __str__(self):
+        return self.text[:SYMBOLS_COUNT]
+
+    class Meta:
+        ordering = ['-pub_date']
+        verbose_name = 'Пост в архиве'
+        verbose_name_plural = 'Архив постов'
+        indexes = [
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='archived_author_date_idx'),
+        ]
+
+
+class ArchivedComment(models.Model):
+    """Комментарий к посту из архива."""
+    id = models.IntegerField(primary_key=True)
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='archived_comments',
+        verbose_name='Автор')
+    text = models.TextField('Текст комментария')
+    pub_date = models.DateTimeField('Дата публикации')
+    post = models.ForeignKey(
+        ArchivedPost,
+        on_delete=models.CASCADE,
+        related_name='comments',
+    )
+
+    class Meta:
+        verbose_name = 'Комментарий в архиве'
+        verbose_name_plural = 'Архив комментариев'
+        indexes = [
+            models.Index(
+                fields=['post', 'pub_date'],
+                name='archived_post_date_idx'),
+        ]
@@ -0,0 +1,72 @@
+import time
+import uuid
+from functools import wraps
+
+from django.core.cache import cache
+from django.http import HttpResponse
+
+VERSION_KEY = 'feed_pages_version'
+# Сколько после истечения страница ещё может отдаваться устаревшей,
+# пока один из воркеров её перестраивает.
+STALE_TIME = 60 * 60
+# Время жизни блокировки перестройки на случай падения воркера.
+LOCK_TIME = 30
+
+
+def get_feed_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        version = uuid.uuid4().hex
+        if not cache.add(VERSION_KEY, version, None):
+            version = cache.get(VERSION_KEY, version)
+    return version
+
+
+def bump_feed_version():
+    """Делает устаревшими все закешированные страницы лент."""
+    cache.set(VERSION_KEY, uuid.uuid4().hex, None)
+
+
+def cached_response(entry):
+    return HttpResponse(entry['content'], content_type=entry['content_type'])
+
+
+def cache_feed_page(timeout, key_prefix):
+    """Кеширует страницу ленты для анонимных пользователей.
+
+    Запись сбрасывается не по таймеру, а сменой версии лент
+    (bump_feed_version) или по истечении timeout. Устаревшую страницу
+    перестраивает только тот запрос, что первым взял блокировку,
+    остальные тем временем получают устаревшую копию.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if (request.method not in ('GET', 'HEAD')
+                    or request.user.is_authenticated):
+                return view(request, *args, **kwargs)
+            key = f'{key_prefix}:{request.get_full_path()}'
+            lock_key = f'{key}:lock'
+            version = get_feed_version()
+            entry = cache.get(key)
+            if (entry is not None and entry['version'] == version
+                    and entry['expires'] > time.time()):
+                return cached_response(entry)
+            locked = cache.add(lock_key, 1, LOCK_TIME)
+            if entry is not None and not locked:
+                return cached_response(entry)
+            try:
+                response = view(request, *args, **kwargs)
+                if response.status_code == 200 and not response.streaming:
+                    cache.set(key, {
+                        'version': version,
+                        'expires': time.time() + timeout,
+                        'content': response.content,
+                        'content_type': response['Content-Type'],
+                    }, timeout + STALE_TIME)
+            finally:
+                if locked:
+                    cache.delete(lock_key)
+            return response
+        return wrapper
+    return decorator
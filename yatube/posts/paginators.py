@@ -0,0 +1,188 @@
+import base64
+import binascii
+from datetime import datetime
+
+from django.core.paginator import (EmptyPage, Page, PageNotAnInteger,
+                                   Paginator)
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+CURSOR_PARAM = 'cursor'
+FORWARD = 'n'
+BACKWARD = 'p'
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(direction, key, pk, number):
+    if isinstance(key, datetime):
+        key = key.isoformat()
+    raw = f'{direction}|{key}|{pk}|{number}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Разбирает курсор в четвёрку (направление, ключ строкой, id, номер
+    страницы)."""
+    padded = cursor + '=' * (-len(cursor) % 4)
+    try:
+        raw = base64.urlsafe_b64decode(padded.encode()).decode()
+        direction, key, pk, number = raw.split('|')
+        pk = int(pk)
+        number = int(number)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise InvalidCursor(cursor)
+    if direction not in (FORWARD, BACKWARD) or number < 1:
+        raise InvalidCursor(cursor)
+    return direction, key, pk, number
+
+
+class CursorPage(Page):
+    """Страница ключевой (keyset) паджинации.
+
+    Номер страницы переносится в курсоре, поэтому номера соседних
+    страниц и записей известны без COUNT(*); общего числа страниц
+    страница не знает.
+    """
+
+    is_cursor = True
+
+    def __init__(self, object_list, number, paginator, has_next,
+                 has_previous):
+        super().__init__(object_list, number, paginator)
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __repr__(self):
+        return f'<Cursor page {self.number}>'
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def next_cursor(self):
+        if not self._has_next:
+            return None
+        return self.paginator.cursor(
+            FORWARD, self.object_list[-1], self.number + 1)
+
+    def previous_cursor(self):
+        if not self._has_previous:
+            return None
+        return self.paginator.cursor(
+            BACKWARD, self.object_list[0], max(self.number - 1, 1))
+
+    def start_index(self):
+        if not self.object_list:
+            return 0
+        return (self.number - 1) * self.paginator.per_page + 1
+
+    def end_index(self):
+        if not self.object_list:
+            return 0
+        return self.start_index() + len(self.object_list) - 1
+
+
+class CursorPaginator(Paginator):
+    """Паджинатор по ключу (поле, id) без COUNT(*) и OFFSET.
+
+    Каждая страница выбирается условием по ключу последней записи
+    предыдущей страницы, поэтому глубокие страницы стоят столько же,
+    сколько первая. Ключ - первое поле ordering, по умолчанию записи
+    идут от новых к старым по pub_date.
+    """
+
+    ordering = ('-pub_date', '-id')
+
+    def __init__(self, object_list, per_page, ordering=None):
+        if ordering is not None:
+            self.ordering = ordering
+        super().__init__(object_list.order_by(*self.ordering), per_page)
+        self.descending = self.ordering[0].startswith('-')
+        self.key = self.ordering[0].lstrip('-')
+
+    def cursor(self, direction, obj, number):
+        return encode_cursor(
+            direction, getattr(obj, self.key), obj.pk, number)
+
+    def parse_key(self, value):
+        """Значение ключа из курсора; ключ по умолчанию - дата."""
+        key = parse_datetime(value)
+        if key is None:
+            raise InvalidCursor(value)
+        return key
+
+    def validate_number(self, number):
+        """Проверяет номер страницы; верхней границы без COUNT(*) нет."""
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger('Номер страницы не целое число.')
+        if number < 1:
+            raise EmptyPage('Номер страницы меньше 1.')
+        return number
+
+    def seek(self, key, pk, forward):
+        """Условие для записей за ключом в направлении обхода.
+
+        Записано как key <= k AND (key < k OR id < pk), а не как
+        key < k OR (key = k AND id < pk): у OR нет диапазона по индексу,
+        и SQLite читает и сортирует все записи за курсором.
+        """
+        lookup = 'lt' if forward == self.descending else 'gt'
+        return Q(**{f'{self.key}__{lookup}e': key}) & (
+            Q(**{f'{self.key}__{lookup}': key}) | Q(**{f'id__{lookup}': pk}))
+
+    def page(self, cursor=None):
+        queryset = self.object_list
+        has_next = has_previous = False
+        if cursor:
+            direction, key, pk, number = decode_cursor(cursor)
+            key = self.parse_key(key)
+        else:
+            direction, number = FORWARD, 1
+        if direction == FORWARD:
+            if cursor:
+                queryset = queryset.filter(self.seek(key, pk, True))
+                has_previous = True
+            objects = list(queryset[:self.per_page + 1])
+            has_next = len(objects) > self.per_page
+            objects = objects[:self.per_page]
+        else:
+            queryset = queryset.filter(
+                self.seek(key, pk, False)).reverse()
+            objects = list(queryset[:self.per_page + 1])
+            has_previous = len(objects) > self.per_page
+            objects = objects[:self.per_page][::-1]
+            has_next = True
+            if not has_previous:
+                # Курсор мог отстать от вставок: первая страница - первая.
+                number = 1
+        return CursorPage(objects, number, self, has_next, has_previous)
+
+    def get_page(self, cursor=None):
+        try:
+            return self.page(cursor)
+        except InvalidCursor:
+            return self.page()
+
+
+def paginate(request, queryset, per_page, cursor=False, count=None):
+    """Возвращает страницу ленты.
+
+    Курсорный режим включается флагом cursor для конкретного
+    представления либо параметром ?cursor= в запросе; старые ссылки
+    ?page= по-прежнему открывают страницу по номеру. Известное заранее
+    число записей (count) избавляет обычный паджинатор от COUNT(*).
+    """
+    if CURSOR_PARAM in request.GET or (cursor and 'page' not in request.GET):
+        paginator = CursorPaginator(queryset, per_page)
+        return paginator.get_page(request.GET.get(CURSOR_PARAM))
+    paginator = Paginator(queryset, per_page)
+    if count is not None:
+        paginator.count = count
+    return paginator.get_page(request.GET.get('page'))
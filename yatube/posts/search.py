@@ -0,0 +1,194 @@
+"""Полнотекстовый поиск по постам через собственный обратный индекс.
+
+Текст поста разбивается на слова, слова приводятся к основе облегчённым
+стеммером Портера для русского языка, и для каждой основы в PostTerm
+хранится число её вхождений в пост. Поиск ищет посты, содержащие все
+основы запроса, и ранжирует их по сумме вхождений.
+
+Миграция только создаёт таблицу индекса: посты, написанные до неё,
+индексирует команда rebuild_search_index. Её же нужно запустить
+после правки анализатора.
+"""
+import re
+from collections import Counter
+from functools import lru_cache
+
+from django.db import transaction
+from django.db.models import Count, Sum
+
+from . import sharding
+from .bulk import keyset_chunks
+from .models import Post, PostTerm
+from .paginators import CursorPaginator, InvalidCursor
+
+WORD_RE = re.compile(r'\w+')
+MAX_TERM_LENGTH = 64
+INDEX_CHUNK_SIZE = 1000
+STOP_WORDS = frozenset((
+    'а', 'без', 'бы', 'в', 'во', 'вот', 'да', 'для', 'до', 'же', 'за',
+    'и', 'из', 'или', 'к', 'как', 'ко', 'ли', 'на', 'не', 'ни', 'но',
+    'о', 'об', 'от', 'по', 'под', 'при', 'с', 'со', 'так', 'то', 'у',
+    'что', 'это', 'a', 'an', 'and', 'in', 'of', 'on', 'the', 'to',
+))
+
+VOWELS = 'аеиоуыэюя'
+# Столько основ различных слов помнит stem: в текстах постов слова
+# повторяются, и основа каждого считается один раз.
+STEM_CACHE_SIZE = 100000
+
+
+def _endings(after_a, plain):
+    """Окончания группы от длинных к коротким.
+
+    Окончания after_a отделяются, только если перед ними стоит «а»
+    или «я». Таблицы сортируются один раз, при загрузке модуля.
+    """
+    return tuple(sorted(
+        [(ending, True) for ending in after_a]
+        + [(ending, False) for ending in plain],
+        key=lambda item: -len(item[0])))
+
+
+# Окончания по группам алгоритма Портера (Snowball).
+PERFECTIVE_GERUND = _endings(
+    ('вшись', 'вши', 'в'),
+    ('ившись', 'ывшись', 'ивши', 'ывши', 'ив', 'ыв'))
+ADJECTIVE = _endings((), (
+    'ими', 'ыми', 'его', 'ого', 'ему', 'ому', 'ее', 'ие', 'ые', 'ое',
+    'ей', 'ий', 'ый', 'ой', 'ем', 'им', 'ым', 'ом', 'их', 'ых', 'ую',
+    'юю', 'ая', 'яя', 'ою', 'ею'))
+PARTICIPLE = _endings(('ем', 'нн', 'вш', 'ющ', 'щ'), ('ивш', 'ывш', 'ующ'))
+REFLEXIVE = _endings((), ('ся', 'сь'))
+VERB = _endings(
+    ('ете', 'йте', 'ешь', 'нно', 'ла', 'на', 'ли', 'ем', 'ло', 'но',
+     'ет', 'ют', 'ны', 'ть', 'й', 'л', 'н'),
+    ('ейте', 'уйте', 'ила', 'ыла', 'ена', 'ите', 'или', 'ыли', 'ило',
+     'ыло', 'ено', 'ует', 'уют', 'ены', 'ить', 'ыть', 'ишь', 'ей', 'уй',
+     'ил', 'ыл', 'им', 'ым', 'ен', 'ят', 'ит', 'ыт', 'ую', 'ю'))
+NOUN = _endings((), (
+    'иями', 'ями', 'ами', 'ией', 'иям', 'ием', 'иях', 'ев', 'ов', 'ие',
+    'ье', 'еи', 'ии', 'ей', 'ой', 'ий', 'ям', 'ем', 'ам', 'ом', 'ах',
+    'ях', 'ию', 'ью', 'ия', 'ья', 'а', 'е', 'и', 'й', 'о', 'у', 'ы',
+    'ь', 'ю', 'я'))
+SUPERLATIVE = _endings((), ('ейше', 'ейш'))
+DERIVATIONAL = _endings((), ('ость', 'ост'))
+
+
+def _strip(word, start, endings):
+    """Отделяет самое длинное окончание из endings в области word[start:].
+
+    Возвращает слово без окончания или None, если окончания нет.
+    """
+    for ending, needs_a in endings:
+        if word.endswith(ending) and len(word) - len(ending) >= start:
+            stem = word[:-len(ending)]
+            if needs_a and not (
+                    len(stem) > start and stem[-1] in 'ая'):
+                return None
+            return stem
+    return None
+
+
+def _region(word, start):
+    """Начало области после первой пары «гласная, согласная»."""
+    for index in range(start + 1, len(word)):
+        if word[index] not in VOWELS and word[index - 1] in VOWELS:
+            return index + 1
+    return len(word)
+
+
+@lru_cache(maxsize=STEM_CACHE_SIZE)
+def stem(word):
+    """Основа русского слова по алгоритму Портера."""
+    rv = next(
+        (index + 1 for index, letter in enumerate(word) if letter in VOWELS),
+        len(word))
+    r2 = _region(word, _region(word, 0))
+    result = _strip(word, rv, PERFECTIVE_GERUND)
+    if result is None:
+        word = _strip(word, rv, REFLEXIVE) or word
+        result = _strip(word, rv, ADJECTIVE)
+        if result is not None:
+            result = _strip(result, rv, PARTICIPLE) or result
+        else:
+            result = _strip(word, rv, VERB) or _strip(word, rv, NOUN)
+    word = result or word
+    if word.endswith('и') and len(word) > rv:
+        word = word[:-1]
+    word = _strip(word, r2, DERIVATIONAL) or word
+    if word.endswith('нн') and len(word) - 1 > rv:
+        word = word[:-1]
+    else:
+        superlative = _strip(word, rv, SUPERLATIVE)
+        if superlative is not None:
+            word = superlative
+            if word.endswith('нн'):
+                word = word[:-1]
+        elif word.endswith('ь') and len(word) > rv:
+            word = word[:-1]
+    return word
+
+
+def analyze(text):
+    """Основы значимых слов текста в порядке появления."""
+    terms = []
+    for word in WORD_RE.findall(text.lower().replace('ё', 'е')):
+        if word in STOP_WORDS:
+            continue
+        terms.append(stem(word)[:MAX_TERM_LENGTH])
+    return terms
+
+
+def post_terms(post_id, text):
+    return [
+        PostTerm(post_id=post_id, term=term, weight=weight)
+        for term, weight in Counter(analyze(text)).items()
+    ]
+
+
+def index_post(post):
+    """Переиндексирует пост после создания или правки."""
+    terms = PostTerm.objects.using(post._state.db)
+    terms.filter(post_id=post.pk).delete()
+    terms.bulk_create(post_terms(post.pk, post.text))
+
+
+def rebuild_search_index():
+    """Строит индекс заново для всех постов пачками.
+
+    Каждая пачка - своя транзакция: записи постов пачки заменяются
+    в ней целиком, и поиск во время перестройки не теряет постов.
+    """
+    for alias in sharding.shards():
+        terms = PostTerm.objects.using(alias)
+        for rows in keyset_chunks(
+                Post.objects.using(alias).values('id', 'text'),
+                INDEX_CHUNK_SIZE):
+            with transaction.atomic(using=alias):
+                terms.filter(
+                    post_id__in=[row['id'] for row in rows]).delete()
+                terms.bulk_create(
+                    [term for row in rows
+                     for term in post_terms(row['id'], row['text'])])
+
+
+def search_posts(query):
+    """Посты со всеми словами запроса, с рангом в поле score."""
+    terms = set(analyze(query))
+    posts = Post.objects.filter(terms__term__in=terms).annotate(
+        score=Sum('terms__weight'), matched=Count('terms'))
+    if not terms:
+        return posts.none()
+    return posts.filter(matched=len(terms))
+
+
+class SearchPaginator(CursorPaginator):
+    """Курсорная паджинация результатов поиска по рангу."""
+
+    ordering = ('-score', '-id')
+
+    def parse_key(self, value):
+        try:
+            return int(value)
+        except ValueError:
+            raise InvalidCursor(value)
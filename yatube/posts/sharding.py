@@ -0,0 +1,366 @@
+"""Шардирование постов и комментариев по автору.
+
+Шарды - алиасы баз из settings.POST_SHARDS; пустой список означает одну
+базу, и тогда функции модуля ничего не меняют. Посты автора, их
+комментарии и записи поискового индекса лежат в одном шарде. Автор
+закрепляется за шардом (AuthorShard) при первом посте, так что
+добавление шарда не переносит существующих авторов; перенос делает
+команда move_author.
+
+Пользователи и группы копируются во все шарды, чтобы работали внешние
+ключи и select_related. Счётчики, подписки и ленты живут только
+в основной базе. id постов и комментариев выдаёт общая
+последовательность ShardSequence в основной базе, поэтому они
+уникальны между шардами и не меняются при переносе.
+
+Общие ленты сливают шарды (ScatterGather) и листаются курсором, а лента
+подписок при шардировании собирается при чтении запросом author__in
+по всем шардам: материализованные ленты (timeline) выключены, потому
+что записи ленты ссылаются на посты и должны лежать с ними в одной базе.
+"""
+import heapq
+import threading
+from itertools import islice
+from operator import itemgetter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import F, Max
+from django.http import Http404
+
+from .bulk import keyset_scan
+from .models import (ArchivedComment, ArchivedPost, AuthorShard, Comment,
+                     Group, Post, PostTerm, ShardSequence, User)
+
+# Архив лежит в том же шарде, что и горячие посты автора.
+SHARDED_MODELS = (Post, Comment, PostTerm, ArchivedPost, ArchivedComment)
+# Таблицы, копии которых есть в каждом шарде.
+REFERENCE_MODELS = (User, Group)
+COPY_CHUNK_SIZE = 1000
+# Столько id процесс забирает из последовательности за одну
+# транзакцию в основной базе.
+ID_BLOCK_SIZE = 100
+# Для команд, которые работают с одной базой.
+SINGLE_DATABASE_ONLY = 'Команда не поддерживает шардирование (POST_SHARDS).'
+
+# Невыданный остаток блока id каждой таблицы: (следующий, последний).
+_id_blocks = {}
+_id_blocks_lock = threading.Lock()
+
+
+def enabled():
+    return len(settings.POST_SHARDS) > 1
+
+
+def shards():
+    return list(settings.POST_SHARDS) or [DEFAULT_DB_ALIAS]
+
+
+def _cache_key(author_id):
+    return f'author_shard:{author_id}'
+
+
+def shard_for(author_id, pin=False):
+    """Шард автора; pin закрепляет за автором шард по умолчанию."""
+    key = _cache_key(author_id)
+    alias = cache.get(key)
+    if alias in settings.POST_SHARDS:
+        return alias
+    # Закрепления читаются из основной базы: отставшая реплика
+    # закешировала бы прежний шард.
+    alias = AuthorShard.objects.using(DEFAULT_DB_ALIAS).filter(
+        author_id=author_id).values_list('alias', flat=True).first()
+    if alias not in settings.POST_SHARDS:
+        alias = shards()[author_id % len(shards())]
+        if not pin:
+            return alias
+        AuthorShard.objects.using(DEFAULT_DB_ALIAS).update_or_create(
+            author_id=author_id, defaults={'alias': alias})
+    cache.set(key, alias, None)
+    return alias
+
+
+def assign_shard(author_id, alias):
+    AuthorShard.objects.using(DEFAULT_DB_ALIAS).update_or_create(
+        author_id=author_id, defaults={'alias': alias})
+    cache.set(_cache_key(author_id), alias, None)
+
+
+def post_shard(post_id, model=Post):
+    """Шард, где лежит пост, или None, если поста нет нигде."""
+    if not enabled():
+        return DEFAULT_DB_ALIAS
+    for alias in shards():
+        if model.objects.using(alias).filter(pk=post_id).exists():
+            return alias
+    return None
+
+
+def _take_block(model):
+    """Забирает из последовательности блок id: (первый, последний)."""
+    name = model._meta.db_table
+    sequences = ShardSequence.objects.using(DEFAULT_DB_ALIAS)
+    with transaction.atomic(using=DEFAULT_DB_ALIAS):
+        if not sequences.filter(name=name).update(
+                last_id=F('last_id') + ID_BLOCK_SIZE):
+            last_id = max(
+                model.objects.using(alias).aggregate(last=Max('pk'))['last']
+                or 0 for alias in shards())
+            sequences.create(name=name, last_id=last_id + ID_BLOCK_SIZE)
+        last_id = sequences.values_list('last_id', flat=True).get(name=name)
+    return last_id - ID_BLOCK_SIZE + 1, last_id
+
+
+def next_id(model):
+    """Следующий id записи модели, общий для всех шардов.
+
+    id выдаются из блока, взятого процессом, поэтому транзакция
+    в основной базе нужна раз на ID_BLOCK_SIZE записей. id уникальны,
+    но записи разных процессов получают их не в порядке времени.
+    """
+    name = model._meta.db_table
+    with _id_blocks_lock:
+        next_id, last_id = _id_blocks.get(name, (1, 0))
+        if next_id > last_id:
+            next_id, last_id = _take_block(model)
+        _id_blocks[name] = (next_id + 1, last_id)
+    return next_id
+
+
+def copy_rows(model, objects, alias):
+    """Записывает объекты в базу alias как есть, без сигналов.
+
+    Строки, которые там уже есть, обновляются, остальные вставляются.
+    """
+    manager = model._base_manager.using(alias)
+    names = [field.attname for field in model._meta.concrete_fields]
+    copies = [
+        model(**{name: getattr(obj, name) for name in names})
+        for obj in objects
+    ]
+    existing = set(manager.filter(
+        pk__in=[copy.pk for copy in copies]).values_list('pk', flat=True))
+    for copy in copies:
+        if copy.pk in existing:
+            manager.filter(pk=copy.pk).update(
+                **{name: getattr(copy, name) for name in names})
+    manager.bulk_create(
+        [copy for copy in copies if copy.pk not in existing])
+
+
+def copy_reference(alias):
+    """Докопирует в шард alias недостающих пользователей и группы."""
+    for model in REFERENCE_MODELS:
+        names = [field.attname for field in model._meta.concrete_fields]
+        rows = keyset_scan(
+            model.objects.using(DEFAULT_DB_ALIAS).values(*names),
+            COPY_CHUNK_SIZE)
+        batch = []
+        for row in rows:
+            batch.append(model(**row))
+            if len(batch) >= COPY_CHUNK_SIZE:
+                model.objects.using(alias).bulk_create(
+                    batch, ignore_conflicts=True)
+                batch = []
+        model.objects.using(alias).bulk_create(batch, ignore_conflicts=True)
+
+
+def using(queryset, alias):
+    """Выборка из шарда alias; без шардирования - как есть.
+
+    Явный using() для основной базы отключил бы чтение с реплик,
+    поэтому без шардирования выборка не меняется.
+    """
+    if not enabled():
+        return queryset
+    return queryset.using(alias)
+
+
+def author_posts(queryset, author_id):
+    return using(queryset, shard_for(author_id) if enabled() else None)
+
+
+def all_shards(queryset):
+    """Выборка со всех шардов; без шардирования - как есть."""
+    if not enabled():
+        return queryset
+    return ScatterGather([queryset.using(alias) for alias in shards()])
+
+
+def get_post_or_404(queryset, post_id):
+    """Пост по id из того шарда, где он лежит."""
+    for alias in shards():
+        post = using(queryset, alias).filter(pk=post_id).first()
+        if post is not None:
+            return post
+    raise Http404('Пост не найден.')
+
+
+def _flip(field):
+    return field[1:] if field.startswith('-') else '-' + field
+
+
+class ScatterGather:
+    """Выборка, которая идёт во все шарды и сливает ответы.
+
+    Поддерживает то, что нужно паджинаторам: цепочки filter, order_by,
+    reverse и срезы. Срез [a:b] сливает первые b записей каждой части
+    k-путевым слиянием по полям сортировки, поэтому сортировка должна
+    быть целиком по убыванию или по возрастанию. Для глубоких страниц
+    сливаются только ключи, а целиком выбираются b - a записей, но
+    каждая часть всё равно отдаёт b ключей: ленты по всем шардам
+    поэтому листаются курсором (CursorPaginator), и срез всегда [:n].
+    Части не обязаны быть одной модели: так к горячим постам
+    подмешивается архив.
+    """
+
+    ordered = True
+
+    def __init__(self, querysets, ordering=None):
+        self.querysets = querysets
+        first = querysets[0]
+        self.ordering = tuple(
+            ordering or first.query.order_by or first.model._meta.ordering)
+        self.model = first.model
+
+    def _chain(self, method, *args, **kwargs):
+        return ScatterGather(
+            [getattr(queryset, method)(*args, **kwargs)
+             for queryset in self.querysets], self.ordering)
+
+    def filter(self, *args, **kwargs):
+        return self._chain('filter', *args, **kwargs)
+
+    def exclude(self, *args, **kwargs):
+        return self._chain('exclude', *args, **kwargs)
+
+    def select_related(self, *fields):
+        return self._chain('select_related', *fields)
+
+    def only(self, *fields):
+        return self._chain('only', *fields)
+
+    def none(self):
+        return self._chain('none')
+
+    def order_by(self, *fields):
+        result = self._chain('order_by', *fields)
+        result.ordering = fields
+        return result
+
+    def reverse(self):
+        result = self._chain('reverse')
+        result.ordering = tuple(_flip(field) for field in self.ordering)
+        return result
+
+    def count(self):
+        return sum(queryset.count() for queryset in self.querysets)
+
+    def exists(self):
+        return any(queryset.exists() for queryset in self.querysets)
+
+    def _merge(self, parts, key):
+        descending = {field.startswith('-') for field in self.ordering}
+        if len(descending) > 1:
+            raise ValueError('Сортировка в разные стороны не сливается.')
+        return heapq.merge(*parts, key=key, reverse=descending == {True})
+
+    def _names(self):
+        return [field.lstrip('-') for field in self.ordering]
+
+    def _head(self, stop):
+        """Первые stop записей целиком."""
+        names = self._names()
+        parts = [
+            list(queryset if stop is None else queryset[:stop])
+            for queryset in self.querysets
+        ]
+        return list(islice(self._merge(
+            parts, lambda obj: tuple(getattr(obj, name) for name in names)),
+            stop))
+
+    def _page(self, start, stop):
+        """Записи [start:stop]: слияние ключей, затем выборка по id."""
+        names = self._names()
+        parts = [
+            [(row[:-1], index, row[-1])
+             for row in queryset.values_list(*names, 'pk')[:stop]]
+            for index, queryset in enumerate(self.querysets)
+        ]
+        chosen = list(islice(
+            self._merge(parts, itemgetter(0)), start, stop))
+        objects = {}
+        for index, queryset in enumerate(self.querysets):
+            ids = [pk for _, part, pk in chosen if part == index]
+            if ids:
+                objects.update(
+                    ((index, obj.pk), obj)
+                    for obj in queryset.filter(pk__in=ids))
+        # Запись, исчезнувшую между запросами, страница пропускает.
+        return [
+            objects[index, pk] for _, index, pk in chosen
+            if (index, pk) in objects
+        ]
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start = key.start or 0
+            if not start or key.stop is None:
+                return self._head(key.stop)[start:]
+            return self._page(start, key.stop)
+        return self[key:key + 1][0]
+
+    def __iter__(self):
+        return iter(self[:])
+
+    def __len__(self):
+        return len(self[:])
+
+
+class ShardRouter:
+    """Направляет записи постов, комментариев и индекса в их шард.
+
+    Выборки без объекта-подсказки не маршрутизируются: код, читающий
+    шарды, указывает базу явно через using(), author_posts() или
+    all_shards().
+
+    Запись поста и комментария к загруженному посту идёт в текущий
+    шард автора, а не в базу, откуда объект был прочитан: иначе объект,
+    загруженный до move_author, писал бы в покинутый шард.
+    """
+
+    def _shard(self, model, instance, write):
+        if not enabled() or model not in SHARDED_MODELS or instance is None:
+            return None
+        if not isinstance(instance, SHARDED_MODELS):
+            return None
+        # У нового объекта _state.db уже выставлено присваиванием
+        # внешнего ключа на пользователя или группу: его шард
+        # определяется по автору или посту.
+        adding = instance._state.adding
+        if isinstance(instance, Post) and (adding or write):
+            return shard_for(instance.author_id, pin=adding)
+        if isinstance(instance, (Comment, PostTerm)) and (adding or write):
+            if type(instance).post.is_cached(instance):
+                return shard_for(instance.post.author_id)
+            if adding:
+                return post_shard(instance.post_id)
+        return instance._state.db
+
+    def db_for_read(self, model, **hints):
+        return self._shard(model, hints.get('instance'), False)
+
+    def db_for_write(self, model, **hints):
+        return self._shard(model, hints.get('instance'), True)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if not enabled():
+            return None
+        sharded = [isinstance(obj, SHARDED_MODELS) for obj in (obj1, obj2)]
+        if all(sharded):
+            # Базу нового объекта роутер выберет при сохранении.
+            return (obj1._state.db == obj2._state.db
+                    or obj1._state.adding or obj2._state.adding)
+        # Пользователи и группы есть во всех шардах.
+        return any(sharded) or None
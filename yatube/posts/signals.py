@@ -0,0 +1,182 @@
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.db.models import F
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import freshness, sharding, timeline
+from .page_cache import bump_feed_version
+from .counters import bump
+from .search import index_post
+from .models import Comment, Follow, Group, Post, User, UserStats
+
+# Имя фрагмента {% cache %} в posts/includes/post_card.html.
+POST_CARD_FRAGMENT = 'post_card'
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, raw, **kwargs):
+    if created and not raw:
+        UserStats.objects.get_or_create(user=instance)
+
+
+def forget_post_card(post, version):
+    cache.delete(make_template_fragment_key(
+        POST_CARD_FRAGMENT, [post.pk, version, post.pub_date]))
+
+
+@receiver(pre_save, sender=Post)
+def post_saving(sender, instance, raw, using, **kwargs):
+    # Запоминаем прежние группу и текст, чтобы перенести счётчик при
+    # смене группы и не переиндексировать пост без правки текста,
+    # и поднимаем версию, по которой кешируется карточка поста.
+    if not instance._state.adding and not raw:
+        instance._old_group_id, instance._old_text = Post.objects.using(
+            using).filter(pk=instance.pk).values_list(
+            'group_id', 'text').first() or (instance.group_id, None)
+        forget_post_card(instance, instance.version)
+        instance.version = F('version') + 1
+
+
+@receiver(pre_save, sender=Post)
+@receiver(pre_save, sender=Comment)
+def shard_id_assigned(sender, instance, raw, **kwargs):
+    # При шардировании id выдаёт общая последовательность, а не
+    # автоинкремент шарда.
+    if sharding.enabled() and instance.pk is None and not raw:
+        instance.pk = sharding.next_id(sender)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=Group)
+def reference_saved(sender, instance, raw, using, **kwargs):
+    # Пользователи и группы копируются во все шарды.
+    if not sharding.enabled() or using != DEFAULT_DB_ALIAS:
+        return
+    for alias in sharding.shards():
+        if alias != DEFAULT_DB_ALIAS:
+            sharding.copy_rows(sender, [instance], alias)
+
+
+@receiver(post_delete, sender=User)
+@receiver(post_delete, sender=Group)
+def reference_deleted(sender, instance, using, **kwargs):
+    if not sharding.enabled() or using != DEFAULT_DB_ALIAS:
+        return
+    for alias in sharding.shards():
+        if alias != DEFAULT_DB_ALIAS:
+            sender.objects.using(alias).filter(pk=instance.pk).delete()
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, raw, **kwargs):
+    if raw:
+        return
+    if created:
+        bump(UserStats.objects.filter(user_id=instance.author_id),
+             1, 'posts_count')
+        if instance.group_id:
+            bump(Group.objects.filter(pk=instance.group_id),
+                 1, 'posts_count')
+        timeline.fan_out_post(instance)
+        index_post(instance)
+        return
+    instance.refresh_from_db(fields=['version'])
+    if getattr(instance, '_old_text', None) != instance.text:
+        index_post(instance)
+    old_group_id = getattr(instance, '_old_group_id', instance.group_id)
+    if old_group_id != instance.group_id:
+        bump(Group.objects.filter(pk=old_group_id), -1, 'posts_count')
+        bump(Group.objects.filter(pk=instance.group_id), 1, 'posts_count')
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    forget_post_card(instance, instance.version)
+    bump(UserStats.objects.filter(user_id=instance.author_id),
+         -1, 'posts_count')
+    if instance.group_id:
+        bump(Group.objects.filter(pk=instance.group_id), -1, 'posts_count')
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, raw, **kwargs):
+    if created and not raw:
+        bump(Post.objects.using(instance._state.db).filter(
+            pk=instance.post_id), 1, 'comments_count')
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    bump(Post.objects.using(instance._state.db).filter(
+        pk=instance.post_id), -1, 'comments_count')
+
+
+@receiver(post_save, sender=Follow)
+def follow_saved(sender, instance, created, raw, **kwargs):
+    if not created or raw:
+        return
+    bump(UserStats.objects.filter(user_id=instance.user_id),
+         1, 'following_count')
+    bump(UserStats.objects.filter(user_id=instance.author_id),
+         1, 'followers_count')
+    timeline.followers_changed(instance.author_id, 1)
+    timeline.backfill_timeline(instance.user_id, instance.author_id)
+    freshness.touch(freshness.author_scope(instance.author_id))
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    bump(UserStats.objects.filter(user_id=instance.user_id),
+         -1, 'following_count')
+    bump(UserStats.objects.filter(user_id=instance.author_id),
+         -1, 'followers_count')
+    timeline.drop_author(instance.user_id, instance.author_id)
+    timeline.followers_changed(instance.author_id, -1)
+    freshness.touch(freshness.author_scope(instance.author_id))
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def post_changed(sender, instance, **kwargs):
+    scopes = freshness.post_scopes(
+        instance.pk, instance.author_id, instance.group_id)
+    old_group_id = getattr(instance, '_old_group_id', None)
+    if old_group_id and old_group_id != instance.group_id:
+        scopes.append(freshness.group_scope(old_group_id))
+    freshness.touch(*scopes)
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def comment_changed(sender, instance, **kwargs):
+    # Число комментариев входит и в ленты, где показан пост.
+    if Comment.post.is_cached(instance):
+        post = instance.post
+        author_id, group_id = post.author_id, post.group_id
+    else:
+        author_id, group_id = Post.objects.using(
+            instance._state.db).filter(pk=instance.post_id).values_list(
+            'author_id', 'group_id').first() or (None, None)
+    if author_id is None:
+        freshness.touch(freshness.post_scope(instance.post_id))
+        return
+    freshness.touch(
+        *freshness.post_scopes(instance.post_id, author_id, group_id))
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def group_changed(sender, instance, **kwargs):
+    freshness.touch(freshness.group_scope(instance.pk))
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def feed_changed(sender, **kwargs):
+    bump_feed_version()
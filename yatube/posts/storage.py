@@ -0,0 +1,57 @@
+"""Хранилище картинок постов, адресуемое по содержимому."""
+import hashlib
+import os
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+HASH_CHUNK_SIZE = 64 * 1024
+
+
+def content_hash(content):
+    """sha256 файла, читаемого кусками."""
+    digest = hashlib.sha256()
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    for chunk in content.chunks(HASH_CHUNK_SIZE):
+        digest.update(chunk)
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    return digest.hexdigest()
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Сохраняет файл под именем <каталог>/<ab>/<sha256><расширение>.
+
+    Одинаковые картинки получают одно имя: повторная загрузка не пишет
+    файл заново, а ссылается на уже сохранённый, и sorl-thumbnail
+    переиспользует его миниатюры. Хеш, посчитанный при приёме файла
+    (атрибут content_hash), используется без повторного чтения.
+    """
+
+    def hashed_name(self, name, digest):
+        directory, filename = os.path.split(name)
+        stem, extension = os.path.splitext(filename)
+        if stem == digest and os.path.basename(directory) == digest[:2]:
+            # Имя уже адресовано по содержимому, например при загрузке
+            # выгрузки: каталог не вкладывается повторно.
+            directory = os.path.dirname(directory)
+        extension = extension.lower()
+        return os.path.join(directory, digest[:2], digest + extension)
+
+    def _save(self, name, content):
+        digest = getattr(content, 'content_hash', None)
+        if digest is None:
+            digest = content_hash(content)
+        name = self.hashed_name(name, digest)
+        if self.exists(name):
+            # Свежая дата защищает файл от cleanup_media, пока пост
+            # с новой ссылкой на него не записан.
+            os.utime(self.path(name))
+            return name
+        # Пишем во временный файл и атомарно переименовываем: при
+        # одновременной загрузке одинаковых файлов содержимое совпадает.
+        temp_name = super()._save(name + '.part', content)
+        os.replace(self.path(temp_name), self.path(name))
+        return name
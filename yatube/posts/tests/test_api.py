@@ -0,0 +1,82 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from posts.api import API_LIMIT
+from posts.models import Comment, Group, Post
+
+User = get_user_model()
+
+
+class FeedApiTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test',
+            description='Тестовое описание',
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.posts = [
+            Post.objects.create(
+                author=self.user, group=self.group, text=f'Пост {i}')
+            for i in range(API_LIMIT + 2)
+        ]
+
+    def test_feed_pages(self):
+        '''Ленты отдаются страницами по курсору'''
+        urls = (
+            reverse('posts:api_index'),
+            reverse('posts:api_group_posts', args=[self.group.slug]),
+            reverse('posts:api_profile', args=[self.user.username]),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                data = self.client.get(url).json()
+                self.assertEqual(len(data['results']), API_LIMIT)
+                self.assertEqual(data['results'][0]['id'], self.posts[-1].id)
+                self.assertEqual(data['results'][0]['author'], 'auth')
+                data = self.client.get(data['next']).json()
+                self.assertEqual(len(data['results']), 2)
+                self.assertIsNone(data['next'])
+        data = self.client.get(urls[1]).json()
+        self.assertEqual(data['count'], API_LIMIT + 2)
+
+    def test_sparse_fields(self):
+        '''Параметр fields ограничивает поля и колонки выборки'''
+        url = reverse('posts:api_index')
+        response = self.client.get(url, {'fields': 'id,text'})
+        self.assertEqual(set(response.json()['results'][0]), {'id', 'text'})
+        self.assertIn('fields=id%2Ctext', response.json()['next'])
+        response = self.client.get(url, {'fields': 'id,password'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_not_modified(self):
+        '''If-None-Match отвечает 304 без запросов к постам'''
+        url = reverse('posts:api_group_posts', args=[self.group.slug])
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get(
+            reverse('posts:api_index'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_etag_changes(self):
+        '''ETag меняется при правке поста и новом комментарии'''
+        url = reverse('posts:api_profile', args=[self.user.username])
+        etag = self.client.get(url)['ETag']
+        post = self.posts[0]
+        post.text = 'Исправленный текст'
+        post.save()
+        new_etag = self.client.get(url, HTTP_IF_NONE_MATCH=etag)['ETag']
+        self.assertNotEqual(new_etag, etag)
+        Comment.objects.create(post=post, author=self.user, text='Текст')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=new_etag)
+        self.assertEqual(response.status_code, 200)
@@ -0,0 +1,184 @@
+import io
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from posts.archive import archivable, archive_batch, cutoff
+from posts.models import (ArchivedComment, ArchivedPost, Comment, Group, Post,
+                          PostTerm, UserStats)
+from posts.views import POSTS_LIMIT
+
+User = get_user_model()
+
+OLD_POSTS = 12
+NEW_POSTS = 3
+
+
+class ArchiveTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test',
+            description='Тестовое описание',
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(self.reader)
+        old = timezone.now() - timedelta(days=400)
+        self.old_posts = []
+        for i in range(OLD_POSTS):
+            post = Post.objects.create(
+                author=self.user, group=self.group, text=f'Старый пост {i}')
+            Post.objects.filter(pk=post.pk).update(
+                pub_date=old + timedelta(hours=i))
+            self.old_posts.append(post)
+        self.commented = self.old_posts[0]
+        comment = Comment.objects.create(
+            post=self.commented, author=self.reader, text='Комментарий')
+        Comment.objects.filter(pk=comment.pk).update(pub_date=old)
+        # Свежий комментарий оставляет старый пост в горячей таблице.
+        self.discussed = self.old_posts[1]
+        Comment.objects.create(
+            post=self.discussed, author=self.reader, text='Свежий')
+        for i in range(NEW_POSTS):
+            Post.objects.create(
+                author=self.user, group=self.group, text=f'Новый пост {i}')
+
+    def archive(self):
+        call_command('archive_posts', batch_size=5, stdout=io.StringIO())
+
+    def test_old_posts_archived(self):
+        '''В архив уходят старые посты без свежих комментариев'''
+        self.archive()
+        self.assertEqual(ArchivedPost.objects.count(), OLD_POSTS - 1)
+        self.assertTrue(Post.objects.filter(pk=self.discussed.pk).exists())
+        self.assertEqual(Post.objects.count(), NEW_POSTS + 1)
+        self.assertFalse(
+            Comment.objects.filter(post_id=self.commented.pk).exists())
+        self.assertEqual(ArchivedComment.objects.get().post_id,
+                         self.commented.pk)
+        self.assertFalse(
+            PostTerm.objects.filter(post_id=self.commented.pk).exists())
+        stats = UserStats.objects.get(user=self.user)
+        self.assertEqual(stats.posts_count, OLD_POSTS + NEW_POSTS)
+        self.assertEqual(stats.archived_posts_count, OLD_POSTS - 1)
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.posts_count, NEW_POSTS + 1)
+
+    def test_batch_reselected_in_transaction(self):
+        '''Пост, прокомментированный после выбора пачки, не уходит в архив'''
+        candidates = list(archivable('default', cutoff()))
+        late = candidates[2]
+        Comment.objects.create(post=late, author=self.reader, text='Поздний')
+        edited = candidates[3]
+        Post.objects.filter(pk=edited.pk).update(text='Правка')
+        archived = archive_batch(candidates, 'default', cutoff())
+        self.assertNotIn(late.pk, [post.pk for post in archived])
+        self.assertTrue(Post.objects.filter(pk=late.pk).exists())
+        self.assertEqual(
+            ArchivedPost.objects.get(pk=edited.pk).text, 'Правка')
+        stats = UserStats.objects.get(user=self.user)
+        self.assertEqual(stats.archived_posts_count, len(candidates) - 1)
+
+    def test_post_detail_reads_archive(self):
+        '''Страница архивного поста открывается, но без комментирования'''
+        self.archive()
+        url = reverse('posts:post_detail', args=[self.commented.pk])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['archived'])
+        self.assertContains(response, 'Комментарий')
+        self.assertNotContains(response, 'Добавить комментарий')
+        self.client.post(url, {'text': 'Ещё один'})
+        self.assertEqual(ArchivedComment.objects.count(), 1)
+        self.assertFalse(Comment.objects.filter(text='Ещё один').exists())
+        response = self.client.get(
+            reverse('posts:post_comments', args=[self.commented.pk]),
+            {'format': 'json'})
+        self.assertEqual(len(response.json()['comments']), 1)
+
+    def test_post_comments_location(self):
+        '''Порция комментариев не читает архив у горячего поста'''
+        self.archive()
+        url = reverse('posts:post_comments', args=[self.discussed.pk])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {'format': 'json'})
+        self.assertEqual(len(response.json()['comments']), 1)
+        for query in queries.captured_queries:
+            self.assertNotIn('archived', query['sql'])
+        hot = Post.objects.filter(comments_count=0).latest('pk')
+        response = self.client.get(
+            reverse('posts:post_comments', args=[hot.pk]),
+            {'format': 'json'})
+        self.assertEqual(response.json()['comments'], [])
+        response = self.client.get(
+            reverse('posts:post_comments', args=[hot.pk + 1000]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_profile_merges_archive(self):
+        '''Глубокие страницы профиля дочитывают архив по дате'''
+        expected = [
+            post.text for post in Post.objects.filter(author=self.user)]
+        self.archive()
+        url = reverse('posts:profile', args=[self.user.username])
+        texts = []
+        for page in (1, 2):
+            response = self.client.get(url, {'page': page})
+            texts.extend(post.text for post in response.context['page_obj'])
+        self.assertEqual(texts, expected)
+        self.assertEqual(
+            response.context['page_obj'].paginator.num_pages,
+            (OLD_POSTS + NEW_POSTS - 1) // POSTS_LIMIT + 1)
+        cursor = self.client.get(url, {'cursor': ''}).context['page_obj']
+        response = self.client.get(url, {'cursor': cursor.next_cursor()})
+        self.assertEqual(
+            [post.text for post in response.context['page_obj']],
+            expected[POSTS_LIMIT:])
+
+    def test_api_profile_reads_archive(self):
+        '''Лента автора в API дочитывает архив и сходится с count'''
+        self.archive()
+        url = reverse('posts:api_profile', args=[self.user.username])
+        ids = []
+        while url:
+            data = self.client.get(url).json()
+            ids.extend(post['id'] for post in data['results'])
+            url = data['next']
+        self.assertEqual(len(ids), data['count'])
+        self.assertEqual(len(ids), OLD_POSTS + NEW_POSTS)
+        self.assertIn(self.commented.pk, ids)
+
+    def test_restore_post(self):
+        '''Команда restore_post возвращает пост с комментариями'''
+        self.archive()
+        pub_date = ArchivedPost.objects.get(pk=self.commented.pk).pub_date
+        call_command(
+            'restore_post', self.commented.pk, stdout=io.StringIO())
+        post = Post.objects.get(pk=self.commented.pk)
+        self.assertEqual(post.pub_date, pub_date)
+        self.assertEqual(post.comments.count(), 1)
+        self.assertEqual(post.comments_count, 1)
+        self.assertFalse(
+            ArchivedPost.objects.filter(pk=self.commented.pk).exists())
+        self.assertFalse(ArchivedComment.objects.exists())
+        self.assertTrue(PostTerm.objects.filter(post=post).exists())
+        stats = UserStats.objects.get(user=self.user)
+        self.assertEqual(stats.archived_posts_count, OLD_POSTS - 2)
+        response = self.client.get(
+            reverse('posts:post_detail', args=[post.pk]))
+        self.assertFalse(response.context['archived'])
+        with self.assertRaises(CommandError):
+            call_command('restore_post', post.pk, stdout=io.StringIO())
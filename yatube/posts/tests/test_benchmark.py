@@ -0,0 +1,104 @@
+import io
+import json
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import Client, TransactionTestCase, override_settings
+
+from posts.management.commands.run_benchmark import (
+    INDEX_DEPTH, SCENARIOS, Command)
+from posts.models import Comment, Follow, Post, TimelineEntry, UserStats
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class BenchmarkCommandsTest(TransactionTestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        call_command(
+            'generate_data', users=20, groups=3, posts=200, comments=300,
+            follows=60, images=2, stdout=io.StringIO())
+
+    def test_generate_data(self):
+        '''Генератор создаёт данные со счётчиками и лентами'''
+        self.assertEqual(Post.objects.count(), 200)
+        self.assertEqual(Comment.objects.count(), 300)
+        self.assertTrue(Post.objects.exclude(image='').exists())
+        self.assertEqual(
+            sum(UserStats.objects.values_list('posts_count', flat=True)),
+            200)
+        self.assertGreater(Follow.objects.count(), 0)
+        self.assertTrue(TimelineEntry.objects.exists())
+        dates = Post.objects.values_list('pub_date', flat=True)
+        self.assertGreater(len(set(dates)), 1)
+
+    def test_run_benchmark(self):
+        '''Прогон сохраняет перцентили по всем сценариям'''
+        with tempfile.NamedTemporaryFile(suffix='.json') as output:
+            call_command(
+                'run_benchmark', requests=6, concurrency=2, warmup=1,
+                output=output.name, stdout=io.StringIO())
+            results = json.load(output)
+        self.assertEqual(set(results['scenarios']), set(SCENARIOS))
+        for summary in results['scenarios'].values():
+            self.assertEqual(summary['requests'], 6)
+            self.assertEqual(summary['errors'], 0)
+            self.assertLessEqual(summary['p50_ms'], summary['p99_ms'])
+
+    def test_read_under_write_load(self):
+        '''Замер чтения может идти на фоне постоянной записи'''
+        posts = Post.objects.count()
+        with tempfile.NamedTemporaryFile(suffix='.json') as output:
+            call_command(
+                'run_benchmark', scenario=['index'], requests=6,
+                concurrency=2, warmup=1, writers=1, output=output.name,
+                stdout=io.StringIO())
+            summary = json.load(output)['scenarios']['index']
+        self.assertEqual(summary['errors'], 0)
+        self.assertEqual(summary['write_errors'], 0)
+        self.assertEqual(Post.objects.count(), posts + summary['writes'])
+
+    def test_asgi_benchmark(self):
+        '''Тот же замер идёт через ASGI-приложение'''
+        with tempfile.NamedTemporaryFile(suffix='.json') as output:
+            call_command(
+                'run_benchmark', scenario=['profile', 'post_create'],
+                requests=4, concurrency=2, warmup=1, asgi=True,
+                output=output.name, stdout=io.StringIO())
+            results = json.load(output)
+        self.assertTrue(results['options']['asgi'])
+        for summary in results['scenarios'].values():
+            self.assertEqual(summary['requests'], 4)
+            self.assertEqual(summary['errors'], 0)
+
+    def test_index_follows_cursors(self):
+        '''Сценарий index листает ленту по курсорам, а не по ?page='''
+        command = Command()
+        client = Client()
+        client.force_login(Post.objects.first().author)
+        requests = []
+        get = client.get
+
+        def record(url, data):
+            requests.append(data)
+            return get(url, data)
+
+        client.get = record
+        for _ in range(INDEX_DEPTH + 1):
+            self.assertEqual(command.follow_cursor(client, '/'), 200)
+        self.assertEqual(requests[0], {})
+        self.assertTrue(all(
+            set(data) == {'cursor'} for data in requests[1:INDEX_DEPTH]))
+        self.assertEqual(len(set(
+            data['cursor'] for data in requests[1:INDEX_DEPTH])),
+            INDEX_DEPTH - 1)
+        self.assertEqual(requests[INDEX_DEPTH], {})
@@ -0,0 +1,120 @@
+import io
+import json
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from posts.management.commands.export_data import DATA_FILE
+from posts.models import Comment, Follow, Group, Post, PostTerm, UserStats
+
+User = get_user_model()
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ExportImportTest(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.dump = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dump)
+        self.author = User.objects.create_user(username='auth')
+        self.reader = User.objects.create_user(username='reader')
+        self.group = Group.objects.create(
+            title='Тестовая группа', slug='test', description='Описание')
+        image = Post.image.field.storage.save(
+            'posts/small.gif', ContentFile(SMALL_GIF))
+        self.posts = [
+            Post.objects.create(
+                author=self.author, group=self.group, text=f'Пост {i}',
+                image=image if i == 0 else '')
+            for i in range(5)
+        ]
+        Comment.objects.create(
+            post=self.posts[0], author=self.reader, text='Комментарий')
+        Follow.objects.create(user=self.reader, author=self.author)
+
+    def export(self):
+        call_command('export_data', self.dump, chunk_size=2,
+                     stdout=io.StringIO())
+
+    def test_export_streams_ndjson(self):
+        '''Выгрузка пишет по записи на строку и копирует картинки'''
+        self.export()
+        with open(os.path.join(self.dump, DATA_FILE)) as data:
+            records = [json.loads(line) for line in data]
+        models = [record['model'] for record in records]
+        self.assertEqual(models.count('post'), 5)
+        self.assertEqual(
+            models, sorted(models, key=['user', 'group', 'post', 'comment',
+                                        'follow'].index))
+        post = next(r for r in records if r['model'] == 'post' and r['image'])
+        self.assertEqual(post['author'], 'auth')
+        self.assertTrue(os.path.exists(
+            os.path.join(self.dump, 'media', post['image'])))
+
+    def test_round_trip(self):
+        '''Загрузка выгрузки восстанавливает данные, счётчики и ленты'''
+        self.export()
+        posts = {post.id: (post.text, post.pub_date, post.image.name)
+                 for post in Post.objects.all()}
+        Post.objects.all().delete()
+        Follow.objects.all().delete()
+        User.objects.all().delete()
+        Group.objects.all().delete()
+        shutil.rmtree(TEMP_MEDIA_ROOT)
+        call_command('import_data', self.dump, chunk_size=2,
+                     stdout=io.StringIO())
+        self.assertEqual(
+            {post.id: (post.text, post.pub_date, post.image.name)
+             for post in Post.objects.all()},
+            posts)
+        image = Post.objects.exclude(image='').get().image
+        self.assertTrue(image.storage.exists(image.name))
+        comment = Comment.objects.select_related('post', 'author').get()
+        self.assertEqual(comment.author.username, 'reader')
+        self.assertEqual(comment.post.comments_count, 1)
+        author = User.objects.get(username='auth')
+        self.assertEqual(UserStats.objects.get(user=author).posts_count, 5)
+        self.assertEqual(
+            author.posts.first().group.slug, self.group.slug)
+        self.assertEqual(
+            Group.objects.get(slug=self.group.slug).posts_count, 5)
+        self.assertEqual(
+            PostTerm.objects.filter(term='пост').count(), 5)
+        reader = User.objects.get(username='reader')
+        self.assertEqual(reader.timeline.count(), 5)
+        self.assertEqual(UserStats.objects.get(user=reader).following_count, 1)
+        self.assertFalse(reader.has_usable_password())
+
+    def test_import_into_existing_posts(self):
+        '''Занятые id постов заменяются, комментарии идут к своим постам'''
+        self.export()
+        Post.objects.all().delete()
+        other = Post.objects.create(
+            id=self.posts[0].id, author=self.reader, text='Чужой пост')
+        call_command('import_data', self.dump, chunk_size=2,
+                     stdout=io.StringIO())
+        self.assertEqual(Post.objects.count(), 6)
+        comment = Comment.objects.select_related('post').get()
+        self.assertEqual(comment.post.text, 'Пост 0')
+        other.refresh_from_db()
+        self.assertEqual(other.text, 'Чужой пост')
+        self.assertEqual(other.comments_count, 0)
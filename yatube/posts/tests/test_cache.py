@@ -22,9 +22,46 @@ class PostURLTests(TestCase):
         """Проверка кеширования главной страницы."""
         response = self.guest_client.get(reverse('posts:index'))
         self.assertIn(self.post.text, response.content.decode())
-        self.post.delete()
+        Post.objects.filter(pk=self.post.pk).update(text='Мимо сигналов')
         response_cache = self.guest_client.get(reverse('posts:index'))
         self.assertIn(self.post.text, response_cache.content.decode())
         cache.clear()
         response_empty = self.guest_client.get(reverse('posts:index'))
         self.assertNotIn(self.post.text, response_empty.content.decode())
+
+    def test_cache_invalidated_by_changes(self):
+        """Удаление поста сразу сбрасывает кеш главной страницы."""
+        response = self.guest_client.get(reverse('posts:index'))
+        self.assertIn(self.post.text, response.content.decode())
+        self.post.delete()
+        response = self.guest_client.get(reverse('posts:index'))
+        self.assertNotIn(self.post.text, response.content.decode())
+
+    def test_stale_page_while_rebuilding(self):
+        """Пока страницу перестраивает другой воркер,
+        отдаётся устаревшая копия."""
+        url = reverse('posts:index')
+        self.guest_client.get(url)
+        self.post.delete()
+        cache.add(f'index_page:{url}:lock', 1)
+        response = self.guest_client.get(url)
+        self.assertIn(self.post.text, response.content.decode())
+        cache.delete(f'index_page:{url}:lock')
+        response = self.guest_client.get(url)
+        self.assertNotIn(self.post.text, response.content.decode())
+
+    def test_post_card_cache(self):
+        """Карточка поста берётся из кеша и сбрасывается при правке."""
+        author_client = Client()
+        author_client.force_login(self.user)
+        url = reverse('posts:profile', args=[self.user.username])
+        author_client.get(url)
+        Post.objects.filter(pk=self.post.pk).update(text='Мимо сигналов')
+        response = author_client.get(url)
+        self.assertIn(self.post.text, response.content.decode())
+        author_client.post(
+            reverse('posts:post_edit', args=[self.post.id]),
+            data={'text': 'Отредактированный пост'})
+        response = author_client.get(url)
+        self.assertIn('Отредактированный пост', response.content.decode())
+        self.assertNotIn(self.post.text, response.content.decode())
@@ -0,0 +1,105 @@
+from django.contrib.auth import get_user_model
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from posts.models import Comment, Post
+from posts.views import COMMENTS_LIMIT
+
+User = get_user_model()
+
+COUNT_TEST_COMMENTS = COMMENTS_LIMIT + 5
+
+
+class CommentsPaginationTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='auth')
+        cls.post = Post.objects.create(author=cls.author, text='Тестовый пост')
+        for i in range(COUNT_TEST_COMMENTS):
+            commentator = User.objects.create_user(username=f'user{i}')
+            Comment.objects.create(
+                post=cls.post, author=commentator, text=f'Комментарий {i}')
+
+    def setUp(self):
+        self.client = Client()
+        self.url = reverse('posts:post_comments', args=[self.post.id])
+
+    def test_post_detail_shows_first_batch(self):
+        '''На странице поста только первая порция комментариев'''
+        response = self.client.get(
+            reverse('posts:post_detail', args=[self.post.id]))
+        comments = response.context['comments']
+        self.assertEqual(len(comments), COMMENTS_LIMIT)
+        self.assertEqual(comments[0].text, 'Комментарий 0')
+        self.assertContains(response, self.url + '?cursor=')
+
+    def test_next_batch_fragment(self):
+        '''Следующая порция приходит HTML-фрагментом'''
+        first = self.client.get(self.url).context['comments']
+        response = self.client.get(
+            self.url + '?cursor=' + first.next_cursor())
+        self.assertTemplateUsed(response, 'posts/includes/comments.html')
+        comments = response.context['comments']
+        self.assertEqual(len(comments), COUNT_TEST_COMMENTS - COMMENTS_LIMIT)
+        self.assertFalse(comments.has_next())
+        self.assertContains(response, 'Комментарий 24')
+
+    def test_next_batch_json(self):
+        '''Порция комментариев в JSON с курсором следующей'''
+        response = self.client.get(self.url + '?format=json')
+        data = response.json()
+        self.assertEqual(len(data['comments']), COMMENTS_LIMIT)
+        self.assertEqual(data['comments'][0]['author'], 'user0')
+        response = self.client.get(
+            self.url + '?format=json&cursor=' + data['next_cursor'])
+        data = response.json()
+        self.assertEqual(
+            len(data['comments']), COUNT_TEST_COMMENTS - COMMENTS_LIMIT)
+        self.assertIsNone(data['next_cursor'])
+
+    def test_authors_in_one_query(self):
+        '''Авторы комментариев выбираются тем же запросом'''
+        with self.assertNumQueries(1):
+            self.client.get(self.url)
+
+
+class PostDetailQueriesTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='auth')
+        cls.post = Post.objects.create(author=cls.author, text='Тестовый пост')
+        cls.url = reverse('posts:post_detail', args=[cls.post.id])
+
+    def add_comments(self, count):
+        for i in range(count):
+            commentator = User.objects.create_user(username=f'user{i}')
+            Comment.objects.create(
+                post=self.post, author=commentator, text=f'Комментарий {i}')
+
+    def test_query_count_does_not_grow(self):
+        '''Число запросов post_detail не зависит от числа комментариев'''
+        with self.assertNumQueries(2):
+            self.client.get(self.url)
+        self.add_comments(COMMENTS_LIMIT + 5)
+        with self.assertNumQueries(2):
+            self.client.get(self.url)
+
+    def test_post_comment_without_refetch(self):
+        '''Комментарий из формы на странице поста пишется без
+        повторной выборки поста'''
+        client = Client()
+        client.force_login(self.author)
+        with self.assertNumQueries(5):
+            response = client.post(self.url, {'text': 'Новый комментарий'})
+        self.assertRedirects(response, self.url)
+        self.assertTrue(
+            self.post.comments.filter(text='Новый комментарий').exists())
+
+    def test_anonymous_post_redirects_to_login(self):
+        '''Аноним, отправивший комментарий, уходит на страницу входа'''
+        response = self.client.post(self.url, {'text': 'Текст'})
+        self.assertRedirects(
+            response, reverse('users:login') + '?next=' + self.url)
+        self.assertFalse(self.post.comments.exists())
@@ -0,0 +1,155 @@
+import time
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import Client, TestCase
+from django.urls import reverse
+from django.utils.http import parse_http_date
+
+from core.testing import QueryBudgetMixin
+from posts import freshness
+from posts.models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+
+def clock(seconds):
+    '''Останавливает часы меток на seconds'''
+    return mock.patch.object(
+        freshness, 'time', mock.Mock(**{'time.return_value': seconds}))
+
+
+class ConditionalPagesTest(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test',
+            description='Тестовое описание',
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.guest = Client()
+        self.authorized = Client()
+        self.authorized.force_login(self.reader)
+        self.post = Post.objects.create(
+            author=self.user, group=self.group, text='Тестовый пост')
+        self.urls = (
+            reverse('posts:group_list', args=[self.group.slug]),
+            reverse('posts:profile', args=[self.user.username]),
+            reverse('posts:post_detail', args=[self.post.id]),
+        )
+
+    def revalidate(self, client, url):
+        response = client.get(url)
+        return client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+
+    def test_not_modified_without_feed_queries(self):
+        '''Неизменившаяся страница отдаёт 304, не выбирая посты'''
+        for url in self.urls:
+            with self.subTest(url=url):
+                etag = self.guest.get(url)['ETag']
+                with self.assertQueryBudget(1):
+                    response = self.guest.get(
+                        url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response['ETag'], etag)
+
+    def test_cache_control(self):
+        '''Анонимам страница публичная, вошедшим - только приватная'''
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = self.guest.get(url)
+                self.assertIn('public', response['Cache-Control'])
+                self.assertIn('max-age', response['Cache-Control'])
+                self.assertIn('Cookie', response['Vary'])
+                self.assertIn('Last-Modified', response)
+                response = self.authorized.get(url)
+                self.assertIn('private', response['Cache-Control'])
+                self.assertIn('no-cache', response['Cache-Control'])
+
+    def test_etag_depends_on_user(self):
+        '''ETag анонимной страницы не подходит вошедшему пользователю'''
+        for url in self.urls:
+            with self.subTest(url=url):
+                etag = self.guest.get(url)['ETag']
+                response = self.authorized.get(
+                    url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+
+    def test_changes_refresh_pages(self):
+        '''Новый пост, комментарий и подписка меняют ETag страниц'''
+        etags = {url: self.authorized.get(url)['ETag'] for url in self.urls}
+        changes = (
+            lambda: Post.objects.create(
+                author=self.user, group=self.group, text='Новый пост'),
+            lambda: Comment.objects.create(
+                post=self.post, author=self.reader, text='Комментарий'),
+        )
+        for change in changes:
+            change()
+            for url in self.urls:
+                with self.subTest(url=url):
+                    response = self.authorized.get(
+                        url, HTTP_IF_NONE_MATCH=etags[url])
+                    self.assertEqual(response.status_code, 200)
+                    etags[url] = response['ETag']
+        profile = self.urls[1]
+        Follow.objects.create(user=self.reader, author=self.user)
+        response = self.authorized.get(
+            profile, HTTP_IF_NONE_MATCH=etags[profile])
+        self.assertEqual(response.status_code, 200)
+
+    def test_if_modified_since_after_edit(self):
+        '''Правка в ту же секунду не даёт 304 по прежнему Last-Modified'''
+        start = int(time.time())
+        for number, url in enumerate(self.urls, 1):
+            second = start + 10 * number
+            with self.subTest(url=url), clock(second):
+                last_modified = self.guest.get(url)['Last-Modified']
+                self.post.text = f'Правка для {url}'
+                self.post.save()
+                response = self.guest.get(
+                    url, HTTP_IF_MODIFIED_SINCE=last_modified)
+                self.assertEqual(response.status_code, 200)
+                self.assertContains(response, f'Правка для {url}')
+                # Секунда правки ещё идёт: её дата пока не подтверждает
+                # страницу, а ETag подтверждает.
+                response = self.guest.get(
+                    url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+                self.assertEqual(response.status_code, 200)
+                response = self.guest.get(
+                    url, HTTP_IF_NONE_MATCH=response['ETag'])
+                self.assertEqual(response.status_code, 304)
+            with self.subTest(url=url), clock(second + 1):
+                response = self.guest.get(
+                    url, HTTP_IF_MODIFIED_SINCE=self.guest.get(url)[
+                        'Last-Modified'])
+                self.assertEqual(response.status_code, 304)
+
+    def test_last_modified_follows_clock(self):
+        '''Частые правки не уводят Last-Modified вперёд часов'''
+        now = int(time.time()) + 10
+        url = self.urls[0]
+        with clock(now):
+            etag = self.guest.get(url)['ETag']
+            for number in range(50):
+                self.post.text = f'Правка {number}'
+                self.post.save()
+            response = self.guest.get(url)
+        self.assertLess(parse_http_date(response['Last-Modified']), now)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_post_requests_not_cached(self):
+        '''Отправка комментария не получает заголовков кеширования'''
+        url = self.urls[2]
+        response = self.authorized.post(url, {'text': 'Комментарий'})
+        self.assertEqual(response.status_code, 302)
+        self.assertNotIn('ETag', response)
+        self.assertEqual(self.revalidate(
+            self.authorized, url).status_code, 304)
@@ -0,0 +1,102 @@
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.models import Comment, Follow, Group, Post, UserStats
+
+User = get_user_model()
+
+
+class CountersTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='auth')
+        self.reader = User.objects.create_user(username='reader')
+        self.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test',
+            description='Тестовое описание',
+        )
+        self.other_group = Group.objects.create(
+            title='Другая группа',
+            slug='other',
+            description='Тестовое описание',
+        )
+        self.post = Post.objects.create(
+            author=self.user,
+            text='Тестовый пост',
+            group=self.group,
+        )
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.reader)
+
+    def assertCounters(self, model, pk, **expected):
+        values = model.objects.filter(pk=pk).values(*expected).get()
+        self.assertEqual(values, expected)
+
+    def test_post_counters(self):
+        """Счётчики постов автора и группы следуют за постами."""
+        self.assertCounters(UserStats, self.user.pk, posts_count=1)
+        self.assertCounters(Group, self.group.pk, posts_count=1)
+        self.post.group = self.other_group
+        self.post.save()
+        self.assertCounters(Group, self.group.pk, posts_count=0)
+        self.assertCounters(Group, self.other_group.pk, posts_count=1)
+        self.post.delete()
+        self.assertCounters(UserStats, self.user.pk, posts_count=0)
+        self.assertCounters(Group, self.other_group.pk, posts_count=0)
+
+    def test_comment_and_follow_counters(self):
+        """Счётчики комментариев и подписок обновляются через views."""
+        self.authorized_client.post(
+            reverse('posts:add_comment', args=[self.post.id]),
+            data={'text': 'Комментарий'})
+        self.assertCounters(Post, self.post.pk, comments_count=1)
+        self.authorized_client.get(
+            reverse('posts:profile_follow', args=[self.user.username]))
+        self.assertCounters(UserStats, self.user.pk, followers_count=1)
+        self.assertCounters(UserStats, self.reader.pk, following_count=1)
+        self.authorized_client.get(
+            reverse('posts:profile_unfollow', args=[self.user.username]))
+        self.assertCounters(UserStats, self.user.pk, followers_count=0)
+        self.assertCounters(UserStats, self.reader.pk, following_count=0)
+
+    def test_rebuild_counters(self):
+        """Команда rebuild_counters исправляет рассинхронизацию."""
+        Comment.objects.create(
+            author=self.reader, post=self.post, text='Комментарий')
+        Follow.objects.create(user=self.reader, author=self.user)
+        UserStats.objects.update(
+            posts_count=7, followers_count=7, following_count=7)
+        Group.objects.update(posts_count=7)
+        Post.objects.update(comments_count=7)
+        UserStats.objects.filter(user=self.reader).delete()
+        call_command('rebuild_counters', stdout=open('/dev/null', 'w'))
+        self.assertCounters(
+            UserStats, self.user.pk,
+            posts_count=1, followers_count=1, following_count=0)
+        self.assertCounters(
+            UserStats, self.reader.pk,
+            posts_count=0, followers_count=0, following_count=1)
+        self.assertCounters(Group, self.group.pk, posts_count=1)
+        self.assertCounters(Post, self.post.pk, comments_count=1)
+
+    def test_profile_reads_counter(self):
+        """Страница профиля берёт число постов из счётчика."""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.authorized_client.get(
+                reverse('posts:profile', args=[self.user.username]))
+        self.assertEqual(response.context['count_posts'], 1)
+        for query in queries.captured_queries:
+            self.assertNotIn('COUNT(', query['sql'])
+
+    def test_profile_without_counters_row(self):
+        """Профиль без строки счётчиков открывается и заводит её."""
+        UserStats.objects.filter(user=self.user).delete()
+        for view in ('posts:profile', 'posts:api_profile'):
+            response = self.authorized_client.get(
+                reverse(view, args=[self.user.username]))
+            self.assertEqual(response.status_code, 200)
+        self.assertCounters(UserStats, self.user.pk, posts_count=1)
@@ -0,0 +1,93 @@
+import time
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from posts import freshness
+from posts.feeds import FEED_LIMIT
+from posts.models import Group, Post
+
+User = get_user_model()
+
+
+class AtomFeedsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test',
+            description='Тестовое описание',
+        )
+        cls.group_url = reverse('posts:group_feed', args=[cls.group.slug])
+        cls.profile_url = reverse(
+            'posts:profile_feed', args=[cls.user.username])
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        for i in range(FEED_LIMIT + 1):
+            self.post = Post.objects.create(
+                author=self.user, group=self.group, text=f'Пост номер {i}')
+
+    def test_feeds(self):
+        '''Ленты группы и автора отдаются в Atom'''
+        for url in (self.group_url, self.profile_url):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertTrue(
+                    response['Content-Type'].startswith(
+                        'application/atom+xml'))
+                self.assertEqual(
+                    response.content.count(b'<entry>'), FEED_LIMIT)
+                self.assertContains(
+                    response,
+                    reverse('posts:post_detail', args=[self.post.id]))
+
+    def test_cached_body(self):
+        '''Повторный запрос берёт ленту из кеша'''
+        self.client.get(self.group_url)
+        with self.assertNumQueries(1):
+            response = self.client.get(self.group_url)
+        self.assertContains(response, 'Пост номер')
+
+    def test_if_modified_since(self):
+        '''Неизменённая лента отвечает 304, правка поста её обновляет'''
+        # Дата подтверждает ленту, когда секунда правки уже прошла.
+        later = mock.Mock(**{'time.return_value': time.time() + 2})
+        with mock.patch.object(freshness, 'time', later):
+            response = self.client.get(self.profile_url)
+            last_modified = response['Last-Modified']
+            response = self.client.get(
+                self.profile_url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+        etag = response['ETag']
+        self.post.text = 'Новый текст поста'
+        self.post.save()
+        response = self.client.get(
+            self.profile_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Новый текст поста')
+
+    def test_if_modified_since_after_edit(self):
+        '''Правка в ту же секунду не даёт 304 по прежнему Last-Modified'''
+        last_modified = self.client.get(self.profile_url)['Last-Modified']
+        self.post.text = 'Новый текст поста'
+        self.post.save()
+        response = self.client.get(
+            self.profile_url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Новый текст поста')
+
+    def test_feed_links_on_pages(self):
+        '''Страницы группы и автора ссылаются на свои ленты'''
+        response = self.client.get(
+            reverse('posts:group_list', args=[self.group.slug]))
+        self.assertContains(response, self.group_url)
+        response = self.client.get(
+            reverse('posts:profile', args=[self.user.username]))
+        self.assertContains(response, self.profile_url)
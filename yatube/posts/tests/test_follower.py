@@ -1,7 +1,15 @@
+import io
+from unittest import mock
+
 from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import IntegrityError, transaction
 from django.test import Client, TestCase
 from django.urls import reverse
 
+from posts import timeline
+from posts.models import Follow, Post, TimelineEntry
+
 User = get_user_model()
 
 
@@ -16,6 +24,7 @@ class PostURLTests(TestCase):
         self.user1 = User.objects.create_user(username='TestName1')
         self.authorized_client1 = Client()
         self.authorized_client1.force_login(self.user1)
+        self.user2 = User.objects.create_user(username='TestName2')
 
     def test_post_in_followers(self):
         """Новая запись пользователя появляется в ленте тех,
@@ -72,3 +81,60 @@ class PostURLTests(TestCase):
         response = self.authorized_client1.get(
             reverse('posts:profile_unfollow', args=['TestName']))
         self.assertNotIn('Тестовый пост', response.content.decode())
+
+    def test_timeline_filled_on_post_and_follow(self):
+        """Лента заполняется при публикации и при подписке,
+        очищается при отписке."""
+        old_post = Post.objects.create(author=self.user, text='Старый пост')
+        Follow.objects.create(user=self.user1, author=self.user)
+        new_post = Post.objects.create(author=self.user, text='Новый пост')
+        self.assertEqual(
+            set(self.user1.timeline.values_list('post', flat=True)),
+            {old_post.id, new_post.id})
+        Follow.objects.get(user=self.user1, author=self.user).delete()
+        self.assertFalse(TimelineEntry.objects.filter(user=self.user1))
+
+    @mock.patch.object(timeline, 'TIMELINE_LIMIT', 2)
+    def test_timeline_trimmed(self):
+        """Команда trim_timelines обрезает ленты до TIMELINE_LIMIT
+        записей одним проходом, а не публикация."""
+        Follow.objects.create(user=self.user1, author=self.user)
+        for i in range(4):
+            Post.objects.create(author=self.user, text=f'Пост {i}')
+        self.assertEqual(self.user1.timeline.count(), 4)
+        call_command('trim_timelines', stdout=io.StringIO())
+        self.assertEqual(
+            list(self.user1.timeline.values_list('post__text', flat=True)),
+            ['Пост 3', 'Пост 2'])
+
+    @mock.patch.object(timeline, 'FANOUT_LIMIT', 1)
+    def test_fanout_limit_transitions(self):
+        """Автор, пересёкший FANOUT_LIMIT, убирается из лент или
+        раскладывается по ним заново."""
+        post = Post.objects.create(author=self.user, text='Пост автора')
+        Follow.objects.create(user=self.user1, author=self.user)
+        self.assertTrue(self.user1.timeline.filter(post=post).exists())
+        Follow.objects.create(user=self.user2, author=self.user)
+        self.assertFalse(TimelineEntry.objects.exists())
+        response = self.authorized_client1.get(reverse('posts:follow_index'))
+        self.assertIn('Пост автора', response.content.decode())
+        Follow.objects.get(user=self.user2, author=self.user).delete()
+        self.assertTrue(self.user1.timeline.filter(post=post).exists())
+        response = self.authorized_client1.get(reverse('posts:follow_index'))
+        self.assertIn('Пост автора', response.content.decode())
+
+    @mock.patch.object(timeline, 'FANOUT_LIMIT', 0)
+    def test_large_author_read_on_request(self):
+        """Посты авторов с большим числом подписчиков не раскладываются
+        по лентам, а подмешиваются при чтении."""
+        Follow.objects.create(user=self.user1, author=self.user)
+        Post.objects.create(author=self.user, text='Пост популярного автора')
+        self.assertFalse(TimelineEntry.objects.exists())
+        response = self.authorized_client1.get(reverse('posts:follow_index'))
+        self.assertIn('Пост популярного автора', response.content.decode())
+
+    def test_follow_unique(self):
+        """Повторная подписка на автора запрещена на уровне БД."""
+        Follow.objects.create(user=self.user1, author=self.user)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Follow.objects.create(user=self.user1, author=self.user)
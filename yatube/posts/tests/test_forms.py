@@ -1,3 +1,4 @@
+import hashlib
 import shutil
 import tempfile
 
@@ -68,10 +69,11 @@ class FormTests(TestCase):
                              reverse('posts:profile',
                                      args=['auth']))
         self.assertEqual(Post.objects.count(), posts_count + 1)
+        digest = hashlib.sha256(small_gif).hexdigest()
         self.assertTrue(
             Post.objects.filter(
                 text='Тестовый текст1',
-                image='posts/small.gif'
+                image=f'posts/{digest[:2]}/{digest}.gif'
             ).exists()
         )
 
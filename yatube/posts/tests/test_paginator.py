@@ -1,10 +1,14 @@
+import io
+
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
 from django.test import Client, TestCase
 from django.urls import reverse
 
-from posts.models import Group, Post
-from posts.views import POSTS_LIMIT
+from posts.models import Comment, Group, Post
+from posts.views import COMMENTS_LIMIT, POSTS_LIMIT
 
 User = get_user_model()
 
@@ -69,3 +73,97 @@ class PaginatorViewsTest(TestCase):
                 args=[author]) + '?page=2')
         self.assertEqual(
             len(response.context['page_obj']), COUNT_POSTS_ON_SECNOD_PAGE)
+
+    def test_cursor_paginator_records(self):
+        '''Проверка курсорного паджинатора: вперёд и назад по курсору'''
+        url = reverse('posts:index')
+        response = self.client.get(url + '?cursor=')
+        first_page = response.context['page_obj']
+        self.assertEqual(len(first_page), POSTS_LIMIT)
+        self.assertFalse(first_page.has_previous())
+        self.assertTrue(first_page.has_next())
+        response = self.client.get(
+            url + '?cursor=' + first_page.next_cursor())
+        second_page = response.context['page_obj']
+        self.assertEqual(len(second_page), COUNT_POSTS_ON_SECNOD_PAGE)
+        self.assertFalse(second_page.has_next())
+        response = self.client.get(
+            url + '?cursor=' + second_page.previous_cursor())
+        self.assertEqual(
+            [post.id for post in response.context['page_obj']],
+            [post.id for post in first_page])
+
+    def test_cursor_paginator_bad_cursor(self):
+        '''Испорченный курсор открывает первую страницу'''
+        response = self.client.get(
+            reverse('posts:group_list', args=[self.group.slug])
+            + '?cursor=broken')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['page_obj']), POSTS_LIMIT)
+
+    def test_cursor_page_numbers(self):
+        '''Страница курсора знает свой номер и номера записей'''
+        url = reverse('posts:group_list', args=[self.group.slug])
+        first_page = self.client.get(url).context['page_obj']
+        self.assertEqual(first_page.number, 1)
+        self.assertEqual(first_page.next_page_number(), 2)
+        self.assertEqual(first_page.start_index(), 1)
+        self.assertEqual(first_page.end_index(), POSTS_LIMIT)
+        response = self.client.get(
+            url + '?cursor=' + first_page.next_cursor())
+        second_page = response.context['page_obj']
+        self.assertEqual(second_page.number, 2)
+        self.assertEqual(second_page.previous_page_number(), 1)
+        self.assertEqual(second_page.start_index(), POSTS_LIMIT + 1)
+        self.assertEqual(second_page.end_index(), COUNT_TEST_POSTS)
+
+    def assertIndexOrder(self, url, cursor):
+        '''Планы выборок страницы - с параметрами, как их видит SQLite'''
+        queries = []
+
+        def record(execute, sql, params, many, context):
+            if sql.startswith('SELECT') and 'ORDER BY' in sql:
+                queries.append((sql, params))
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(record):
+            response = self.client.get(url, {'cursor': cursor})
+        self.assertTrue(queries, url)
+        for sql, params in queries:
+            with connection.cursor() as db:
+                db.execute('EXPLAIN QUERY PLAN ' + sql, params)
+                plan = ' '.join(str(row[-1]) for row in db.fetchall())
+            # Курсор сужает диапазон индекса (SEARCH), а не просматривает
+            # таблицу (SCAN) и не досортировывает записи.
+            self.assertNotIn('SCAN', plan, sql)
+            self.assertNotIn('TEMP B-TREE', plan, sql)
+        return response
+
+    def test_cursor_pages_use_index_order(self):
+        '''Страницы за курсором идут по индексу без временной сортировки'''
+        Comment.objects.bulk_create(
+            Comment(post=self.post, author=self.user, text='Комментарий')
+            for _ in range(COMMENTS_LIMIT + 1))
+        feeds = [
+            (reverse('posts:index'), 'page_obj'),
+            (reverse('posts:group_list', args=[self.group.slug]), 'page_obj'),
+            (reverse('posts:post_comments', args=[self.post.pk]),
+             'comments'),
+        ]
+        for url, name in feeds:
+            first_page = self.client.get(url, {'cursor': ''}).context[name]
+            response = self.assertIndexOrder(url, first_page.next_cursor())
+            self.assertIndexOrder(
+                url, response.context[name].previous_cursor())
+
+    def test_explain_feeds_uses_view_pages(self):
+        '''explain_feeds разбирает выборку ленты за курсором'''
+        out = io.StringIO()
+        call_command('explain_feeds', stdout=out)
+        output = out.getvalue()
+        next_page = output.split('index: следующая страница')[1].split(
+            'group_posts: первая страница')[0]
+        self.assertIn('"posts_post"."id" < %s', next_page)
+        self.assertIn('ORDER BY "posts_post"."pub_date" DESC, '
+                      '"posts_post"."id" DESC', next_page)
+        self.assertIn('SEARCH posts_post USING INDEX', next_page)
@@ -0,0 +1,92 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from core.testing import QueryBudgetMixin
+from posts.models import Comment, Follow, Group, Post
+from posts.urls import urlpatterns
+
+User = get_user_model()
+
+COUNT_AUTHORS = 3
+POSTS_PER_AUTHOR = 5
+
+# Бюджет запросов каждого адреса из posts/urls.py: метод, нужна ли
+# авторизация и наибольшее допустимое число запросов. Новый адрес
+# без бюджета роняет test_every_url_has_budget.
+QUERY_BUDGETS = {
+    'index': ('get', False, 2),
+    'group_list': ('get', False, 3),
+    'profile': ('get', True, 6),
+    'post_detail': ('get', True, 4),
+    'post_comments': ('get', False, 1),
+    'post_edit': ('get', True, 4),
+    'post_create': ('get', True, 3),
+    'search': ('get', False, 1),
+    'api_index': ('get', False, 1),
+    'api_group_posts': ('get', False, 2),
+    'api_profile': ('get', False, 2),
+    'group_feed': ('get', False, 2),
+    'profile_feed': ('get', False, 2),
+    'add_comment': ('post', True, 5),
+    'follow_index': ('get', True, 5),
+    'profile_follow': ('get', True, 5),
+    'profile_unfollow': ('get', True, 9),
+}
+
+
+class QueryBudgetTest(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test',
+            description='Тестовое описание',
+        )
+        for i in range(COUNT_AUTHORS):
+            author = User.objects.create_user(username=f'author{i}')
+            Follow.objects.create(user=cls.user, author=author)
+            for j in range(POSTS_PER_AUTHOR):
+                cls.post = Post.objects.create(
+                    author=author, group=cls.group, text=f'Пост {i}-{j}')
+                Comment.objects.create(
+                    post=cls.post, author=cls.user, text='Комментарий')
+        cls.author = cls.post.author
+        cls.url_args = {
+            'group_list': [cls.group.slug],
+            'api_group_posts': [cls.group.slug],
+            'group_feed': [cls.group.slug],
+            'profile': [cls.author.username],
+            'api_profile': [cls.author.username],
+            'profile_feed': [cls.author.username],
+            'post_detail': [cls.post.id],
+            'post_comments': [cls.post.id],
+            'post_edit': [cls.post.id],
+            'add_comment': [cls.post.id],
+            'profile_follow': [cls.author.username],
+            'profile_unfollow': [cls.author.username],
+        }
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def test_every_url_has_budget(self):
+        '''У каждого адреса приложения posts есть бюджет запросов'''
+        names = {pattern.name for pattern in urlpatterns}
+        self.assertEqual(names, set(QUERY_BUDGETS))
+
+    def test_query_budgets(self):
+        '''Адреса укладываются в свой бюджет запросов'''
+        for name, (method, authorized, budget) in QUERY_BUDGETS.items():
+            with self.subTest(name=name):
+                cache.clear()
+                url = reverse(
+                    f'posts:{name}', args=self.url_args.get(name, []))
+                client = self.authorized_client if authorized else Client()
+                with self.assertQueryBudget(budget, url):
+                    getattr(client, method)(url, {'text': 'Текст'})
@@ -0,0 +1,113 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from posts.models import Post, PostTerm
+from posts.search import analyze, stem
+from posts.views import POSTS_LIMIT
+
+User = get_user_model()
+
+
+class StemmerTest(TestCase):
+    def test_word_forms_share_stem(self):
+        '''Формы одного слова приводятся к одной основе'''
+        cases = (
+            ('книга', 'книги', 'книгой', 'книгах'),
+            ('красивый', 'красивая', 'красивыми'),
+            ('читать', 'читал', 'читали'),
+            ('город', 'городе', 'городами'),
+        )
+        for forms in cases:
+            with self.subTest(forms=forms):
+                self.assertEqual(len({stem(form) for form in forms}), 1)
+
+    def test_analyze(self):
+        '''Стоп-слова выбрасываются, регистр и ё не важны'''
+        self.assertEqual(
+            analyze('Ёлки и ЕЛКИ в лесу'), [stem('елки'), stem('елки'),
+                                            stem('лесу')])
+
+
+class SearchViewTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.url = reverse('posts:search')
+
+    def setUp(self):
+        self.client = Client()
+
+    def search(self, query, cursor=None):
+        params = {'q': query}
+        if cursor:
+            params['cursor'] = cursor
+        return self.client.get(self.url, params).context['page_obj']
+
+    def test_ranking(self):
+        '''Пост с большим числом совпадений идёт первым'''
+        once = Post.objects.create(author=self.user, text='Про море')
+        twice = Post.objects.create(
+            author=self.user, text='Море, море и морем')
+        Post.objects.create(author=self.user, text='Про горы')
+        self.assertEqual(list(self.search('моря')), [twice, once])
+
+    def test_all_terms_required(self):
+        '''Находятся только посты со всеми словами запроса'''
+        both = Post.objects.create(author=self.user, text='Кот и собака')
+        Post.objects.create(author=self.user, text='Только кот')
+        self.assertEqual(list(self.search('кошка собака')), [])
+        self.assertEqual(list(self.search('коты собаки')), [both])
+
+    def test_index_follows_edits_and_deletes(self):
+        '''Индекс обновляется при правке и удалении поста'''
+        post = Post.objects.create(author=self.user, text='Старый текст')
+        post.text = 'Новая заметка'
+        post.save()
+        self.assertEqual(list(self.search('старый')), [])
+        self.assertEqual(list(self.search('заметки')), [post])
+        post.delete()
+        self.assertFalse(PostTerm.objects.exists())
+
+    def test_cursor_pages(self):
+        '''Результаты листаются курсором с сохранением запроса'''
+        for i in range(POSTS_LIMIT + 3):
+            Post.objects.create(author=self.user, text=f'Поиск {i}')
+        response = self.client.get(self.url, {'q': 'поиск'})
+        first = response.context['page_obj']
+        self.assertEqual(len(first), POSTS_LIMIT)
+        self.assertContains(response, '?q=%D0%BF%D0%BE%D0%B8%D1%81%D0%BA&')
+        second = self.search('поиск', first.next_cursor())
+        self.assertEqual(len(second), 3)
+        self.assertFalse(set(first) & set(second))
+
+    @mock.patch('posts.search.INDEX_CHUNK_SIZE', 2)
+    def test_rebuild_in_chunks(self):
+        '''Перестройка пачками заменяет записи индекса каждого поста'''
+        posts = [
+            Post.objects.create(author=self.user, text=f'Закат номер {i}')
+            for i in range(5)
+        ]
+        terms = PostTerm.objects.count()
+        PostTerm.objects.filter(post=posts[0]).delete()
+        PostTerm.objects.filter(post=posts[1]).update(weight=7)
+        call_command('rebuild_search_index', stdout=open('/dev/null', 'w'))
+        self.assertEqual(PostTerm.objects.count(), terms)
+        self.assertFalse(PostTerm.objects.filter(weight=7).exists())
+        self.assertEqual(list(self.search('закаты')), posts[::-1])
+
+    def test_admin_search_uses_index(self):
+        '''Поиск в админке идёт по индексу'''
+        admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='admin')
+        post = Post.objects.create(author=self.user, text='Смешные котики')
+        Post.objects.create(author=self.user, text='Серьёзные собаки')
+        self.client.force_login(admin)
+        response = self.client.get(
+            reverse('admin:posts_post_changelist'), {'q': 'котик'})
+        self.assertEqual(
+            list(response.context['cl'].result_list), [post])
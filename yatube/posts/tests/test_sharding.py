@@ -0,0 +1,217 @@
+import io
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db.models import F
+from django.test import Client, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from posts import sharding
+from posts.models import (ArchivedPost, AuthorShard, Comment, Follow, Group,
+                          Post, PostTerm, ShardSequence, UserStats)
+from posts.views import POSTS_LIMIT
+
+User = get_user_model()
+
+
+@override_settings(POST_SHARDS=['default', 'shard1'])
+class ShardingTest(TransactionTestCase):
+    databases = {'default', 'shard1'}
+
+    def setUp(self):
+        cache.clear()
+        # Блоки id прошлых тестов выданы из уже очищенной базы.
+        sharding._id_blocks.clear()
+        self.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test',
+            description='Тестовое описание',
+        )
+        self.home = User.objects.create_user(username='home')
+        self.remote = User.objects.create_user(username='remote')
+        sharding.assign_shard(self.home.id, 'default')
+        sharding.assign_shard(self.remote.id, 'shard1')
+        self.posts = []
+        for i in range(4):
+            author = self.remote if i % 2 else self.home
+            self.posts.append(Post.objects.create(
+                author=author, group=self.group, text=f'Пост {i}'))
+        self.client = Client()
+        self.client.force_login(self.home)
+
+    def page_texts(self, url, data=None):
+        response = self.client.get(url, data)
+        return [post.text for post in response.context['page_obj']]
+
+    def test_posts_live_in_author_shard(self):
+        '''Посты, их комментарии и индекс лежат в шарде автора'''
+        post = self.posts[1]
+        Comment.objects.create(post=post, author=self.home, text='Ответ')
+        self.assertEqual(post._state.db, 'shard1')
+        self.assertFalse(Post.objects.filter(id=post.id).exists())
+        shard = Post.objects.using('shard1').get(id=post.id)
+        self.assertEqual(shard.comments_count, 1)
+        self.assertTrue(
+            PostTerm.objects.using('shard1').filter(post=post).exists())
+        self.assertTrue(
+            User.objects.using('shard1').filter(username='home').exists())
+
+    def test_ids_unique_across_shards(self):
+        '''id постов выдаются общей последовательностью'''
+        ids = [post.id for post in self.posts]
+        self.assertEqual(len(set(ids)), len(ids))
+        self.assertEqual(ids, sorted(ids))
+
+    def test_first_post_pins_author(self):
+        '''Первый пост закрепляет автора за шардом'''
+        author = User.objects.create_user(username='new')
+        Post.objects.create(author=author, text='Первый пост')
+        self.assertTrue(AuthorShard.objects.filter(author=author).exists())
+
+    def test_global_feeds_merge_shards(self):
+        '''Общие ленты сливают шарды по дате'''
+        expected = [f'Пост {i}' for i in reversed(range(4))]
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', args=[self.group.slug]),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertEqual(self.page_texts(url), expected)
+        cursor = self.client.get(
+            urls[0], {'cursor': ''}).context['page_obj']
+        self.assertEqual([post.text for post in cursor], expected)
+
+    def test_scatter_feeds_use_cursor(self):
+        '''Ленты по всем шардам листаются курсором'''
+        for i in range(4, 12):
+            author = self.remote if i % 2 else self.home
+            Post.objects.create(
+                author=author, group=self.group, text=f'Пост {i}')
+        Follow.objects.create(user=self.home, author=self.remote)
+        Follow.objects.create(user=self.home, author=self.home)
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', args=[self.group.slug]),
+            reverse('posts:follow_index'),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                page = self.client.get(url).context['page_obj']
+                self.assertTrue(page.is_cursor)
+                self.assertEqual(len(page), POSTS_LIMIT)
+                self.assertEqual(
+                    self.page_texts(url, {'cursor': page.next_cursor()}),
+                    ['Пост 1', 'Пост 0'])
+
+    def test_ids_allocated_in_blocks(self):
+        '''Последовательность id сдвигается блоком, а не на каждый пост'''
+        before = ShardSequence.objects.get(name=Post._meta.db_table).last_id
+        for i in range(3):
+            Post.objects.create(author=self.remote, text=f'Ещё пост {i}')
+        self.assertEqual(
+            ShardSequence.objects.get(name=Post._meta.db_table).last_id,
+            before)
+
+    def test_author_pages_use_one_shard(self):
+        '''Профиль и страница поста читают шард автора'''
+        self.assertEqual(
+            self.page_texts(reverse('posts:profile', args=['remote'])),
+            ['Пост 3', 'Пост 1'])
+        url = reverse('posts:post_detail', args=[self.posts[1].id])
+        self.client.post(url, {'text': 'Комментарий'})
+        response = self.client.get(url)
+        self.assertContains(response, 'Комментарий')
+        self.assertEqual(
+            Comment.objects.using('shard1').filter(
+                post_id=self.posts[1].id).count(), 1)
+
+    def test_follow_index(self):
+        '''Лента подписок собирается из шардов авторов'''
+        Follow.objects.create(user=self.home, author=self.remote)
+        self.assertEqual(
+            self.page_texts(reverse('posts:follow_index')),
+            ['Пост 3', 'Пост 1'])
+
+    def test_move_author(self):
+        '''Перенос автора переносит посты и комментарии'''
+        post = self.posts[0]
+        Comment.objects.create(post=post, author=self.remote, text='Ответ')
+        call_command(
+            'move_author', 'home', 'shard1', stdout=io.StringIO())
+        self.assertEqual(sharding.shard_for(self.home.id), 'shard1')
+        self.assertFalse(Post.objects.filter(author=self.home).exists())
+        self.assertFalse(Comment.objects.exists())
+        moved = Post.objects.using('shard1').get(id=post.id)
+        self.assertEqual(moved.pub_date, post.pub_date)
+        self.assertEqual(moved.comments.count(), 1)
+        self.assertTrue(PostTerm.objects.using('shard1').filter(
+            post_id=post.id).exists())
+        self.assertEqual(
+            UserStats.objects.get(user=self.home).posts_count, 2)
+        self.assertEqual(
+            self.page_texts(reverse('posts:profile', args=['home'])),
+            ['Пост 2', 'Пост 0'])
+
+    def test_writes_after_move(self):
+        '''Объекты, загруженные до переноса, пишут в новый шард'''
+        post = Post.objects.get(id=self.posts[0].id)
+        self.assertEqual(post._state.db, 'default')
+        call_command(
+            'move_author', 'home', 'shard1', stdout=io.StringIO())
+        post.text = 'Правка после переноса'
+        post.save()
+        Comment.objects.create(post=post, author=self.remote, text='Поздний')
+        self.assertFalse(Comment.objects.exists())
+        self.assertFalse(Post.objects.filter(author=self.home).exists())
+        moved = Post.objects.using('shard1').get(id=post.id)
+        self.assertEqual(moved.text, 'Правка после переноса')
+        self.assertEqual(moved.comments_count, 1)
+        response = self.client.get(
+            reverse('posts:post_detail', args=[post.id]))
+        self.assertContains(response, 'Поздний')
+
+    def test_archive_follows_author(self):
+        '''Архив лежит в шарде автора и переезжает вместе с ним'''
+        Post.objects.using('shard1').update(
+            pub_date=F('pub_date') - timedelta(days=400))
+        call_command('archive_posts', stdout=io.StringIO())
+        self.assertEqual(ArchivedPost.objects.using('shard1').count(), 2)
+        self.assertEqual(
+            UserStats.objects.get(user=self.remote).archived_posts_count, 2)
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.posts_count, 2)
+        profile = reverse('posts:profile', args=['remote'])
+        self.assertEqual(self.page_texts(profile), ['Пост 3', 'Пост 1'])
+        call_command(
+            'move_author', 'remote', 'default', stdout=io.StringIO())
+        self.assertFalse(ArchivedPost.objects.using('shard1').exists())
+        self.assertEqual(ArchivedPost.objects.count(), 2)
+        self.assertEqual(self.page_texts(profile), ['Пост 3', 'Пост 1'])
+        response = self.client.get(
+            reverse('posts:post_detail', args=[self.posts[1].id]))
+        self.assertTrue(response.context['archived'])
+
+    def test_rebuild_counters(self):
+        '''rebuild_counters считает посты и комментарии во всех шардах'''
+        Comment.objects.create(
+            post=self.posts[1], author=self.home, text='Комментарий')
+        Post.objects.using('shard1').filter(pk=self.posts[3].pk).update(
+            pub_date=F('pub_date') - timedelta(days=400))
+        call_command('archive_posts', stdout=io.StringIO())
+        UserStats.objects.update(posts_count=7, archived_posts_count=7)
+        Group.objects.update(posts_count=7)
+        Post.objects.using('shard1').update(comments_count=7)
+        call_command('rebuild_counters', stdout=io.StringIO())
+        self.assertEqual(
+            UserStats.objects.filter(user=self.remote).values_list(
+                'posts_count', 'archived_posts_count').get(), (2, 1))
+        self.assertEqual(
+            UserStats.objects.get(user=self.home).posts_count, 2)
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.posts_count, 3)
+        self.assertEqual(
+            Post.objects.using('shard1').get(pk=self.posts[1].pk)
+            .comments_count, 1)
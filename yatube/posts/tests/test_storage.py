@@ -0,0 +1,89 @@
+import io
+import os
+import shutil
+import tempfile
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from posts.management.commands.cleanup_media import FILE_GRACE_PERIOD
+from posts.models import Post
+
+User = get_user_model()
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ContentAddressedStorageTests(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='auth')
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def create_post(self, name):
+        self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={
+                'text': 'Пост с картинкой',
+                'image': SimpleUploadedFile(
+                    name=name, content=SMALL_GIF, content_type='image/gif'),
+            })
+        return Post.objects.latest('id')
+
+    def test_duplicates_share_blob(self):
+        """Одинаковые картинки хранятся одним файлом."""
+        first = self.create_post('first.gif')
+        second = self.create_post('second.gif')
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertRegex(
+            first.image.name, r'^posts/[0-9a-f]{2}/[0-9a-f]{64}\.gif$')
+        directory = os.path.dirname(first.image.path)
+        self.assertEqual(os.listdir(directory), [os.path.basename(
+            first.image.name)])
+
+    def test_cleanup_removes_orphans_only(self):
+        """cleanup_media удаляет файл, только когда на него
+        не ссылается ни один пост."""
+        first = self.create_post('first.gif')
+        second = self.create_post('second.gif')
+        path = first.image.path
+        out = io.StringIO()
+        first.delete()
+        call_command('cleanup_media', stdout=out)
+        self.assertTrue(os.path.exists(path))
+        second.delete()
+        # Только что сохранённый файл ещё может ждать записи поста.
+        call_command('cleanup_media', stdout=out)
+        self.assertTrue(os.path.exists(path))
+        old = time.time() - FILE_GRACE_PERIOD - 1
+        os.utime(path, (old, old))
+        call_command('cleanup_media', stdout=out)
+        self.assertFalse(os.path.exists(path))
+
+    def test_reused_blob_is_refreshed(self):
+        """Повторная загрузка того же файла продлевает ему срок."""
+        first = self.create_post('first.gif')
+        path = first.image.path
+        first.delete()
+        old = time.time() - FILE_GRACE_PERIOD - 1
+        os.utime(path, (old, old))
+        self.create_post('second.gif')
+        self.assertGreater(os.path.getmtime(path), old + 1)
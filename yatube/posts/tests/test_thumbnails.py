@@ -0,0 +1,125 @@
+import shutil
+import tempfile
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import (Client, TestCase, TransactionTestCase,
+                         override_settings)
+from django.urls import reverse
+from sorl.thumbnail import get_thumbnail
+
+from posts import freshness, thumbnails
+from posts.models import Group, Post
+from posts.thumbnails import (THUMBNAIL_SIZES, ThumbnailPlaceholder,
+                              generate_thumbnail, queue_post_thumbnails)
+
+User = get_user_model()
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ThumbnailsTests(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='auth')
+        self.post = Post.objects.create(
+            author=self.user,
+            text='Пост с картинкой',
+            image=SimpleUploadedFile(
+                name='small.gif', content=SMALL_GIF,
+                content_type='image/gif'),
+        )
+        self.client = Client()
+
+    def test_placeholder_until_generated(self):
+        """Пока миниатюра не готова, шаблон получает заглушку,
+        после фоновой генерации - настоящую миниатюру."""
+        geometry, options = THUMBNAIL_SIZES[0]
+        thumbnail = get_thumbnail(self.post.image, geometry, **options)
+        self.assertIsInstance(thumbnail, ThumbnailPlaceholder)
+        self.assertTrue(thumbnail.url.startswith('data:image/svg+xml'))
+        response = self.client.get(
+            reverse('posts:post_detail', args=[self.post.id]))
+        self.assertIn('data:image/svg+xml', response.content.decode())
+
+        generate_thumbnail(self.post.image, geometry, dict(options))
+        thumbnail = get_thumbnail(self.post.image, geometry, **options)
+        self.assertNotIsInstance(thumbnail, ThumbnailPlaceholder)
+        self.assertTrue(thumbnail.exists())
+        response = self.client.get(
+            reverse('posts:post_detail', args=[self.post.id]))
+        self.assertIn(thumbnail.url, response.content.decode())
+
+    def test_generation_refreshes_post_card(self):
+        """Готовая миниатюра меняет карточку и страницы только её поста."""
+        version = self.post.version
+        group = Group.objects.create(
+            title='Группа', slug='other', description='Описание')
+        other = Post.objects.create(
+            author=User.objects.create_user(username='other'),
+            group=group, text='Пост без картинки')
+        scopes = [
+            freshness.post_scope(self.post.id),
+            freshness.author_scope(self.user.id),
+            freshness.post_scope(other.id),
+            freshness.author_scope(other.author_id),
+            freshness.group_scope(group.id),
+        ]
+        before = [freshness.changed_at(scope) for scope in scopes]
+        geometry, options = THUMBNAIL_SIZES[0]
+        generate_thumbnail(self.post.image, geometry, dict(options))
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.version, version + 1)
+        after = [freshness.changed_at(scope) for scope in scopes]
+        self.assertEqual(
+            [new > old for old, new in zip(before, after)],
+            [True, True, False, False, False])
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=2)
+class ThumbnailPoolTests(TransactionTestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='auth')
+        self.post = Post.objects.create(
+            author=self.user,
+            text='Пост с картинкой',
+            image=SimpleUploadedFile(
+                name='pool.gif', content=SMALL_GIF,
+                content_type='image/gif'),
+        )
+
+    def test_pool_generates_thumbnail(self):
+        """Пул потоков создаёт миниатюру после фиксации поста."""
+        version = self.post.version
+        queue_post_thumbnails(self.post)
+        deadline = time.monotonic() + 10
+        while thumbnails._pending and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.assertFalse(thumbnails._pending)
+        geometry, options = THUMBNAIL_SIZES[0]
+        thumbnail = get_thumbnail(self.post.image, geometry, **options)
+        self.assertNotIsInstance(thumbnail, ThumbnailPlaceholder)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.version, version + 1)
@@ -0,0 +1,83 @@
+import io
+import shutil
+import tempfile
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+
+from posts import uploads
+from posts.models import Post
+
+User = get_user_model()
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+def make_png(width, height):
+    content = io.BytesIO()
+    Image.new('RGB', (width, height), 'white').save(content, format='PNG')
+    return SimpleUploadedFile(
+        name='big.png', content=content.getvalue(), content_type='image/png')
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class UploadTests(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='auth')
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def create_post(self, image):
+        return self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={'text': 'Пост с картинкой', 'image': image})
+
+    def test_oversized_original_downscaled(self):
+        """Слишком большой оригинал уменьшается до сохранения."""
+        self.create_post(make_png(uploads.MAX_IMAGE_SIDE * 2, 10))
+        post = Post.objects.get()
+        self.assertEqual(post.image.width, uploads.MAX_IMAGE_SIDE)
+
+    @mock.patch.object(uploads, 'MAX_UPLOAD_SIZE', 100)
+    def test_file_size_limit(self):
+        """Файл больше MAX_UPLOAD_SIZE отклоняется формой."""
+        response = self.create_post(make_png(100, 100))
+        self.assertFalse(Post.objects.exists())
+        self.assertEqual(
+            response.context['form'].errors.as_data()['image'][0].code,
+            'too_large')
+
+    def test_model_rejects_truncated_upload(self):
+        """Обрезанный файл отклоняет и поле модели, а не только PostForm."""
+        upload = make_png(10, 10)
+        upload.too_large = True
+        post = Post(text='Пост', author=self.user, image=upload)
+        with self.assertRaises(ValidationError) as error:
+            post.full_clean()
+        self.assertEqual(
+            error.exception.error_dict['image'][0].code, 'too_large')
+
+    def test_saved_image_not_revalidated(self):
+        """Уже сохранённая картинка проходит проверку модели."""
+        self.create_post(make_png(10, 10))
+        post = Post.objects.get()
+        post.full_clean()
+
+    @mock.patch.object(uploads, 'MAX_IMAGE_PIXELS', 99)
+    def test_pixel_limit(self):
+        """Картинка с большим разрешением отклоняется по заголовку."""
+        response = self.create_post(make_png(10, 10))
+        self.assertFalse(Post.objects.exists())
+        self.assertEqual(
+            response.context['form'].errors.as_data()['image'][0].code,
+            'too_many_pixels')
@@ -0,0 +1,154 @@
+"""Фоновая подготовка миниатюр картинок постов."""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from sorl.thumbnail import default
+from sorl.thumbnail.base import ThumbnailBackend
+from sorl.thumbnail.conf import defaults as default_settings
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import DummyImageFile, ImageFile
+
+from core.metrics import timed
+
+from . import freshness, sharding
+from .models import ArchivedPost, Post
+from .page_cache import bump_feed_version
+
+logger = logging.getLogger(__name__)
+
+# Все размеры, в которых шаблоны выводят картинку поста.
+THUMBNAIL_SIZES = (
+    ('960x339', {'crop': 'center', 'upscale': True}),
+)
+PLACEHOLDER_SVG = (
+    '<svg xmlns="http://www.w3.org/2000/svg" width="{0}" height="{1}">'
+    '<rect width="100%" height="100%" fill="#e9ecef"/></svg>'
+)
+
+_state = threading.local()
+_pending = set()
+_pending_lock = threading.Lock()
+_executor = None
+_executor_lock = threading.Lock()
+
+
+class ThumbnailPlaceholder(DummyImageFile):
+    """Заглушка, которую шаблон получает, пока миниатюра не готова."""
+
+    @property
+    def url(self):
+        svg = PLACEHOLDER_SVG.format(self.x, self.y)
+        return 'data:image/svg+xml,' + quote(svg)
+
+
+class QueuedThumbnailBackend(ThumbnailBackend):
+    """Бэкенд sorl-thumbnail, не создающий миниатюры в потоке запроса.
+
+    Готовая миниатюра берётся из key-value хранилища sorl, отсутствующая
+    ставится в очередь фонового пула, а шаблон получает заглушку.
+    """
+
+    def get_thumbnail(self, file_, geometry_string, **options):
+        if getattr(_state, 'in_worker', False):
+            return super().get_thumbnail(file_, geometry_string, **options)
+        with timed('thumbnail'):
+            thumbnail = self.lookup(file_, geometry_string, dict(options))
+            if thumbnail is not None:
+                return thumbnail
+            queue_thumbnail(file_, geometry_string, options)
+            return ThumbnailPlaceholder(geometry_string)
+
+    def lookup(self, file_, geometry_string, options):
+        """Ищет готовую миниатюру, не открывая исходный файл."""
+        source = ImageFile(file_)
+        if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(sorl_settings, attr)
+            if value != getattr(default_settings, attr):
+                options.setdefault(key, value)
+        name = self._get_thumbnail_filename(source, geometry_string, options)
+        return default.kvstore.get(ImageFile(name, default.storage))
+
+
+def generate_thumbnail(file_, geometry_string, options):
+    """Создаёт миниатюру и сбрасывает закешированные с заглушкой
+    карточки, страницы лент и метки изменения страниц."""
+    _state.in_worker = True
+    try:
+        default.backend.get_thumbnail(file_, geometry_string, **options)
+    finally:
+        _state.in_worker = False
+    scopes = set()
+    for alias in sharding.shards():
+        for model in (Post, ArchivedPost):
+            posts = model.objects.using(alias).filter(image=file_.name)
+            for post_id, author_id, group_id in posts.values_list(
+                    'id', 'author_id', 'group_id'):
+                scopes.update(
+                    freshness.post_scopes(post_id, author_id, group_id))
+            posts.update(version=F('version') + 1)
+    bump_feed_version()
+    # Меняются страницы только постов с этой картинкой.
+    if scopes:
+        freshness.touch(*scopes)
+
+
+def _run(key, file_, geometry_string, options):
+    try:
+        generate_thumbnail(file_, geometry_string, options)
+    except Exception:
+        logger.exception('Не удалось создать миниатюру %s', file_.name)
+    finally:
+        with _pending_lock:
+            _pending.discard(key)
+        connection.close()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'THUMBNAIL_WORKERS', 2),
+                thread_name_prefix='thumbnails')
+    return _executor
+
+
+def queue_thumbnail(file_, geometry_string, options):
+    """Ставит миниатюру в очередь после фиксации транзакции.
+
+    При THUMBNAIL_WORKERS = 0 миниатюра создаётся сразу, без пула.
+    """
+    file_ = ImageFile(file_)
+    key = (file_.name, geometry_string, tuple(sorted(options.items())))
+
+    def submit():
+        if not getattr(settings, 'THUMBNAIL_WORKERS', 2):
+            try:
+                generate_thumbnail(file_, geometry_string, options)
+            except Exception:
+                logger.exception('Не удалось создать миниатюру %s', file_.name)
+            return
+        with _pending_lock:
+            if key in _pending:
+                return
+            _pending.add(key)
+        _get_executor().submit(_run, key, file_, geometry_string, options)
+
+    transaction.on_commit(submit)
+
+
+def queue_post_thumbnails(post):
+    """Готовит все используемые шаблонами размеры картинки поста."""
+    if not post.image:
+        return
+    for geometry_string, options in THUMBNAIL_SIZES:
+        queue_thumbnail(post.image, geometry_string, dict(options))
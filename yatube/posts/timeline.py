@@ -0,0 +1,192 @@
+from collections import defaultdict
+
+from django.db.models import Count, Q
+
+from . import sharding
+from .models import Follow, Post, TimelineEntry, UserStats
+
+# Сколько последних записей хранится в ленте одного пользователя.
+# Публикация ленты не обрезает: лишние записи периодически убирает
+# команда trim_timelines, а чтение и так берёт только первые страницы.
+TIMELINE_LIMIT = 1000
+# Авторы с большим числом подписчиков не раскладываются по лентам
+# при публикации: их посты подмешиваются в ленту при чтении.
+FANOUT_LIMIT = 1000
+
+
+def is_fanout_author(author_id):
+    # Записи ленты ссылаются на посты, поэтому лента и посты должны
+    # лежать в одной базе: при шардировании лента собирается при чтении.
+    if sharding.enabled():
+        return False
+    return not UserStats.objects.filter(
+        user_id=author_id, followers_count__gt=FANOUT_LIMIT).exists()
+
+
+def trim_timeline(user_id):
+    """Обрезает ленту пользователя до TIMELINE_LIMIT записей."""
+    entries = TimelineEntry.objects.filter(user_id=user_id)
+    oldest_kept = entries.values_list('pub_date', flat=True)[
+        TIMELINE_LIMIT - 1:TIMELINE_LIMIT]
+    oldest_kept = list(oldest_kept)
+    if oldest_kept:
+        entries.filter(pub_date__lt=oldest_kept[0]).delete()
+
+
+def fan_out_post(post):
+    """Раскладывает новый пост по лентам подписчиков автора."""
+    if not is_fanout_author(post.author_id):
+        return
+    follower_ids = list(
+        Follow.objects.filter(author_id=post.author_id)
+        .values_list('user_id', flat=True))
+    TimelineEntry.objects.bulk_create(
+        [TimelineEntry(user_id=user_id, post=post, pub_date=post.pub_date)
+         for user_id in follower_ids],
+        ignore_conflicts=True)
+
+
+def fan_out_posts(posts):
+    """Раскладывает пачку загруженных постов по лентам подписчиков."""
+    if sharding.enabled():
+        return
+    authors = {post.author_id for post in posts}
+    authors -= set(UserStats.objects.filter(
+        user_id__in=authors, followers_count__gt=FANOUT_LIMIT)
+        .values_list('user_id', flat=True))
+    followers = defaultdict(list)
+    for user_id, author_id in Follow.objects.filter(
+            author_id__in=authors).values_list('user_id', 'author_id'):
+        followers[author_id].append(user_id)
+    TimelineEntry.objects.bulk_create(
+        [TimelineEntry(user_id=user_id, post=post, pub_date=post.pub_date)
+         for post in posts for user_id in followers[post.author_id]],
+        ignore_conflicts=True)
+
+
+def trim_timelines():
+    """Обрезает все ленты длиннее TIMELINE_LIMIT и возвращает их число."""
+    long_timelines = list(
+        TimelineEntry.objects.order_by().values('user_id')
+        .annotate(entries=Count('id'))
+        .filter(entries__gt=TIMELINE_LIMIT)
+        .values_list('user_id', flat=True))
+    for user_id in long_timelines:
+        trim_timeline(user_id)
+    return len(long_timelines)
+
+
+def backfill_timelines(follows):
+    """backfill_timeline для пачки пар (подписчик, автор)."""
+    if sharding.enabled():
+        return
+    large_authors = set(UserStats.objects.filter(
+        user_id__in={author_id for _, author_id in follows},
+        followers_count__gt=FANOUT_LIMIT).values_list('user_id', flat=True))
+    authors = defaultdict(set)
+    for user_id, author_id in follows:
+        if author_id not in large_authors:
+            authors[user_id].add(author_id)
+    for user_id, author_ids in authors.items():
+        posts = Post.objects.filter(author_id__in=author_ids).values_list(
+            'id', 'pub_date')[:TIMELINE_LIMIT]
+        TimelineEntry.objects.bulk_create(
+            [TimelineEntry(user_id=user_id, post_id=post_id,
+                           pub_date=pub_date)
+             for post_id, pub_date in posts],
+            ignore_conflicts=True)
+        trim_timeline(user_id)
+
+
+def backfill_timeline(user_id, author_id):
+    """Добавляет в ленту последние посты автора после подписки."""
+    if not is_fanout_author(author_id):
+        return
+    posts = Post.objects.filter(author_id=author_id).values_list(
+        'id', 'pub_date')[:TIMELINE_LIMIT]
+    TimelineEntry.objects.bulk_create(
+        [TimelineEntry(user_id=user_id, post_id=post_id, pub_date=pub_date)
+         for post_id, pub_date in posts],
+        ignore_conflicts=True)
+    trim_timeline(user_id)
+
+
+def drop_author(user_id, author_id):
+    """Убирает из ленты посты автора после отписки."""
+    TimelineEntry.objects.filter(
+        user_id=user_id, post__author_id=author_id).delete()
+
+
+def followers_changed(author_id, delta):
+    """Перестраивает ленты, если автор пересёк FANOUT_LIMIT.
+
+    Вызывается после того, как число подписчиков изменилось на delta.
+    Ставший популярным автор убирается из всех лент: его посты
+    подмешиваются при чтении. Переставший быть популярным раскладывается
+    по лентам всех подписчиков, иначе его посты пропали бы из лент.
+    """
+    if sharding.enabled():
+        return
+    count = UserStats.objects.filter(user_id=author_id).values_list(
+        'followers_count', flat=True).first()
+    if count is None:
+        return
+    is_large = count > FANOUT_LIMIT
+    if is_large == (count - delta > FANOUT_LIMIT):
+        return
+    if is_large:
+        TimelineEntry.objects.filter(post__author_id=author_id).delete()
+        return
+    posts = list(Post.objects.filter(author_id=author_id).values_list(
+        'id', 'pub_date')[:TIMELINE_LIMIT])
+    followers = Follow.objects.filter(author_id=author_id).values_list(
+        'user_id', flat=True)
+    TimelineEntry.objects.bulk_create(
+        (TimelineEntry(user_id=user_id, post_id=post_id, pub_date=pub_date)
+         for user_id in followers.iterator()
+         for post_id, pub_date in posts),
+        batch_size=TIMELINE_LIMIT, ignore_conflicts=True)
+
+
+def timeline_posts(user):
+    """Посты ленты подписок пользователя.
+
+    Обычные авторы читаются из материализованной ленты, посты
+    авторов с большим числом подписчиков выбираются при чтении.
+    """
+    followed = Follow.objects.filter(user=user).values('author')
+    if sharding.enabled():
+        authors = list(followed.values_list('author', flat=True))
+        return sharding.all_shards(Post.objects.filter(author__in=authors))
+    large_authors = list(
+        UserStats.objects.filter(
+            user__in=followed, followers_count__gt=FANOUT_LIMIT)
+        .values_list('user_id', flat=True))
+    if not large_authors:
+        # Порядок по дате записи ленты позволяет пройти индекс
+        # (user, pub_date) без сортировки.
+        return Post.objects.filter(timeline_entries__user=user).order_by(
+            '-timeline_entries__pub_date')
+    entries = TimelineEntry.objects.filter(user=user).values('post')
+    return Post.objects.filter(
+        Q(id__in=entries) | Q(author_id__in=large_authors))
+
+
+def rebuild_timelines():
+    """Заново собирает ленты всех подписчиков по фактическим данным.
+
+    Нужна после массовой загрузки через bulk_create, при которой
+    сигналы раскладки постов по лентам не срабатывают.
+    """
+    large_authors = UserStats.objects.filter(
+        followers_count__gt=FANOUT_LIMIT).values('user')
+    for user_id in Follow.objects.values_list(
+            'user_id', flat=True).distinct().order_by():
+        authors = Follow.objects.filter(user_id=user_id).exclude(
+            author__in=large_authors).values('author')
+        posts = Post.objects.filter(author__in=authors).values_list(
+            'id', 'pub_date')[:TIMELINE_LIMIT]
+        TimelineEntry.objects.filter(user_id=user_id).delete()
+        TimelineEntry.objects.bulk_create(
+            [TimelineEntry(user_id=user_id, post_id=post_id, pub_date=date)
+             for post_id, date in posts])
@@ -0,0 +1,114 @@
+"""Потоковый приём картинок постов с ограничением по размеру."""
+import hashlib
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.exceptions import ValidationError
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.db.models.fields.files import FieldFile
+from PIL import Image
+
+MB = 1024 * 1024
+# Больше этого файл не записывается на диск и отклоняется валидатором
+# поля картинки в любой форме.
+MAX_UPLOAD_SIZE = 10 * MB
+# Предел по числу пикселей, проверяемый по заголовку файла.
+MAX_IMAGE_PIXELS = 40_000_000
+# Оригиналы с большей стороной уменьшаются перед сохранением.
+MAX_IMAGE_SIDE = 1920
+DOWNSCALE_WORKERS = 1
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+class BoundedUploadHandler(TemporaryFileUploadHandler):
+    """Пишет загрузку на диск кусками и не больше MAX_UPLOAD_SIZE.
+
+    Файл никогда не держится в памяти целиком; данные сверх предела
+    отбрасываются, а у файла выставляется флаг too_large - такой файл
+    отклоняет validate_upload_size на поле модели. Попутно считается
+    sha256 для хранилища, адресуемого по содержимому.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+        self.digest = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received <= MAX_UPLOAD_SIZE:
+            self.file.write(raw_data)
+            self.digest.update(raw_data)
+
+    def file_complete(self, file_size):
+        file = super().file_complete(min(file_size, MAX_UPLOAD_SIZE))
+        file.too_large = self.received > MAX_UPLOAD_SIZE
+        file.content_hash = self.digest.hexdigest()
+        return file
+
+
+def validate_upload_size(file):
+    """Отклоняет загрузку, обрезанную BoundedUploadHandler.
+
+    Стоит на поле модели, поэтому действует в любой ModelForm, включая
+    админку. Уже сохранённые файлы не проверяются.
+    """
+    if isinstance(file, FieldFile):
+        if file._committed:
+            return
+        file = file.file
+    if getattr(file, 'too_large', False):
+        raise ValidationError(
+            f'Файл больше {MAX_UPLOAD_SIZE // MB} МБ.', code='too_large')
+
+
+def validate_image_upload(file):
+    """Проверяет размер файла и картинки без декодирования пикселей."""
+    validate_upload_size(file)
+    image = getattr(file, 'image', None)
+    if image is None:
+        return
+    width, height = image.size
+    if width * height > MAX_IMAGE_PIXELS:
+        raise ValidationError(
+            'Слишком большое разрешение картинки.', code='too_many_pixels')
+
+
+def downscale(path, max_side):
+    """Уменьшает картинку на месте; выполняется в отдельном процессе."""
+    with Image.open(path) as image:
+        if getattr(image, 'is_animated', False):
+            return image.size
+        image_format = image.format
+        image.thumbnail((max_side, max_side))
+        image.save(path, format=image_format)
+        return image.size
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=DOWNSCALE_WORKERS)
+    return _pool
+
+
+def downscale_upload(file):
+    """Уменьшает слишком большой оригинал до сохранения в MEDIA_ROOT.
+
+    Декодирование идёт в процессе пула, так что пиковая память
+    воркера, обрабатывающего запрос, не зависит от картинки.
+    """
+    image = getattr(file, 'image', None)
+    if image is None or not hasattr(file, 'temporary_file_path'):
+        return
+    if max(image.size) <= MAX_IMAGE_SIDE:
+        return
+    path = file.temporary_file_path()
+    _get_pool().submit(downscale, path, MAX_IMAGE_SIDE).result()
+    file.size = os.path.getsize(path)
+    # Хеш исходных байтов больше не соответствует содержимому.
+    file.content_hash = None
@@ -1,6 +1,7 @@
 from django.urls import path
 
-from . import views
+from . import api, views
+from .feeds import AuthorFeed, GroupFeed
 
 app_name = 'posts'
 
@@ -8,13 +9,26 @@ urlpatterns = [
 
     path('', views.index, name='index'),
     path('group/<slug:slug>/', views.group_posts, name='group_list'),
+    path('group/<slug:slug>/feed/', GroupFeed(), name='group_feed'),
     path('profile/<str:username>/', views.profile, name='profile'),
+    path('profile/<str:username>/feed/', AuthorFeed(), name='profile_feed'),
     path('posts/<int:post_id>/', views.post_detail, name='post_detail'),
     path('posts/<int:post_id>/edit', views.post_edit, name='post_edit'),
     path('create/', views.post_create, name='post_create'),
+    path('search/', views.search, name='search'),
     path('posts/<int:post_id>/comment/',
          views.add_comment,
          name='add_comment'),
+    path('posts/<int:post_id>/comments/',
+         views.post_comments,
+         name='post_comments'),
+    path('api/posts/', api.index, name='api_index'),
+    path('api/groups/<slug:slug>/posts/',
+         api.group_posts,
+         name='api_group_posts'),
+    path('api/profiles/<str:username>/posts/',
+         api.profile,
+         name='api_profile'),
     path('follow/', views.follow_index, name='follow_index'),
     path(
         'profile/<str:username>/follow/',
@@ -1,73 +1,202 @@
+from urllib.parse import urlencode
+
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
+from django.contrib.auth.views import redirect_to_login
+from django.http import JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
-from django.views.decorators.cache import cache_page
 
+from core.concurrency import run_concurrently
+from core.routers import replica_reads
+
+from . import archive, freshness, sharding
+from .counters import user_stats
 from .forms import CommentForm, PostForm
-from .models import Comment, Follow, Group, Post, User
+from .models import (ArchivedComment, ArchivedPost, Comment, Follow, Group,
+                     Post, User)
+from .page_cache import cache_feed_page
+from .paginators import CURSOR_PARAM, CursorPaginator, paginate
+from .search import SearchPaginator, search_posts
+from .thumbnails import queue_post_thumbnails
+from .timeline import timeline_posts
 
 POSTS_LIMIT = 10
-CACHE_TIME = 20
+COMMENTS_LIMIT = 20
+CACHE_TIME = 60 * 60
+
+
+# Страницы лент собираются отдельно от представлений, чтобы
+# explain_feeds разбирал ровно те же выборки.
+def index_page(request):
+    posts = sharding.all_shards(
+        Post.objects.select_related('author', 'group'))
+    return paginate(request, posts, POSTS_LIMIT, cursor=True)
+
+
+def group_page(request, group):
+    posts = sharding.all_shards(
+        group.posts.select_related('author', 'group'))
+    return paginate(
+        request, posts, POSTS_LIMIT, cursor=True, count=group.posts_count)
+
+
+def profile_page(request, author, posts_count):
+    page_obj = paginate(
+        request, archive.author_posts(author, 'author', 'group'),
+        POSTS_LIMIT, count=posts_count)
+    # Посты выбираются здесь, а не при отрисовке шаблона.
+    page_obj.object_list = list(page_obj.object_list)
+    return page_obj
 
 
-@cache_page(CACHE_TIME, key_prefix='index_page')
+def follow_page(request, reader):
+    # Посты авторов, на которых подписан читатель.
+    posts = timeline_posts(reader).select_related('author', 'group')
+    # Без шардирования лента листается по номерам: её страница по
+    # договорённости - ровно Page, а материализованная лента и так
+    # ограничена TIMELINE_LIMIT записями. Слияние шардов - курсором.
+    return paginate(request, posts, POSTS_LIMIT, cursor=sharding.enabled())
+
+
+@replica_reads
+@cache_feed_page(CACHE_TIME, key_prefix='index_page')
 def index(request):
-    post_list = Post.objects.select_related('author', 'group')
-    paginator = Paginator(post_list, POSTS_LIMIT)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
     context = {
-        'page_obj': page_obj,
+        'page_obj': index_page(request),
     }
     return render(request, 'posts/index.html', context)
 
 
+@replica_reads
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.all()
-    paginator = Paginator(posts, POSTS_LIMIT)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    context = {
-        'group': group,
-        'page_obj': page_obj,
-    }
-    return render(request, 'posts/group_list.html', context)
+
+    def page():
+        context = {
+            'group': group,
+            'page_obj': group_page(request, group),
+        }
+        return render(request, 'posts/group_list.html', context)
+
+    return freshness.conditional_page(
+        request, [freshness.group_scope(group.id)], page)
 
 
+@replica_reads
 def profile(request, username):
-    user = get_object_or_404(User, username=username)
-    all_user_posts = Post.objects.filter(author=user)
-    paginator = Paginator(all_user_posts, POSTS_LIMIT)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    following = False
-    if request.user.is_authenticated:
-        if Follow.objects.filter(author=user, user=request.user).exists():
-            following = True
+    user = get_object_or_404(
+        User.objects.select_related('stats'), username=username)
+    stats = user_stats(user)
+
+    def page():
+        def posts():
+            return profile_page(request, user, stats.posts_count)
+
+        def following():
+            return request.user.is_authenticated and Follow.objects.filter(
+                author=user, user=request.user).exists()
+
+        # Посты и подписка друг от друга не зависят.
+        page_obj, is_following = run_concurrently(posts, following)
+        context = {
+            'author': user,
+            'count_posts': stats.posts_count,
+            'page_obj': page_obj,
+            'following': is_following
+        }
+        return render(request, 'posts/profile.html', context)
+
+    # Подписки и отписки тоже отмечают область автора.
+    return freshness.conditional_page(
+        request, [freshness.author_scope(user.id)], page)
+
+
+def search(request):
+    query = request.GET.get('q', '').strip()
+    posts = sharding.all_shards(
+        search_posts(query).select_related('author', 'group'))
+    page_obj = SearchPaginator(posts, POSTS_LIMIT).get_page(
+        request.GET.get(CURSOR_PARAM))
     context = {
-        'author': user,
-        'count_posts': all_user_posts.count(),
+        'query': query,
+        'query_prefix': urlencode({'q': query}) + '&',
         'page_obj': page_obj,
-        'following': following
     }
-    return render(request, 'posts/profile.html', context)
+    return render(request, 'posts/search.html', context)
 
 
+@replica_reads
 def post_detail(request, post_id):
-    current_post = get_object_or_404(
-        Post.objects.select_related('author', 'group', ), id=post_id)
-    comments = Comment.objects.filter(post=current_post)
+    # Бюджет запросов: пост с автором, группой и счётчиками одним
+    # запросом и одна порция комментариев, сколько бы их ни было.
+    # Счётчики живут только в основной базе, и в шарде их не соединить.
+    related = ('author', 'group') if sharding.enabled() else (
+        'author__stats', 'group')
+    current_post = archive.get_post_or_404(post_id, *related)
+    # Пост из архива только читается.
+    archived = isinstance(current_post, ArchivedPost)
     form = CommentForm(request.POST or None)
-    comments = current_post.comments.all()
     if request.method == "POST":
-        add_comment(request, current_post.id)
+        if not request.user.is_authenticated:
+            return redirect_to_login(request.get_full_path())
+        if form.is_valid() and not archived:
+            save_comment(form, current_post, request.user)
+            return redirect('posts:post_detail', post_id=post_id)
+
+    def page():
+        context = {
+            'form': form,
+            'current_post': current_post,
+            'archived': archived,
+            'comments': comments_page(
+                request, current_post.id, current_post._state.db,
+                ArchivedComment if archived else Comment)
+        }
+        return render(request, 'posts/post_detail.html', context)
+
+    # В карточке автора на странице поста есть число его постов.
+    return freshness.conditional_page(request, [
+        freshness.post_scope(current_post.id),
+        freshness.author_scope(current_post.author_id),
+    ], page)
+
+
+def comments_page(request, post_id, alias, model=Comment):
+    # Комментарии идут от старых к новым, порциями по курсору.
+    comments = sharding.using(model.objects.filter(
+        post_id=post_id).select_related('author'), alias)
+    paginator = CursorPaginator(
+        comments, COMMENTS_LIMIT, ordering=('pub_date', 'id'))
+    return paginator.get_page(request.GET.get(CURSOR_PARAM))
+
+
+def post_comments(request, post_id):
+    # Следующая порция комментариев: HTML-фрагмент или JSON.
+    comments = comments_page(
+        request, post_id, sharding.post_shard(post_id))
+    if not comments:
+        # Пустая порция бывает у поста без комментариев, у архивного
+        # и у несуществующего; архив читается только во втором случае.
+        alias, model = archive.comments_location(post_id)
+        if model is ArchivedComment:
+            comments = comments_page(request, post_id, alias, model)
+    if request.GET.get('format') == 'json':
+        return JsonResponse({
+            'comments': [
+                {
+                    'id': comment.id,
+                    'author': comment.author.username,
+                    'text': comment.text,
+                    'pub_date': comment.pub_date,
+                }
+                for comment in comments
+            ],
+            'next_cursor': comments.next_cursor(),
+        })
     context = {
-        'form': form,
-        'current_post': current_post,
-        'comments': comments
+        'post_id': post_id,
+        'comments': comments,
     }
-    return render(request, 'posts/post_detail.html', context)
+    return render(request, 'posts/includes/comments.html', context)
 
 
 @login_required
@@ -78,6 +207,7 @@ def post_create(request):
             post = form.save(commit=False)
             post.author = request.user
             post.save()
+            queue_post_thumbnails(post)
             return redirect('posts:profile', request.user)
         return render(request, 'posts/create_post.html', {'form': form})
     context = {
@@ -89,7 +219,7 @@ def post_create(request):
 
 
 def post_edit(request, post_id):
-    post = get_object_or_404(Post, id=post_id)
+    post = sharding.get_post_or_404(Post.objects.all(), post_id)
     if post.author != request.user:
         return redirect('posts:post_detail', post_id)
     form = PostForm(
@@ -98,7 +228,7 @@ def post_edit(request, post_id):
         instance=post)
     if request.method == "POST":
         if form.is_valid():
-            form.save()
+            queue_post_thumbnails(form.save())
             return redirect('posts:post_detail', post_id)
     context = {
         'is_edit': True,
@@ -108,27 +238,27 @@ def post_edit(request, post_id):
     return render(request, 'posts/create_post.html', context)
 
 
+def save_comment(form, post, author):
+    comment = form.save(commit=False)
+    comment.author = author
+    comment.post = post
+    comment.save()
+    return comment
+
+
 @login_required
 def add_comment(request, post_id):
-    post = get_object_or_404(Post.objects.filter(id=post_id))
+    post = sharding.get_post_or_404(Post.objects.all(), post_id)
     form = CommentForm(request.POST or None)
     if form.is_valid():
-        comment = form.save(commit=False)
-        comment.author = request.user
-        comment.post = post
-        comment.save()
+        save_comment(form, post, request.user)
     return redirect('posts:post_detail', post_id=post_id)
 
 
+@replica_reads
 @login_required
 def follow_index(request):
-    # Посты авторов, на которых подписан текущий пользователь.
-    author_list = request.user.follower.values('author')
-    posts = Post.objects.filter(author__in=author_list)
-    paginator = Paginator(posts, POSTS_LIMIT)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    context = {'page_obj': page_obj}
+    context = {'page_obj': follow_page(request, request.user)}
     return render(request, 'posts/follow.html', context)
 
 
@@ -0,0 +1,20 @@
+"""
+ASGI config for yatube project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+Any ASGI server can run it, for example::
+
+    uvicorn yatube.asgi:application
+
+Optional: the site is served through WSGI (yatube/wsgi.py) by default.
+With synchronous Django 2.2 views ASGI is not faster than WSGI, see
+core/asgi.py.
+"""
+
+import os
+
+from core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
+
+application = get_asgi_application()
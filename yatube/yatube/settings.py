@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/2.2/ref/settings/
 """
 
 import os
+import tempfile
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -36,10 +37,36 @@ ALLOWED_HOSTS = [
     'testserver',
 ]
 
+# L1 в памяти каждого процесса перед общим для всех воркеров кешем.
+# Запись L1 сверяется с общим кешем не чаще раза в SYNC_INTERVAL
+# секунд: столько соседний воркер может видеть прежнее значение ключа.
+# Файловый кеш здесь - локальная замена общего хранилища
+# (memcached, Redis), которое подключается сменой алиаса 'shared'.
+# Каждая запись двухуровневого кеша - два файла, значение и метка,
+# а ключи без срока (версия лент, эпоха меток, шарды авторов) не
+# должны вытесняться случайной чисткой, поэтому общий кеш намного
+# больше L1. Файловый кеш пересчитывает файлы каталога при каждой
+# записи, так что десятки тысяч файлов - его предел.
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    }
+        'BACKEND': 'core.cache.TwoTierCache',
+        'LOCATION': 'shared',
+        'OPTIONS': {
+            'MAX_ENTRIES': 1000,
+            'SYNC_INTERVAL': 1,
+        },
+    },
+    'shared': {
+        'BACKEND': 'core.cache.FileBasedCache',
+        'LOCATION': os.environ.get(
+            'YATUBE_CACHE_DIR',
+            os.path.join(tempfile.gettempdir(), 'yatube-cache')),
+        'OPTIONS': {
+            'MAX_ENTRIES': 50000,
+            # При заполнении удаляется десятая часть файлов, а не треть.
+            'CULL_FREQUENCY': 10,
+        },
+    },
 }
 
 # Application definition
@@ -59,6 +86,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.TimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -66,13 +94,15 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.middleware.QueryInspectorMiddleware',
+    'core.middleware.ReplicaMiddleware',
 ]
 
 ROOT_URLCONF = 'yatube.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'core.template_backends.TimedDjangoTemplates',
         'DIRS': [os.path.join(BASE_DIR, 'templates')],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -93,13 +123,33 @@ WSGI_APPLICATION = 'yatube.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
 
+# core.sqlite - sqlite3 в режиме WAL с повтором запросов при
+# блокировке; соединения живут CONN_MAX_AGE секунд и переиспользуются
+# потоком воркера между запросами.
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'core.sqlite',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'CONN_MAX_AGE': 60,
     }
 }
 
+# Алиасы реплик из DATABASES: на них идут чтения лент и страниц постов.
+# Реплика добавляется так же, как default, с NAME копии базы.
+DATABASE_ROUTERS = [
+    'posts.sharding.ShardRouter',
+    'core.routers.PrimaryReplicaRouter',
+]
+DATABASE_REPLICAS = []
+# Сколько секунд после своей записи клиент читает из основной базы.
+REPLICA_STICKY_SECONDS = 5
+# Алиасы баз, между которыми посты и комментарии делятся по автору,
+# например ['default', 'shard1']; пустой список - одна база.
+POST_SHARDS = []
+# Посты старше стольких дней без свежих комментариев команда
+# archive_posts переносит в архив.
+POST_ARCHIVE_DAYS = 365
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -146,5 +196,26 @@ LOGIN_REDIRECT_URL = 'posts:index'
 # LOGOUT_REDIRECT_URL = 'users:logout'
 
 
+# Загрузки пишутся на диск кусками с ограничением размера.
+FILE_UPLOAD_HANDLERS = ['posts.uploads.BoundedUploadHandler']
+
+# Миниатюры создаются в фоновом пуле потоков, а не в потоке запроса.
+THUMBNAIL_BACKEND = 'posts.thumbnails.QueuedThumbnailBackend'
+THUMBNAIL_WORKERS = 2
+
+# Потоки, в которых необязательное ASGI-приложение (yatube/asgi.py)
+# выполняет запросы; сайт по умолчанию работает через WSGI.
+ASGI_THREADS = 8
+# Потоки для независимых выборок одной страницы (core.concurrency);
+# при 0 выборки идут по очереди в потоке запроса. Пул окупается, только
+# когда база отвечает по сети: с одной локальной SQLite запрос короче
+# перехода в другой поток (run_benchmark: -20% запросов/с у профиля).
+# Поэтому по умолчанию пул выключен, для сетевой базы его включает,
+# например, YATUBE_ORM_WORKERS=4.
+ORM_WORKERS = int(os.environ.get('YATUBE_ORM_WORKERS', 0))
+
 EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
 EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
+
+# Адреса, которым доступен /metrics в формате Prometheus.
+METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
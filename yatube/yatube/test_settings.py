@@ -0,0 +1,36 @@
+"""Настройки для тестов.
+
+manage.py test и pytest подключают их сами; тестовые базы и пулы
+потоков не попадают в боевые настройки.
+"""
+import atexit
+import os
+import shutil
+import tempfile
+
+from .settings import *  # noqa: F401,F403
+from .settings import BASE_DIR, CACHES, DATABASES
+
+# Отдельная база SQLite в роли реплики для тестов маршрутизатора;
+# остальные тесты её не используют, пока DATABASE_REPLICAS пуст.
+DATABASES['replica'] = {
+    'ENGINE': 'core.sqlite',
+    'NAME': os.path.join(BASE_DIR, 'replica.sqlite3'),
+}
+# И второй шард для тестов шардирования.
+DATABASES['shard1'] = {
+    'ENGINE': 'core.sqlite',
+    'NAME': os.path.join(BASE_DIR, 'shard1.sqlite3'),
+}
+
+# Фоновые потоки пережили бы тестовую базу и временный MEDIA_ROOT,
+# а данные теста видит только соединение его потока. Тесты пулов
+# включают их через override_settings.
+THUMBNAIL_WORKERS = 0
+ORM_WORKERS = 0
+
+# Свой общий кеш на каждый запуск: cache.clear() в тестах не трогает
+# кеш dev-сервера, а прогоны не видят записей друг друга.
+CACHES['shared']['LOCATION'] = tempfile.mkdtemp(prefix='yatube-test-cache-')
+atexit.register(
+    shutil.rmtree, CACHES['shared']['LOCATION'], ignore_errors=True)